@@ -3,16 +3,34 @@ import os
 import random
 import json
 import datetime
+import time
+_startup_started = time.perf_counter()
+import re
+import math
+import queue
+import threading
+import subprocess
+import shutil
+import array
+import zlib
+import csv
+import sqlite3
+import platform
+import tempfile
+import uuid
+import atexit
+import logging
+import logging.handlers
 import PyQt5
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QComboBox, QLineEdit, QPushButton, 
                             QFileDialog, QGroupBox, QScrollArea, QCheckBox, QMessageBox,
                             QFrame, QRadioButton, QButtonGroup, QTextEdit, QSplitter,
-                            QStackedWidget, QToolTip, QMenu, QAction, QListWidget, 
-                            QAbstractItemView, QListWidgetItem, QProgressDialog)
-from PyQt5.QtCore import Qt, QSettings, QCoreApplication, QTranslator, QSize, QBuffer, QByteArray, QIODevice, QMimeData, QUrl, QEvent, QTimer
-from PyQt5.QtGui import QFont, QIcon, QPixmap, QImage, QCursor, QDragEnterEvent, QDropEvent
-import exiftool
+                            QStackedWidget, QToolTip, QMenu, QAction, QListView, 
+                            QAbstractItemView, QProgressDialog, QSpinBox, QDialog, QTableView, QHeaderView,
+                            QTableWidget, QTableWidgetItem, QInputDialog)
+from PyQt5.QtCore import QT_VERSION_STR, Qt, QSettings, QCoreApplication, QTranslator, QSize, QBuffer, QByteArray, QIODevice, QMimeData, QUrl, QEvent, QTimer, QAbstractListModel, QModelIndex, QAbstractTableModel, QSortFilterProxyModel
+from PyQt5.QtGui import QFont, QIcon, QPixmap, QImage, QImageWriter, QCursor, QDragEnterEvent, QDropEvent, QColor
 
 # 自定义的QComboBox子类，忽略未展开状态下的鼠标滚轮事件
 class CustomComboBox(QComboBox):
@@ -26,45 +44,3735 @@ class CustomComboBox(QComboBox):
         else:
             super().wheelEvent(event)
 
-# 导入PIL/Pillow库用于增强图片支持
-try:
-    from PIL import Image, ImageQt
-    HAS_PIL = True
-except ImportError:
-    HAS_PIL = False
-    print("警告: 未安装Pillow库，某些图片格式可能无法正常显示。建议安装: pip install Pillow")
+# PIL/Pillow库用于增强图片支持，只在Qt无法加载图片时才需要，首次使用时再导入以加快启动
+_pil_image_module = None
+
+def load_pil():
+    """返回PIL.Image模块，未安装Pillow时返回None"""
+    global _pil_image_module
+    if _pil_image_module is None:
+        try:
+            from PIL import Image
+            _pil_image_module = Image
+        except ImportError:
+            _pil_image_module = False
+            log_preview.warning("未安装Pillow库，某些图片格式可能无法正常显示。建议安装: pip install Pillow")
+    return _pil_image_module or None
 
 # 确保找到PyQt5平台插件
 dirname = os.path.dirname(PyQt5.__file__)
 plugin_path = os.path.join(dirname, 'Qt5', 'plugins', 'platforms')
 os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = plugin_path
 
-# 设置Python的默认编码为UTF-8
-import io
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+# 设置标准输出的编码为UTF-8（保留原有的缓冲方式；用pythonw启动时没有控制台）
+for _stream in (sys.stdout, sys.stderr):
+    if _stream is not None and hasattr(_stream, "reconfigure"):
+        _stream.reconfigure(encoding="utf-8")
+
+# 记录启动过程中各阶段的耗时
+class StartupTimer:
+    """记录启动各阶段完成的时间点，窗口第一次显示后输出报告，便于发现启动变慢"""
+
+    def __init__(self, started):
+        self.started = started
+        self.marks = []  # [(阶段名称, 完成时间)]
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter()))
+
+    def report(self):
+        """返回 {阶段名称: 耗时毫秒}，其中"总计"为从进程启动到最后一个阶段的耗时"""
+        stages = {}
+        previous = self.started
+        for name, timestamp in self.marks:
+            stages[name] = round((timestamp - previous) * 1000, 1)
+            previous = timestamp
+        stages["总计"] = round((previous - self.started) * 1000, 1)
+        return stages
+
+STARTUP_TIMER = StartupTimer(_startup_started)
+
+# 日志按子系统划分，记录通过队列交给后台线程写入控制台和文件，处理线程不会因为控制台输出变慢
+LOGGER_NAME = "ImageMetadataEditor"
+LOG_SUBSYSTEMS = ("app", "exiftool", "scan", "preview", "read", "write", "job", "settings")
+_log_listener = None
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f"{LOGGER_NAME}.{subsystem}")
+
+
+def setup_logging(level="INFO", subsystem_levels=None, log_file="", max_bytes=5 * 1024 * 1024, backup_count=3):
+    """配置日志；可重复调用，新配置替换旧配置
+
+    - level: 默认级别（DEBUG/INFO/WARNING/ERROR）
+    - subsystem_levels: 单独设置某些子系统的级别，如 {"preview": "DEBUG", "write": "WARNING"}
+    - log_file: 非空时同时写入该文件，超过max_bytes后轮换，保留backup_count个旧文件
+    """
+    global _log_listener
+    # 先停止旧的后台线程，把旧配置下排队的日志写完
+    _stop_logging()
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(_log_level(level, logging.INFO))
+    logger.propagate = False
+    for subsystem in LOG_SUBSYSTEMS:
+        get_logger(subsystem).setLevel(logging.NOTSET)
+    for subsystem, subsystem_level in (subsystem_levels or {}).items():
+        get_logger(subsystem).setLevel(_log_level(subsystem_level, logging.NOTSET))
+
+    formatter = logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s", "%H:%M:%S")
+    handlers = []
+    if sys.stderr is not None:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+    if log_file:
+        try:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            file_handler.setFormatter(logging.Formatter(
+                "%(asctime)s %(levelname)s [%(name)s] %(threadName)s: %(message)s"))
+            handlers.append(file_handler)
+        except OSError as e:
+            if sys.stderr is not None:
+                sys.stderr.write(f"无法打开日志文件 {log_file}: {e}\n")
+    if not handlers:
+        logger.addHandler(logging.NullHandler())
+        return
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
+def _log_level(name, default):
+    """把级别名称转换为数值，无法识别时返回default"""
+    level = logging.getLevelName(str(name).upper())
+    return level if isinstance(level, int) else default
+
+
+def parse_subsystem_levels(text):
+    """解析 "preview=DEBUG,write=WARNING" 形式的子系统级别设置"""
+    levels = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            subsystem, level = item.split("=", 1)
+            levels[subsystem.strip()] = level.strip().upper()
+    return levels
+
+
+@atexit.register
+def _stop_logging():
+    """把队列中剩余的日志写完并关闭日志文件"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+
+log_app = get_logger("app")
+log_exiftool = get_logger("exiftool")
+log_scan = get_logger("scan")
+log_preview = get_logger("preview")
+log_read = get_logger("read")
+log_write = get_logger("write")
+log_job = get_logger("job")
+log_settings = get_logger("settings")
+setup_logging()
+
+# 运行过程中各阶段耗时的统计
+class _StageTimer:
+    __slots__ = ("stats", "stage", "started")
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    """关闭统计时使用的空计时器，进入和退出都不做任何事"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class PerfStats:
+    """按阶段记录耗时直方图（对数刻度的桶），可导出为JSON
+
+    关闭时measure()返回共享的空计时器，timed()包装的函数直接调用原函数，不读取时钟也不分配对象。
+    """
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    STAGE_NAMES = {
+        "exiftool_read": "ExifTool读取",
+        "exiftool_write": "ExifTool写入",
+        "image_decode": "图片解码",
+        "image_scale": "图片缩放",
+        "metadata_generate": "元数据生成",
+        "model_update": "列表模型更新",
+        "dialog_format": "对话框格式化",
+    }
+    _NULL = _NullTimer()
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # {阶段: [次数, 总秒数, 最小秒数, 最大秒数, 各桶计数]}，最后一个桶记录超过最大刻度的耗时
+            self._stages = {}
+
+    def measure(self, stage):
+        """用法: with PERF.measure("image_decode"): ..."""
+        if not self.enabled:
+            return self._NULL
+        return _StageTimer(self, stage)
+
+    def timed(self, stage):
+        """装饰器，统计整个函数的耗时"""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - started)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def add(self, stage, seconds):
+        if not self.enabled:
+            return
+        elapsed_ms = seconds * 1000
+        index = len(self.BUCKETS_MS)
+        for i, upper in enumerate(self.BUCKETS_MS):
+            if elapsed_ms <= upper:
+                index = i
+                break
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = [0, 0.0, seconds, seconds, [0] * (len(self.BUCKETS_MS) + 1)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = min(entry[2], seconds)
+            entry[3] = max(entry[3], seconds)
+            entry[4][index] += 1
+
+    def _percentile(self, entry, fraction):
+        """由直方图估算分位数，返回所在桶的上界（不超过实际最大值）"""
+        count, _, _, max_seconds, buckets = entry
+        target = count * fraction
+        cumulative = 0
+        for i, bucket_count in enumerate(buckets):
+            cumulative += bucket_count
+            if cumulative >= target and bucket_count:
+                upper = self.BUCKETS_MS[i] if i < len(self.BUCKETS_MS) else max_seconds * 1000
+                return round(min(upper, max_seconds * 1000), 3)
+        return round(max_seconds * 1000, 3)
+
+    def snapshot(self):
+        """返回 {阶段: 统计信息}，耗时单位为毫秒"""
+        with self._lock:
+            stages = {stage: [entry[0], entry[1], entry[2], entry[3], list(entry[4])]
+                      for stage, entry in self._stages.items()}
+        report = {}
+        for stage, entry in stages.items():
+            count, total, min_seconds, max_seconds, buckets = entry
+            labels = [f"<={upper}" for upper in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}"]
+            report[stage] = {
+                "name": self.STAGE_NAMES.get(stage, stage),
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3),
+                "min_ms": round(min_seconds * 1000, 3),
+                "max_ms": round(max_seconds * 1000, 3),
+                "p50_ms": self._percentile(entry, 0.5),
+                "p90_ms": self._percentile(entry, 0.9),
+                "p99_ms": self._percentile(entry, 0.99),
+                "histogram_ms": {label: n for label, n in zip(labels, buckets) if n},
+            }
+        return report
+
+    def export(self, path):
+        """把当前统计写入JSON文件"""
+        data = {
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "buckets_ms": list(self.BUCKETS_MS),
+            "stages": self.snapshot(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+PERF = PerfStats()
+
+# 紧凑的列式文件表，文件列表的所有操作都基于它
+class FileTable:
+    """按列存储文件列表：每列是一个array/bytearray，目录前缀只保存一份
+
+    每个文件只占用文件名字符串加若干字节的定长字段，百万级文件也不会占用过多内存。
+    行号即文件在列表中的显示顺序。
+    """
+    STATUS_NONE, STATUS_SUCCESS, STATUS_FAILED, STATUS_SKIPPED, STATUS_QUARANTINED = range(5)
+    STATUS_CODES = {"success": STATUS_SUCCESS, "failed": STATUS_FAILED,
+                    "skipped": STATUS_SKIPPED, "quarantined": STATUS_QUARANTINED}
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._dirs = []               # 目录字符串，按编号存储
+        self._dir_ids = {}            # {目录: 编号}
+        self._rows = {}               # {目录编号: {文件名: 行号}}
+        self.dir_id = array.array("I")
+        self.name = []                # 文件名
+        self.size = array.array("q")  # 文件大小，-1表示尚未读取
+        self.mtime = array.array("q") # 修改时间（纳秒），-1表示尚未读取
+        self.checked = bytearray()
+        self.status = bytearray()
+
+    def __len__(self):
+        return len(self.name)
+
+    def path(self, row):
+        return os.path.join(self._dirs[self.dir_id[row]], self.name[row])
+
+    def paths(self, rows=None):
+        rows = range(len(self)) if rows is None else rows
+        return [self.path(row) for row in rows]
+
+    def row_of(self, path):
+        """返回文件所在行，不在列表中时返回-1"""
+        directory, name = os.path.split(path)
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            return -1
+        return self._rows[dir_id].get(name, -1)
+
+    def __contains__(self, path):
+        return self.row_of(path) >= 0
+
+    def add(self, path, size=-1, mtime_ns=-1, checked=True):
+        """添加一个文件，已存在时返回False"""
+        directory, name = os.path.split(path)
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(directory)
+            self._dir_ids[directory] = dir_id
+            self._rows[dir_id] = {}
+        rows = self._rows[dir_id]
+        if name in rows:
+            return False
+        rows[name] = len(self.name)
+        self.dir_id.append(dir_id)
+        self.name.append(name)
+        self.size.append(size)
+        self.mtime.append(mtime_ns)
+        self.checked.append(1 if checked else 0)
+        self.status.append(self.STATUS_NONE)
+        return True
+
+    def checked_count(self):
+        return self.checked.count(1)
+
+    def checked_rows(self):
+        return [row for row, flag in enumerate(self.checked) if flag]
+
+    def set_all_checked(self, checked):
+        self.checked[:] = (b"\x01" if checked else b"\x00") * len(self.checked)
+
+    def invert_checked(self):
+        self.checked[:] = self.checked.translate(bytes([1, 0]) + bytes(254))
+
+    def set_status(self, path, status):
+        row = self.row_of(path)
+        if row >= 0:
+            self.status[row] = self.STATUS_CODES.get(status, self.STATUS_NONE)
+
+    def forget_stat(self, path):
+        """文件被修改后，大小和修改时间需要重新读取"""
+        row = self.row_of(path)
+        if row >= 0:
+            self.size[row] = -1
+            self.mtime[row] = -1
+
+    def ensure_stat(self):
+        """补齐还没有读取的文件大小和修改时间（只对每个文件执行一次os.stat）"""
+        for row in range(len(self)):
+            if self.size[row] < 0:
+                try:
+                    stat = os.stat(self.path(row))
+                    self.size[row] = stat.st_size
+                    self.mtime[row] = stat.st_mtime_ns
+                except OSError:
+                    self.size[row] = 0
+                    self.mtime[row] = 0
+
+    def reorder(self, order):
+        """按给定的行号顺序重新排列所有列"""
+        self.dir_id = array.array("I", (self.dir_id[row] for row in order))
+        self.name = [self.name[row] for row in order]
+        self.size = array.array("q", (self.size[row] for row in order))
+        self.mtime = array.array("q", (self.mtime[row] for row in order))
+        self.checked = bytearray(self.checked[row] for row in order)
+        self.status = bytearray(self.status[row] for row in order)
+        for row in range(len(self.name)):
+            self._rows[self.dir_id[row]][self.name[row]] = row
+
+
+# 文件列表的数据模型，只在行显示时才从FileTable中读取数据
+class FileListModel(QAbstractListModel):
+    STATUS_COLORS = {
+        FileTable.STATUS_SUCCESS: QColor("#2e7d32"),
+        FileTable.STATUS_FAILED: QColor("#c62828"),
+        FileTable.STATUS_SKIPPED: QColor("#757575"),
+        FileTable.STATUS_QUARANTINED: QColor("#ef6c00"),
+    }
+
+    def __init__(self, table, parent=None):
+        super().__init__(parent)
+        self.table = table
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.table)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self.table.name[row]
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if self.table.checked[row] else Qt.Unchecked
+        if role in (Qt.ToolTipRole, Qt.UserRole):
+            return self.table.path(row)
+        if role == Qt.ForegroundRole:
+            return self.STATUS_COLORS.get(self.table.status[row])
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        self.table.checked[index.row()] = 1 if value == Qt.Checked else 0
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsUserCheckable
+
+    def rows_appended(self, first, last):
+        self.beginInsertRows(QModelIndex(), first, last)
+        self.endInsertRows()
+
+    def refresh(self):
+        """数据整体变化（排序、全选、清空等）后通知视图重新读取"""
+        self.beginResetModel()
+        self.endResetModel()
+
+# 批量预览和处理结果的表格模型，单元格只在显示或排序时才格式化
+class BatchTableModel(QAbstractTableModel):
+    """rows为 [(file_path, status, metadata)]，status为"pending"表示尚未应用（预览）"""
+    STATUS_TEXT = {"pending": "待应用", "success": "成功", "skipped": "已跳过（无变化）",
+                   "failed": "失败", "quarantined": "已隔离"}
+    FIELD_COLUMNS = [("Make", "品牌"), ("Model", "型号"), ("Software", "软件"), ("LensModel", "镜头型号"),
+                     ("DateTimeOriginal", "原始拍摄时间"), ("GPSLatitude", "GPS纬度"), ("GPSLongitude", "GPS经度"),
+                     ("Creator", "创作者"), ("Title", "标题")]
+
+    def __init__(self, rows, format_value=None, parent=None):
+        super().__init__(parent)
+        self.rows = list(rows)
+        self.format_value = format_value or (lambda key, value: value)
+        self.headers = ["文件", "状态"] + [title for _, title in self.FIELD_COLUMNS]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def raw_value(self, row, column):
+        return self.record_value(self.rows[row], column)
+
+    def display_value(self, row, column):
+        """单元格中显示的文本：状态转换为中文，字段值经过format_value格式化"""
+        value = self.raw_value(row, column)
+        if column == 1:
+            return self.STATUS_TEXT.get(value, value)
+        if column >= 2:
+            value = self.format_value(self.FIELD_COLUMNS[column - 2][0], value)
+        return "" if value is None else str(value)
+
+    def record_value(self, record, column):
+        file_path, status, metadata = record
+        if column == 0:
+            return os.path.basename(file_path)
+        if column == 1:
+            return status
+        key = self.FIELD_COLUMNS[column - 2][0]
+        return (metadata or {}).get(key, "")
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role == Qt.DisplayRole:
+            return self.display_value(row, column)
+        if role == Qt.ToolTipRole and column == 0:
+            return self.rows[row][0]
+        if role == Qt.ForegroundRole and column == 1:
+            return FileListModel.STATUS_COLORS.get(FileTable.STATUS_CODES.get(self.rows[row][1]))
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """直接对行列表排序，比通过代理模型逐个比较单元格快得多"""
+        if column < 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.rows.sort(key=lambda record: str(self.record_value(record, column)).lower(),
+                       reverse=order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
+
+class BatchFilterProxy(QSortFilterProxyModel):
+    """按处理状态和字段内容过滤；状态直接比较原始值，只有输入关键字时才格式化需要查找的单元格"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.status_filter = None  # None表示所有状态
+        self.text_filter = ""
+        self.text_column = -1      # -1表示在所有列中查找
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # 排序交给源模型，代理只负责过滤
+        self.sourceModel().sort(column, order)
+
+    def set_filters(self, status, text, column):
+        self.status_filter = status
+        self.text_filter = text.strip().lower()
+        self.text_column = column
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        if self.status_filter is not None and model.rows[source_row][1] != self.status_filter:
+            return False
+        if not self.text_filter:
+            return True
+        columns = range(model.columnCount()) if self.text_column < 0 else [self.text_column]
+        # 与表格中显示的文本比较，用户看到的是"成功"而不是"success"
+        return any(self.text_filter in model.display_value(source_row, column).lower() for column in columns)
+
+
+class BatchTableDialog(QDialog):
+    """批量预览和处理结果对话框：表格只绘制可见的行，选中一行时在下方显示该文件的详细信息"""
+
+    def __init__(self, title, summary, model, format_details, buttons, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(900, 650)
+        self.summary = summary
+        self.model = model
+        self.format_details = format_details
+        layout = QVBoxLayout(self)
+
+        summary_label = QLabel(summary)
+        summary_label.setWordWrap(True)
+        layout.addWidget(summary_label)
+
+        # 过滤条件：状态、字段和关键字
+        filter_layout = QHBoxLayout()
+        self.status_combo = QComboBox()
+        self.status_combo.addItem("全部状态", None)
+        order = list(BatchTableModel.STATUS_TEXT)
+        statuses = sorted({row[1] for row in model.rows}, key=lambda status: order.index(status) if status in order else len(order))
+        for status in statuses:
+            self.status_combo.addItem(BatchTableModel.STATUS_TEXT.get(status, status), status)
+        self.field_combo = QComboBox()
+        self.field_combo.addItem("所有字段", -1)
+        for column, header in enumerate(model.headers):
+            if column != 1:
+                self.field_combo.addItem(header, column)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("输入关键字过滤...")
+        self.count_label = QLabel("")
+        filter_layout.addWidget(QLabel("状态:"))
+        filter_layout.addWidget(self.status_combo)
+        filter_layout.addWidget(QLabel("字段:"))
+        filter_layout.addWidget(self.field_combo)
+        filter_layout.addWidget(self.search_edit, 1)
+        filter_layout.addWidget(self.count_label)
+        layout.addLayout(filter_layout)
+
+        self.proxy = BatchFilterProxy(self)
+        self.proxy.setSourceModel(model)
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)  # 初始保持原有顺序
+        self.table.setSortingEnabled(True)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # 固定行高和列宽，避免为计算尺寸而格式化所有行
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(22)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setDefaultSectionSize(120)
+        self.table.setColumnWidth(0, 200)
+        self.table.selectionModel().currentRowChanged.connect(self._show_details)
+
+        self.details = QTextEdit()
+        self.details.setReadOnly(True)
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.details)
+        splitter.setSizes([400, 200])
+        layout.addWidget(splitter, 1)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        for text, accept in buttons:
+            button = QPushButton(text)
+            button.clicked.connect(self.accept if accept else self.reject)
+            button_layout.addWidget(button)
+            if accept:
+                button.setDefault(True)
+        layout.addLayout(button_layout)
+
+        # 输入停止一小段时间后再过滤，避免每输入一个字符都遍历所有行
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self._apply_filters)
+        self.search_edit.textChanged.connect(lambda _: self.filter_timer.start())
+        self.status_combo.currentIndexChanged.connect(lambda _: self._apply_filters())
+        self.field_combo.currentIndexChanged.connect(lambda _: self._apply_filters())
+        self._update_count()
+
+    def _apply_filters(self):
+        self.proxy.set_filters(self.status_combo.currentData(), self.search_edit.text(),
+                               self.field_combo.currentData())
+        self._update_count()
+
+    def _update_count(self):
+        self.count_label.setText(f"显示 {self.proxy.rowCount()} / {self.model.rowCount()}")
+
+    def _show_details(self, current, previous):
+        if not current.isValid():
+            self.details.clear()
+            return
+        row = self.proxy.mapToSource(current).row()
+        self.details.setPlainText(self.format_details(*self.model.rows[row]))
+
+# 性能统计面板，显示PERF中各阶段的耗时分布
+class PerfPanel(QDialog):
+    COLUMNS = [("阶段", "name"), ("次数", "count"), ("总计(ms)", "total_ms"), ("平均(ms)", "mean_ms"),
+               ("P50(ms)", "p50_ms"), ("P90(ms)", "p90_ms"), ("P99(ms)", "p99_ms"), ("最大(ms)", "max_ms")]
+
+    def __init__(self, stats, settings, parent=None):
+        super().__init__(parent)
+        self.stats = stats
+        self.settings = settings
+        self.setWindowTitle("性能统计")
+        self.resize(760, 360)
+        layout = QVBoxLayout(self)
+
+        self.enabled_check = QCheckBox("启用耗时统计")
+        self.enabled_check.setChecked(stats.enabled)
+        self.enabled_check.setToolTip("关闭后不再读取时钟，对处理速度没有影响")
+        self.enabled_check.toggled.connect(self._set_enabled)
+        layout.addWidget(self.enabled_check)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels([title for title, _ in self.COLUMNS])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        reset_button = QPushButton("清零")
+        reset_button.clicked.connect(self._reset)
+        export_button = QPushButton("导出JSON...")
+        export_button.clicked.connect(self._export)
+        close_button = QPushButton("关闭")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(reset_button)
+        button_layout.addWidget(export_button)
+        button_layout.addStretch()
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+        # 面板打开期间每秒刷新一次
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        report = self.stats.snapshot()
+        self.table.setRowCount(len(report))
+        for row, stage in enumerate(sorted(report)):
+            info = report[stage]
+            for column, (_, key) in enumerate(self.COLUMNS):
+                item = QTableWidgetItem(str(info[key]))
+                if column == 0:
+                    # 悬停显示直方图
+                    item.setToolTip("\n".join(f"{label} ms: {count}" for label, count in info["histogram_ms"].items()))
+                self.table.setItem(row, column, item)
+
+    def _set_enabled(self, enabled):
+        self.stats.enabled = enabled
+        self.settings.setValue("perf_enabled", enabled)
+
+    def _reset(self):
+        self.stats.reset()
+        self.refresh()
+
+    def _export(self):
+        default_name = f"perf_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        path, _ = QFileDialog.getSaveFileName(self, "导出性能统计", default_name, "JSON文件 (*.json)")
+        if not path:
+            return
+        try:
+            self.stats.export(path)
+        except OSError as e:
+            QMessageBox.warning(self, "导出失败", f"无法写入文件:\n{e}")
+
+# 在后台线程中递归枚举文件夹里的图片
+class FolderScanner:
+    """用os.scandir递归遍历文件夹，按扩展名和文件头筛选图片，结果连同文件大小和修改时间分批放入队列
+
+    遍历在后台线程中进行，界面线程定时用take_batches()取回已找到的文件并加入列表，
+    不必等待整个文件夹遍历完成；cancel()可以随时停止遍历。
+    """
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.heic', '.webp', '.bmp')
+
+    def __init__(self, roots, batch_size=1000, batch_interval=0.2, check_magic=True):
+        self.roots = list(roots)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.check_magic = check_magic
+        self.found = 0      # 已找到的图片数
+        self.scanned = 0    # 已检查的目录项数
+        self.rejected = 0   # 扩展名匹配但文件头不是图片的文件数
+        self.done = False
+        self._cancel = threading.Event()
+        self._batches = queue.Queue()
+
+    @staticmethod
+    def looks_like_image(path):
+        """根据文件头判断文件是否确实是支持的图片格式"""
+        try:
+            with open(path, "rb") as f:
+                head = f.read(16)
+        except OSError:
+            return False
+        return (head.startswith(b"\xff\xd8\xff")                      # JPEG
+                or head.startswith(b"\x89PNG\r\n\x1a\n")               # PNG
+                or head[:4] in (b"II*\x00", b"MM\x00*")                  # TIFF
+                or head.startswith(b"BM")                               # BMP
+                or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")       # WebP
+                or head[4:8] == b"ftyp")                                # HEIC/HEIF
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def canceled(self):
+        return self._cancel.is_set()
+
+    def take_batches(self, max_files=None):
+        """取回已找到的文件 [(路径, 大小, 修改时间纳秒)]，max_files限制本次最多取回的数量（至少取回一批）"""
+        files = []
+        while max_files is None or len(files) < max_files:
+            try:
+                files.extend(self._batches.get_nowait())
+            except queue.Empty:
+                break
+        return files
+
+    def has_pending(self):
+        return not self._batches.empty()
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+        # 用栈代替递归，避免目录层级很深时超出递归深度
+        stack = list(reversed(self.roots))
+        try:
+            while stack and not self._cancel.is_set():
+                directory = stack.pop()
+                subdirectories = []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if self._cancel.is_set():
+                                return
+                            self.scanned += 1
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    subdirectories.append(entry.path)
+                                    continue
+                                if not entry.is_file():
+                                    continue
+                            except OSError:
+                                continue
+                            if not entry.name.lower().endswith(self.IMAGE_EXTENSIONS):
+                                continue
+                            if self.check_magic and not self.looks_like_image(entry.path):
+                                self.rejected += 1
+                                continue
+                            try:
+                                stat = entry.stat()
+                            except OSError:
+                                continue
+                            batch.append((os.path.normpath(entry.path), stat.st_size, stat.st_mtime_ns))
+                            self.found += 1
+                            if len(batch) >= self.batch_size or time.monotonic() - last_flush > self.batch_interval:
+                                self._batches.put(batch)
+                                batch = []
+                                last_flush = time.monotonic()
+                except OSError as e:
+                    log_scan.warning("无法读取文件夹: %s: %s", directory, e)
+                # 子目录按名称顺序处理
+                stack.extend(sorted(subdirectories, reverse=True))
+        finally:
+            if batch:
+                self._batches.put(batch)
+            self.done = True
+
+# 批处理任务日志，追加写入，用于程序崩溃或中断后恢复任务
+class BatchJournal:
+    """任务日志文件格式（每行一个JSON记录）:
+    {"type": "job", ...}      任务头，记录模式、创建时间和文件总数
+    {"type": "plan", ...}     每个文件计划写入的元数据
+    {"type": "done", ...}     每个文件的完成状态（success/failed/skipped/quarantined）
+    {"type": "finish", ...}   任务正常结束
+    """
+    def __init__(self, path, fsync_interval=50, fsync_seconds=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval  # 每累计多少条完成记录同步一次磁盘
+        self.fsync_seconds = fsync_seconds    # 或距上次同步超过多少秒
+        self.job_info = {}
+        self.plan = {}          # {file_path: metadata}，保持计划顺序
+        self.completed = set()  # 已成功完成的文件
+        self.finished = False
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    @staticmethod
+    def journal_dir():
+        """任务日志保存在程序目录下的jobs文件夹中"""
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(script_dir, "jobs")
+
+    @classmethod
+    def create(cls, mode_name, files_metadata, journal_dir=None):
+        """新建任务日志并写入全部计划，写完后立即同步到磁盘"""
+        journal_dir = journal_dir or cls.journal_dir()
+        os.makedirs(journal_dir, exist_ok=True)
+        job_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") + f"_{os.getpid()}"
+        journal = cls(os.path.join(journal_dir, f"job_{job_id}.jsonl"))
+        journal.job_info = {
+            "type": "job",
+            "job_id": job_id,
+            "mode": mode_name,
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total": len(files_metadata),
+        }
+        journal._file = open(journal.path, "a", encoding="utf-8")
+        journal._write(journal.job_info)
+        for file_path, metadata in files_metadata.items():
+            journal.plan[file_path] = metadata
+            journal._write({"type": "plan", "file": file_path, "metadata": metadata})
+        journal.flush(force=True)
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        """读取已有的任务日志，忽略崩溃时可能写了一半的最后一行"""
+        journal = cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                record_type = record.get("type")
+                if record_type == "job":
+                    journal.job_info = record
+                elif record_type == "plan":
+                    journal.plan[record["file"]] = record["metadata"]
+                elif record_type == "done":
+                    if record.get("status") in ("success", "skipped"):
+                        journal.completed.add(record["file"])
+                    else:
+                        journal.completed.discard(record["file"])
+                elif record_type == "finish":
+                    journal.finished = True
+        return journal
+
+    @classmethod
+    def find_unfinished(cls, journal_dir=None):
+        """返回所有未正常结束的任务日志，最新的排在前面"""
+        journal_dir = journal_dir or cls.journal_dir()
+        if not os.path.isdir(journal_dir):
+            return []
+        journals = []
+        for name in sorted(os.listdir(journal_dir), reverse=True):
+            if not (name.startswith("job_") and name.endswith(".jsonl")):
+                continue
+            try:
+                journal = cls.load(os.path.join(journal_dir, name))
+            except OSError as e:
+                log_job.warning("读取任务日志 %s 时出错: %s", name, e)
+                continue
+            if not journal.finished and journal.plan:
+                journals.append(journal)
+        return journals
+
+    def remaining(self):
+        """按计划顺序返回尚未成功完成的文件及其计划元数据"""
+        return {path: metadata for path, metadata in self.plan.items() if path not in self.completed}
+
+    def reopen(self):
+        """以追加方式重新打开日志，用于恢复任务"""
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            # 崩溃时最后一行可能只写了一半，先补一个换行避免与新记录粘连
+            if self._file.tell() > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        self._file.write("\n")
+
+    def mark_done(self, file_path, status):
+        """记录单个文件的处理结果，按批次同步到磁盘"""
+        self._write({"type": "done", "file": file_path, "status": status})
+        if status in ("success", "skipped"):
+            self.completed.add(file_path)
+        self._pending += 1
+        self.flush()
+
+    def flush(self, force=False):
+        """累计足够多的记录或超过时间间隔后执行fsync，避免逐个文件同步"""
+        if self._file is None:
+            return
+        now = time.monotonic()
+        if force or self._pending >= self.fsync_interval or now - self._last_sync >= self.fsync_seconds:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+            self._last_sync = now
+
+    def finish(self):
+        """标记任务正常完成并关闭日志"""
+        self._write({"type": "finish", "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        self.finished = True
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self.flush(force=True)
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+# 批处理结果的结构化记录，边处理边写入JSONL或CSV文件
+class ResultRecorder:
+    """每个文件一条记录，字段为FIELDS:
+    file           文件路径
+    status         success/failed/skipped/quarantined
+    error          失败或隔离时ExifTool的错误信息
+    tags           实际写入的标签 {标签: 值}
+    duration_ms    写入耗时，多个文件合并为一条命令时平分该命令的耗时
+    bytes_written  写入的字节数；ExifTool会重写整个文件，因此取处理时已知的文件大小，不再重新stat
+    """
+    FORMATS = ("jsonl", "csv")
+    FIELDS = ["file", "status", "error", "tags", "duration_ms", "bytes_written"]
+
+    def __init__(self, path, fmt="jsonl", flush_interval=100):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"不支持的结果记录格式: {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.flush_interval = flush_interval  # 每写入多少条记录刷新一次缓冲区
+        self.count = 0
+        # 以追加方式打开，恢复任务时结果接在原来的记录后面
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = None
+        if fmt == "csv":
+            self._writer = csv.DictWriter(self._file, fieldnames=self.FIELDS)
+            if self._file.tell() == 0:
+                self._writer.writeheader()
+
+    @classmethod
+    def create(cls, fmt, job_id=None, result_dir=None, flush_interval=100):
+        """在任务日志目录中新建结果文件，有任务编号时与任务日志同名以便对照"""
+        result_dir = result_dir or BatchJournal.journal_dir()
+        os.makedirs(result_dir, exist_ok=True)
+        job_id = job_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") + f"_{os.getpid()}"
+        return cls(os.path.join(result_dir, f"result_{job_id}.{fmt}"), fmt, flush_interval)
+
+    def write(self, file_path, status, tags=None, error="", duration=None, bytes_written=0):
+        record = {
+            "file": file_path,
+            "status": status,
+            "error": error or "",
+            "tags": tags or {},
+            "duration_ms": round(duration * 1000, 3) if duration is not None else None,
+            "bytes_written": bytes_written,
+        }
+        if self._writer is not None:
+            record["tags"] = json.dumps(record["tags"], ensure_ascii=False)
+            self._writer.writerow(record)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+        if self.count % self.flush_interval == 0:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+# 试运行生成的执行计划，保存每个文件最终要写入的标签和完整的ExifTool参数
+class BatchPlan:
+    """计划文件格式（每行一个JSON记录，计划头总在第一行）:
+    {"type": "header", ...}  模式、创建时间、ExifTool路径和公共参数、需要写入的文件数和字节数、预计耗时，
+                             所有文件的公共目录(root)、是否与文件当前值比较过(diffed)，
+                             以及生成随机值用的种子和参考时间(generation)，相同的输入和种子总是生成相同的计划
+    {"type": "file", ...}    文件路径、生成计划时的大小(size)和修改时间(mtime_ns)、计划的元数据(metadata)、
+                             需要写入的字段(changes)和提交给ExifTool的参数(args)
+
+    执行计划时不再生成随机值，也不再读取文件比较；只有文件在生成计划后被修改过时才重新比较。
+    计划可以在一台机器上生成、审阅，之后在其他机器上用 --apply-plan 流式执行（见PlanApplier）。
+    """
+    VERSION = 1
+
+    def __init__(self, header, entries, path=""):
+        self.header = header
+        self.entries = entries  # [{"type": "file", "file", "size", "mtime_ns", "metadata", "changes", "args"}]
+        self.path = path
+
+    @classmethod
+    def create(cls, mode_name, entries, exiftool="", common_args=None, cost_model=None, generation=None,
+               diffed=True):
+        try:
+            root = os.path.commonpath([os.path.dirname(entry["file"]) for entry in entries]) if entries else ""
+        except ValueError:
+            root = ""  # 文件位于不同的驱动器
+        plan_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") + f"_{os.getpid()}"
+        plan = cls({
+            "type": "header",
+            "version": cls.VERSION,
+            "plan_id": plan_id,
+            "mode": mode_name,
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "exiftool": exiftool,
+            "common_args": list(common_args or []),
+            "total": len(entries),
+            "root": root,
+            "diffed": diffed,
+            "generation": generation,
+        }, entries)
+        plan.header["write_files"], plan.header["write_bytes"] = plan.write_totals()
+        estimate = plan.estimate(cost_model) if cost_model is not None else None
+        plan.header["estimated_seconds"] = round(estimate, 3) if estimate is not None else None
+        plan.header["cost_model"] = cost_model.describe() if cost_model is not None else None
+        return plan
+
+    def write_totals(self):
+        """需要实际写入的文件数和字节数"""
+        write_entries = [entry for entry in self.entries if entry["changes"]]
+        return len(write_entries), sum(max(entry["size"], 0) for entry in write_entries)
+
+    def estimate(self, cost_model):
+        """按耗时模型估算执行计划需要的秒数，还没有样本时返回None"""
+        files, byte_count = self.write_totals()
+        return cost_model.estimate(files, byte_count)
+
+    def save(self, path=None):
+        """写入计划文件（先写临时文件再替换，不会留下写了一半的计划）"""
+        if path is None:
+            plan_dir = BatchJournal.journal_dir()
+            os.makedirs(plan_dir, exist_ok=True)
+            path = os.path.join(plan_dir, f"plan_{self.header['plan_id']}.jsonl")
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, path)
+        self.path = path
+        return path
+
+    @classmethod
+    def iter_records(cls, path):
+        """逐行读取计划文件，先返回计划头再依次返回每个文件的条目，不会把整个计划读入内存；
+        格式不对时抛出ValueError"""
+        header = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"第{line_number}行不是有效的JSON")
+                if header is None:
+                    if record.get("type") != "header":
+                        raise ValueError("缺少计划头，不是有效的执行计划文件")
+                    if record.get("version") != cls.VERSION:
+                        raise ValueError(f"不支持的计划版本: {record.get('version')}")
+                    header = record
+                    yield record
+                elif record.get("type") == "file":
+                    yield record
+        if header is None:
+            raise ValueError("缺少计划头，不是有效的执行计划文件")
+
+    @classmethod
+    def load(cls, path):
+        """读取整个计划文件，格式不对时抛出ValueError"""
+        records = cls.iter_records(path)
+        header = next(records)
+        return cls(header, list(records), path)
+
+    @staticmethod
+    def entry_is_current(entry, file_path=None):
+        """文件的大小和修改时间与生成计划时一致，计划中的写入字段仍然有效；
+        file_path为文件在本机的路径（计划被移到其他位置执行时与entry["file"]不同）"""
+        try:
+            stat = os.stat(file_path or entry["file"])
+        except OSError:
+            return False
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+# ExifTool后端：负责启动ExifTool进程，ExifToolStream只通过后端创建进程
+class SubprocessBackend:
+    """后端接口:
+    - available(executable): 该可执行文件能否使用
+    - spawn(args): 启动-stay_open进程，返回与subprocess.Popen用法相同的对象
+      （stdin可write/flush，stdout和stderr可按行迭代字节串，以及poll()、kill()、wait(timeout)）
+    - run(args, timeout): 执行一次性命令，返回 (退出码, stdout字节串, stderr字节串)
+    - spawn_async(args): 协程，启动-stay_open进程，返回与asyncio.subprocess.Process用法相同的对象
+      （stdin可write/drain，stdout和stderr可await readline()，以及returncode、kill()、await wait()）
+    默认后端直接运行真实的exiftool可执行文件。
+    """
+    name = "subprocess"
+
+    def available(self, executable):
+        return bool(executable) and os.path.exists(executable)
+
+    def spawn(self, args):
+        # Windows下不弹出控制台窗口
+        creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        return subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            creationflags=creationflags
+        )
+
+    def run(self, args, timeout=None):
+        creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        completed = subprocess.run(args, capture_output=True, timeout=timeout, creationflags=creationflags)
+        return completed.returncode, completed.stdout, completed.stderr
+
+    async def spawn_async(self, args):
+        import asyncio
+        creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        # -j的输出按行读取，提高单行长度上限以免长标签值导致读取失败
+        return await asyncio.create_subprocess_exec(
+            *args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            limit=16 * 1024 * 1024, creationflags=creationflags
+        )
+
+SUBPROCESS_BACKEND = SubprocessBackend()
+
+
+class _FakeStdin:
+    def __init__(self, process):
+        self._process = process
+        self._buffer = b""
+
+    def write(self, data):
+        if self._process.returncode is not None:
+            raise BrokenPipeError("ExifTool进程已退出")
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            self._process._lines.put(line.decode("utf-8").rstrip("\r"))
+
+    def flush(self):
+        pass
+
+
+class _FakeOutput:
+    """按行迭代的输出流，进程退出时结束"""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def put(self, text):
+        for line in text.splitlines():
+            self._queue.put((line + "\n").encode("utf-8"))
+
+    def close(self):
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            line = self._queue.get()
+            if line is None:
+                return
+            yield line
+
+
+class _FakeExifToolProcess:
+    """在后台线程中按-stay_open协议处理命令的进程替身"""
+
+    def __init__(self, backend, common_args):
+        self.backend = backend
+        self.common_args = common_args
+        self.returncode = None
+        self.stdin = _FakeStdin(self)
+        self.stdout = _FakeOutput()
+        self.stderr = _FakeOutput()
+        self._lines = queue.SimpleQueue()
+        self._killed = threading.Event()
+        self._exited = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        if self.backend.startup_delay and self._killed.wait(self.backend.startup_delay):
+            return
+        params = []
+        while not self._killed.is_set():
+            try:
+                line = self._lines.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if line == "-stay_open" and params == []:
+                continue
+            if line == "False" and params == []:
+                self._exit(0)
+                return
+            if not line.startswith("-execute"):
+                params.append(line)
+                continue
+            seq = line[len("-execute"):]
+            args = self.common_args + params
+            params = []
+            action, status, stdout, stderr = self.backend.execute(args)
+            delay = self.backend.command_latency(args)
+            if action == "hang":
+                # 一直卡住，直到被看门狗结束
+                self._killed.wait()
+                return
+            if delay and self._killed.wait(delay):
+                return
+            if action == "crash":
+                self._exit(3)
+                return
+            self.stdout.put(stdout + "\n{ready" + seq + "}" if stdout else "{ready" + seq + "}")
+            if stderr:
+                self.stderr.put(stderr)
+
+    def _exit(self, code):
+        if self.returncode is None:
+            self.returncode = code
+        self.stdout.close()
+        self.stderr.close()
+        self._exited.set()
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        self._killed.set()
+        self._exit(-9)
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired("fake-exiftool", timeout)
+        return self.returncode
+
+
+class _FakeAsyncReader:
+    """把_FakeOutput包装成可以await readline()的流，在线程池中等待下一行"""
+
+    def __init__(self, output):
+        self._lines = iter(output)
+
+    async def readline(self):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, next, self._lines, b"")
+
+
+class _FakeAsyncWriter:
+    def __init__(self, stdin):
+        self._stdin = stdin
+
+    def write(self, data):
+        self._stdin.write(data)
+
+    async def drain(self):
+        pass
+
+
+class _FakeAsyncProcess:
+    """_FakeExifToolProcess的asyncio接口"""
+
+    def __init__(self, process):
+        self._process = process
+        self.stdin = _FakeAsyncWriter(process.stdin)
+        self.stdout = _FakeAsyncReader(process.stdout)
+        self.stderr = _FakeAsyncReader(process.stderr)
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    def kill(self):
+        self._process.kill()
+
+    async def wait(self):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, self._process.wait)
+
+
+class FakeExifToolBackend:
+    """进程内的ExifTool替身，用于测试和基准测试，不需要安装exiftool
+
+    - metadata: {文件路径: {"组:标签": 值}}，读取时原样返回，写入时更新（只保存在内存中）
+    - commands: 收到的每条命令的参数列表，用于检查程序实际发出的命令
+    - latency: 每条命令的延迟秒数，也可以是接收参数列表、返回秒数的函数
+    - startup_delay: 进程启动耗时
+    - hang_patterns / crash_patterns / error_patterns: 参数中包含这些字符串时，
+      命令一直不返回、进程退出或返回错误，用于测试超时、重启和重试
+    """
+    name = "fake"
+    VERSION = "13.00"
+    WRITABLE_EXTENSIONS = ("JPG", "JPEG", "PNG", "TIF", "TIFF", "WEBP", "HEIC", "DNG")
+    TAG_GROUPS = {"GPS": "GPS", "Creator": "XMP", "Description": "XMP", "Title": "XMP",
+                  "Location": "XMP", "Keywords": "IPTC"}
+
+    def __init__(self, metadata=None, latency=0.0, startup_delay=0.0,
+                 hang_patterns=(), crash_patterns=(), error_patterns=()):
+        self.metadata = metadata if metadata is not None else {}
+        self.latency = latency
+        self.startup_delay = startup_delay
+        self.hang_patterns = list(hang_patterns)
+        self.crash_patterns = list(crash_patterns)
+        self.error_patterns = list(error_patterns)
+        self.commands = []
+        self.spawned = 0
+        self._lock = threading.Lock()
+
+    def available(self, executable):
+        return True
+
+    def spawn(self, args):
+        common_args = args[args.index("-common_args") + 1:] if "-common_args" in args else []
+        with self._lock:
+            self.spawned += 1
+        return _FakeExifToolProcess(self, common_args)
+
+    async def spawn_async(self, args):
+        return _FakeAsyncProcess(self.spawn(args))
+
+    def run(self, args, timeout=None):
+        action, status, stdout, stderr = self.execute(list(args[1:]))
+        if action in ("hang", "crash"):
+            raise subprocess.TimeoutExpired(args, timeout) if action == "hang" else OSError("ExifTool进程意外退出")
+        return status, stdout.encode("utf-8"), stderr.encode("utf-8")
+
+    def command_latency(self, args):
+        return self.latency(args) if callable(self.latency) else self.latency
+
+    def tag_key(self, tag):
+        group = "GPS" if tag.startswith("GPS") else self.TAG_GROUPS.get(tag, "EXIF")
+        return f"{group}:{tag}"
+
+    def execute(self, args):
+        """执行一条命令，返回 (动作, 状态, stdout, stderr)，动作为ok、hang或crash"""
+        files, writes, echoes = [], {}, []
+        json_mode = version = list_writable = False
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg in ("-echo4", "-charset", "-api"):
+                if arg == "-echo4" and i + 1 < len(args):
+                    echoes.append(args[i + 1])
+                i += 2
+                continue
+            if arg == "-ver":
+                version = True
+            elif arg == "-listwf":
+                list_writable = True
+            elif arg == "-j":
+                json_mode = True
+            elif arg.startswith("-") and "=" in arg:
+                tag, value = arg[1:].split("=", 1)
+                writes[tag] = value
+            elif not arg.startswith("-"):
+                files.append(arg)
+            i += 1
+
+        with self._lock:
+            self.commands.append(list(args))
+        command_text = "\n".join(args)
+        for action, patterns in (("hang", self.hang_patterns), ("crash", self.crash_patterns)):
+            if any(pattern in command_text for pattern in patterns):
+                return action, None, "", ""
+
+        status, stdout, errors = 0, [], []
+        if any(pattern in command_text for pattern in self.error_patterns):
+            status = 1
+            errors.append("Error: 模拟的ExifTool错误")
+        elif version:
+            stdout.append(self.VERSION)
+        elif list_writable:
+            stdout.append("Writable file extensions:")
+            stdout.append("  " + " ".join(self.WRITABLE_EXTENSIONS))
+        else:
+            results, updated = [], 0
+            with self._lock:
+                for file_path in files:
+                    if file_path not in self.metadata and not os.path.exists(file_path):
+                        status = 1
+                        errors.append(f"Error: File not found - {file_path}")
+                        continue
+                    tags = self.metadata.setdefault(file_path, {})
+                    if writes:
+                        for tag, value in writes.items():
+                            if value == "":
+                                tags.pop(self.tag_key(tag), None)
+                            else:
+                                tags[self.tag_key(tag)] = value
+                        updated += 1
+                    elif json_mode:
+                        results.append(dict({"SourceFile": file_path, "File:FileName": os.path.basename(file_path)}, **tags))
+            if writes:
+                stdout.append(f"    {updated} image files updated")
+            elif json_mode:
+                stdout.append(json.dumps(results, ensure_ascii=False))
+        stderr = errors + [echo.replace("${status}", str(status)) for echo in echoes]
+        return "ok", status, "\n".join(stdout), "\n".join(stderr)
+
+# 流水线方式驱动单个-stay_open ExifTool进程
+class ExifToolStream:
+    """通过管道向ExifTool持续写入以-execute分隔的参数块，结果由后台线程逐条读回
+
+    与每个文件调用一次et.execute()不同，写入下一个文件的参数时不必等待上一个文件完成，
+    进程间通信的开销被流水线化；同时最多只有max_pending条命令在途，内存占用有上限。
+
+    内置看门狗：正在执行的命令超过call_timeout秒没有返回，或者进程意外退出时，
+    结束并重启进程，其余在途命令重新提交；导致问题的命令按指数退避重试max_retries次，
+    仍然失败时以STATUS_TIMEOUT或STATUS_CRASHED状态返回，由调用方隔离该文件。
+    """
+    STATUS_TIMEOUT = -1   # 命令执行超时
+    STATUS_CRASHED = -2   # ExifTool进程在执行该命令时退出
+
+    # 每条命令都带上的公共参数：输出带分组名的标签，文件名按UTF-8传递
+    DEFAULT_COMMON_ARGS = ("-G", "-charset", "filename=utf8")
+
+    # 这些错误通常是暂时性的（文件被其他程序占用等），值得重试
+    TRANSIENT_ERRORS = ("temporary file", "permission denied", "being used by another process", "locked")
+
+    def __init__(self, executable, common_args=None, max_pending=32, call_timeout=30.0,
+                 max_retries=2, retry_backoff=0.5, backend=None):
+        self.executable = executable
+        self.backend = backend or SUBPROCESS_BACKEND
+        self.common_args = common_args if common_args is not None else list(self.DEFAULT_COMMON_ARGS)
+        self.max_pending = max_pending
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.restarts = 0
+        self._process = None
+        self._seq = 0
+        self._pending = {}  # {seq: {"tag", "params", "attempts", "submitted"}}，已提交但未返回结果的命令
+        self._partial = {}  # {seq: {"stdout": ..., "stderr": ..., "status": ...}}，只收到一半输出的命令
+        self._retries = []  # [(ready_time, params, tag, attempts)]，等待退避后重新提交的命令
+        self._last_completion = time.monotonic()
+        self._lock = threading.Lock()
+        self._results = queue.Queue()
+
+    def start(self):
+        args = [self.executable, "-stay_open", "True", "-@", "-"]
+        if self.common_args:
+            args += ["-common_args"] + list(self.common_args)
+        process = self.backend.spawn(args)
+        self._process = process
+        self._last_completion = time.monotonic()
+        threading.Thread(target=self._read_stdout, args=(process,), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(process,), daemon=True).start()
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def pending_count(self):
+        """已提交但调用方还没有通过get_result取回结果的命令数"""
+        return len(self._pending) + len(self._retries) + self._results.qsize()
+
+    def can_submit(self):
+        return self.pending_count < self.max_pending
+
+    def submit(self, params, tag=None, attempts=0):
+        """提交一条命令，params为参数列表，tag会随结果一起返回，用于识别是哪个文件"""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            process = self._process
+            if process is not None:
+                self._pending[seq] = {"tag": tag, "params": params, "attempts": attempts, "submitted": time.monotonic()}
+        if process is None:
+            # 进程没有启动或已经关闭，看门狗不会处理这条命令，直接以失败返回
+            self._results.put((tag, self.STATUS_CRASHED, "", "ExifTool进程没有运行", None))
+            return seq
+        # 参数文件中每行一个参数，值中的换行符需要替换掉
+        lines = [str(p).replace("\r", " ").replace("\n", " ") for p in params]
+        lines += ["-echo4", f"=${{status}}=post{seq}", f"-execute{seq}"]
+        try:
+            process.stdin.write(("\n".join(lines) + "\n").encode("utf-8"))
+            process.stdin.flush()
+        except (OSError, ValueError):
+            # 进程已经退出，由看门狗在get_result中处理
+            pass
+        return seq
+
+    def execute(self, params, timeout=None):
+        """同步执行一条命令（带看门狗），返回 (status, stdout, stderr)"""
+        self.submit(params)
+        while True:
+            result = self.get_result(timeout=timeout if timeout is not None else self.call_timeout * (self.max_retries + 2))
+            if result is None:
+                return self.STATUS_TIMEOUT, "", "等待ExifTool结果超时"
+            _, status, stdout, stderr = result
+            return status, stdout, stderr
+
+    def get_result(self, timeout=None):
+        """取回下一条已完成的结果 (tag, status, stdout, stderr)，超时返回None
+
+        等待期间检查进程状态和当前命令的执行时间，必要时重启进程并重试。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._check_health()
+            self._submit_due_retries()
+            wait = 0.05
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.monotonic()))
+            try:
+                result = self._results.get(timeout=wait)
+            except queue.Empty:
+                result = None
+            if result is not None:
+                result = self._maybe_retry(result)
+                if result is not None:
+                    return result
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.write(b"-stay_open\nFalse\n")
+            self._process.stdin.flush()
+            self._process.wait(timeout=5)
+        except Exception:
+            self._process.kill()
+        self._process = None
+
+    def reset(self):
+        """丢弃所有在途命令和未取回的结果，重启进程，使其可以交给下一个使用者"""
+        with self._lock:
+            self._pending = {}
+            self._partial = {}
+        self._retries = []
+        self._results = queue.Queue()
+        self._kill()
+        self.restarts += 1
+        self.start()
+
+    def _kill(self):
+        if self._process is not None:
+            try:
+                self._process.kill()
+                self._process.wait(timeout=5)
+            except Exception:
+                pass
+            self._process = None
+
+    def _check_health(self):
+        """看门狗：检测卡住的命令和已经退出的进程"""
+        if self._process is None:
+            return
+        with self._lock:
+            if not self._pending:
+                return
+            oldest_seq = min(self._pending)
+            oldest = self._pending[oldest_seq]
+            # ExifTool按顺序执行命令，最早的在途命令从它提交或上一条命令完成时开始执行
+            running_since = max(oldest["submitted"], self._last_completion)
+        if not self.is_alive():
+            self._recover(oldest_seq, self.STATUS_CRASHED, "ExifTool进程意外退出")
+        elif time.monotonic() - running_since > self.call_timeout:
+            self._recover(oldest_seq, self.STATUS_TIMEOUT, f"ExifTool处理超过{self.call_timeout:g}秒未响应")
+
+    def _recover(self, suspect_seq, status, message):
+        """结束并重启ExifTool进程，重新提交在途命令；导致问题的命令退避后重试或直接返回失败"""
+        log_exiftool.warning("%s，正在重启ExifTool进程", message)
+        with self._lock:
+            pending = sorted(self._pending.items())
+            self._pending = {}
+            self._partial = {}
+        self._kill()
+        self.restarts += 1
+        self.start()
+
+        for seq, entry in pending:
+            if seq == suspect_seq:
+                if entry["attempts"] < self.max_retries:
+                    delay = self.retry_backoff * (2 ** entry["attempts"])
+                    self._retries.append((time.monotonic() + delay, entry["params"], entry["tag"], entry["attempts"] + 1))
+                else:
+                    self._results.put((entry["tag"], status, "", message, None))
+            else:
+                # 其他命令还没有执行，按原顺序重新提交，不计入重试次数
+                self.submit(entry["params"], entry["tag"], entry["attempts"])
+
+    def _submit_due_retries(self):
+        if not self._retries:
+            return
+        now = time.monotonic()
+        due = [entry for entry in self._retries if entry[0] <= now]
+        if not due:
+            return
+        self._retries = [entry for entry in self._retries if entry[0] > now]
+        for _, params, tag, attempts in due:
+            self.submit(params, tag, attempts)
+
+    def _maybe_retry(self, result):
+        """暂时性错误在重试次数内重新提交，返回None；否则原样返回结果"""
+        tag, status, stdout, stderr, entry = result
+        if (status > 0 and entry is not None and entry["attempts"] < self.max_retries
+                and any(pattern in stderr.lower() for pattern in self.TRANSIENT_ERRORS)):
+            delay = self.retry_backoff * (2 ** entry["attempts"])
+            self._retries.append((time.monotonic() + delay, entry["params"], tag, entry["attempts"] + 1))
+            return None
+        return tag, status, stdout, stderr
+
+    def _read_stdout(self, process):
+        buffer = []
+        for raw_line in process.stdout:
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            match = re.match(r"^\{ready(\d+)\}$", line)
+            if match:
+                self._deliver(process, int(match.group(1)), "stdout", "\n".join(buffer))
+                buffer = []
+            else:
+                buffer.append(line)
+
+    def _read_stderr(self, process):
+        buffer = []
+        for raw_line in process.stderr:
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            match = re.match(r"^=(\d+)=post(\d+)$", line)
+            if match:
+                self._deliver(process, int(match.group(2)), "stderr", "\n".join(buffer), int(match.group(1)))
+                buffer = []
+            else:
+                buffer.append(line)
+
+    def _deliver(self, process, seq, stream_name, text, status=None):
+        # stdout和stderr分别由两个线程读取，两部分都到齐后才算命令完成
+        with self._lock:
+            # 忽略已被重启的旧进程的输出
+            if process is not self._process or seq not in self._pending:
+                return
+            partial = self._partial.setdefault(seq, {})
+            partial[stream_name] = text
+            if status is not None:
+                partial["status"] = status
+            if "stdout" not in partial or "stderr" not in partial:
+                return
+            del self._partial[seq]
+            entry = self._pending.pop(seq)
+            self._last_completion = time.monotonic()
+        self._results.put((entry["tag"], partial.get("status", 0), partial["stdout"], partial["stderr"], entry))
+
+# 查找ExifTool可执行文件
+class ExifToolLocator:
+    """先检查PATH和已知位置，找不到时才按有限的深度和时间搜索目录"""
+    EXECUTABLE_NAMES = ("exiftool.exe", "exiftool(-k).exe", "exiftool.pl", "exiftool")
+    # 搜索时跳过的目录，这些目录通常很大且不会包含ExifTool
+    SKIP_DIRECTORIES = {"node_modules", "$recycle.bin", "appdata", "system volume information", "__pycache__"}
+
+    @classmethod
+    def find_quick(cls, known_paths):
+        """在PATH和给定的已知路径中查找，只检查文件是否存在"""
+        for name in cls.EXECUTABLE_NAMES:
+            path = shutil.which(name)
+            if path:
+                return path
+        for path in known_paths:
+            if path and os.path.isfile(path):
+                return path
+        return None
+
+    @classmethod
+    def deep_search(cls, directories, max_depth=4, time_limit=10.0):
+        """按层遍历目录查找ExifTool，超过max_depth层或time_limit秒后停止"""
+        deadline = time.monotonic() + time_limit
+        names = {name.lower() for name in cls.EXECUTABLE_NAMES}
+        level = [d for d in dict.fromkeys(directories) if d and os.path.isdir(d)]
+        for depth in range(max_depth + 1):
+            next_level = []
+            for directory in level:
+                if time.monotonic() > deadline:
+                    log_exiftool.info("搜索ExifTool超过%g秒，已停止", time_limit)
+                    return None
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_file() and entry.name.lower() in names:
+                                    return entry.path
+                                if (entry.is_dir(follow_symlinks=False) and not entry.name.startswith(".")
+                                        and entry.name.lower() not in cls.SKIP_DIRECTORIES):
+                                    next_level.append(entry.path)
+                            except OSError:
+                                continue
+                except OSError:
+                    continue
+            level = next_level
+        return None
+
+    @staticmethod
+    def signature(path):
+        """可执行文件的大小和修改时间，用于判断缓存的版本信息是否仍然有效"""
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return ""
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    @staticmethod
+    def probe(path, timeout=30.0, backend=None):
+        """运行ExifTool获取版本号和支持写入的文件类型，失败时返回None"""
+        backend = backend or SUBPROCESS_BACKEND
+        try:
+            version = backend.run([path, "-ver"], timeout)[1].decode("utf-8", errors="replace").strip()
+            listing = backend.run([path, "-listwf"], timeout)[1].decode("utf-8", errors="replace")
+        except (OSError, subprocess.SubprocessError) as e:
+            log_exiftool.warning("检测ExifTool版本失败: %s", e)
+            return None
+        # -listwf输出的第一行是说明文字，其余为以空格分隔的扩展名
+        lines = listing.splitlines()
+        extensions = sorted({ext.lower() for line in lines[1:] for ext in line.split()})
+        return {"version": version, "writable_extensions": extensions}
+
+# 程序启动时预先创建并预热的ExifTool进程池
+class ExifToolPool:
+    """预先启动size个ExifToolStream进程，读取和写入从池中借用已经就绪的进程
+
+    Perl解释器启动和ExifTool模块编译需要较长时间，进程在后台线程中启动并执行一条
+    预热命令，界面不必等待；之后的每次读写都直接使用已预热的进程。
+    进程归还时如果已经退出或仍有未完成的命令，会被重启后再放回池中。
+    """
+
+    def __init__(self, executable, size=2, call_timeout=30.0, backend=None):
+        self.executable = executable
+        self.backend = backend
+        self.size = max(1, size)
+        self.call_timeout = call_timeout
+        self.error = None      # 启动进程失败时的异常
+        self._streams = []     # 所有已启动的进程
+        self._idle = []        # 空闲可借用的进程
+        self._defaults = {}    # 进程 -> 创建时的(max_retries, max_pending)，归还时恢复
+        self._warming = 0      # 正在后台启动的进程数
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def start(self):
+        """在后台线程中启动并预热所有进程，立即返回"""
+        with self._cond:
+            self._warming = self.size
+        for _ in range(self.size):
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    def _spawn(self):
+        stream = ExifToolStream(self.executable, call_timeout=self.call_timeout, backend=self.backend)
+        try:
+            started = time.monotonic()
+            stream.start()
+            # 执行一条简单命令，让ExifTool完成启动和模块加载
+            status, stdout, stderr = stream.execute(["-ver"])
+            if status != 0:
+                raise OSError(stderr.strip() or f"ExifTool预热失败 (状态 {status})")
+            log_exiftool.info("ExifTool进程已就绪 (版本 %s, 耗时 %.2f秒)", stdout.strip(), time.monotonic() - started)
+        except Exception as e:
+            log_exiftool.error("启动ExifTool进程失败: %s", e)
+            stream.close()
+            with self._cond:
+                self._warming -= 1
+                self.error = e
+                self._cond.notify_all()
+            return
+        with self._cond:
+            self._warming -= 1
+            if self._closed:
+                stream.close()
+                return
+            self._streams.append(stream)
+            self._defaults[stream] = (stream.max_retries, stream.max_pending)
+            self._idle.append(stream)
+            self._cond.notify_all()
+
+    def acquire(self, timeout=None, max_retries=None, max_pending=None, call_timeout=None):
+        """借用一个空闲进程，用完后必须调用release归还
+
+        所有进程都在使用中时等待；没有任何进程能够启动时抛出OSError。
+        max_retries、max_pending和call_timeout只对本次借用有效，归还时恢复默认值。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._idle:
+                if self._closed:
+                    raise OSError("ExifTool进程池已关闭")
+                if not self._streams and self._warming == 0:
+                    raise OSError(f"没有可用的ExifTool进程: {self.error}")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise OSError("等待空闲的ExifTool进程超时")
+                self._cond.wait(remaining)
+            stream = self._idle.pop()
+        if not stream.is_alive():
+            self._restart(stream)
+        stream.call_timeout = call_timeout if call_timeout is not None else self.call_timeout
+        if max_retries is not None:
+            stream.max_retries = max_retries
+        if max_pending is not None:
+            stream.max_pending = max_pending
+        return stream
+
+    def release(self, stream):
+        """归还借用的进程"""
+        stream.max_retries, stream.max_pending = self._defaults[stream]
+        if not stream.is_alive() or stream.pending_count > 0:
+            self._restart(stream)
+        with self._cond:
+            if self._closed:
+                stream.close()
+                return
+            self._idle.append(stream)
+            self._cond.notify_all()
+
+    def _restart(self, stream):
+        try:
+            stream.reset()
+        except OSError as e:
+            log_exiftool.error("重启ExifTool进程失败: %s", e)
+
+    def health(self):
+        """返回进程池状态: 进程总数、存活数、忙碌数、累计重启次数、是否仍在预热"""
+        with self._cond:
+            streams = list(self._streams)
+            busy = len(streams) - len(self._idle)
+            warming = self._warming
+        return {
+            "size": self.size,
+            "alive": sum(1 for stream in streams if stream.is_alive()),
+            "busy": busy,
+            "restarts": sum(stream.restarts for stream in streams),
+            "warming": warming,
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            streams = list(self._streams)
+            self._streams = []
+            self._idle = []
+            self._cond.notify_all()
+        for stream in streams:
+            stream.close()
+
+class _AsyncExifToolProcess:
+    """用非阻塞管道驱动单个-stay_open进程，协议与ExifToolStream相同，所有方法都在事件循环中调用"""
+
+    def __init__(self, executable, backend, common_args):
+        self.executable = executable
+        self.backend = backend
+        self.common_args = common_args
+        self.process = None
+        self.restarts = 0
+        self._seq = 0
+        self._pending = {}  # {seq: future}
+        self._partial = {}  # {seq: {"stdout": ..., "stderr": ..., "status": ...}}
+        self._readers = set()
+        self._reaping = set()
+        self._last_completion = 0.0
+        self._lock = None
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    async def _ensure_process(self):
+        import asyncio
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.process is None or self.process.returncode is not None:
+                if self.process is not None:
+                    self.restarts += 1
+                args = [self.executable, "-stay_open", "True", "-@", "-", "-common_args", *self.common_args]
+                process = await self.backend.spawn_async(args)
+                self.process = process
+                self._last_completion = time.monotonic()
+                for stream, stream_name in ((process.stdout, "stdout"), (process.stderr, "stderr")):
+                    self._track(self._readers, asyncio.ensure_future(self._read(process, stream, stream_name)))
+                log_exiftool.debug("已启动异步ExifTool进程")
+            return self.process
+
+    @staticmethod
+    def _track(tasks, task):
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _read(self, process, stream, stream_name):
+        pattern = re.compile(r"^\{ready(\d+)\}$" if stream_name == "stdout" else r"^=(\d+)=post(\d+)$")
+        buffer = []
+        while True:
+            raw_line = await stream.readline()
+            if not raw_line:
+                break
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            match = pattern.match(line)
+            if not match:
+                buffer.append(line)
+            elif stream_name == "stdout":
+                self._deliver(process, int(match.group(1)), "stdout", "\n".join(buffer))
+                buffer = []
+            else:
+                self._deliver(process, int(match.group(2)), "stderr", "\n".join(buffer), int(match.group(1)))
+                buffer = []
+        # 输出结束说明进程已经退出，未完成的命令都失败
+        if process is self.process:
+            log_exiftool.warning("异步ExifTool进程意外退出")
+            self._fail_pending("ExifTool进程意外退出")
+
+    def _deliver(self, process, seq, stream_name, text, status=None):
+        # 忽略已被重启的旧进程的输出，以及调用方已经放弃的命令
+        if process is not self.process or seq not in self._pending:
+            return
+        partial = self._partial.setdefault(seq, {})
+        partial[stream_name] = text
+        if status is not None:
+            partial["status"] = status
+        if "stdout" not in partial or "stderr" not in partial:
+            return
+        del self._partial[seq]
+        future = self._pending.pop(seq)
+        self._last_completion = time.monotonic()
+        if not future.done():
+            future.set_result((partial.get("status", 0), partial["stdout"], partial["stderr"]))
+
+    def _fail_pending(self, message):
+        pending, self._pending, self._partial = self._pending, {}, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_result((ExifToolStream.STATUS_CRASHED, "", message))
+
+    def _kill(self, process):
+        import asyncio
+        try:
+            process.kill()
+        except (OSError, ProcessLookupError):
+            pass
+        self._track(self._reaping, asyncio.ensure_future(process.wait()))
+
+    async def execute(self, params, timeout):
+        """执行一条命令，返回 (status, stdout, stderr)；超时的命令会导致进程重启"""
+        import asyncio
+        process = await self._ensure_process()
+        self._seq += 1
+        seq = self._seq
+        future = asyncio.get_running_loop().create_future()
+        self._pending[seq] = future
+        lines = [str(p).replace("\r", " ").replace("\n", " ") for p in params]
+        lines += ["-echo4", f"=${{status}}=post{seq}", f"-execute{seq}"]
+        try:
+            process.stdin.write(("\n".join(lines) + "\n").encode("utf-8"))
+            await process.stdin.drain()
+        except (OSError, ValueError):
+            # 进程已经退出，读取协程会让命令失败
+            pass
+        submitted = time.monotonic()
+        try:
+            while not future.done():
+                # 命令在进程中依次执行，只有最早的命令从轮到它起超时才算卡住，排在后面的命令继续等待
+                if seq == min(self._pending):
+                    remaining = max(self._last_completion, submitted) + timeout - time.monotonic()
+                else:
+                    remaining = timeout
+                if remaining <= 0 and process is self.process:
+                    log_exiftool.warning("ExifTool命令超过%g秒未完成，重启进程", timeout)
+                    self._pending.pop(seq, None)
+                    self.process = None
+                    self.restarts += 1
+                    self._fail_pending("ExifTool进程因其他命令超时而重启")
+                    self._kill(process)
+                    return ExifToolStream.STATUS_TIMEOUT, "", f"ExifTool命令超过{timeout:g}秒未完成"
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    continue
+            return future.result()
+        finally:
+            # 调用方取消时命令可能已经发出，之后到达的输出直接丢弃
+            self._pending.pop(seq, None)
+            self._partial.pop(seq, None)
+
+    async def close(self):
+        import asyncio
+        process, self.process = self.process, None
+        self._fail_pending("ExifTool进程已关闭")
+        if process is not None and process.returncode is None:
+            try:
+                process.stdin.write(b"-stay_open\nFalse\n")
+                await process.stdin.drain()
+                await asyncio.wait_for(process.wait(), 5)
+            except (OSError, ValueError, asyncio.TimeoutError):
+                self._kill(process)
+        for task in self._readers:
+            task.cancel()
+        await asyncio.gather(*self._readers, *self._reaping, return_exceptions=True)
+
+
+# asyncio接口：在事件循环中读写元数据，不阻塞循环，也不需要为每次调用开线程
+class AsyncExifTool:
+    """基于asyncio的元数据读写引擎，用法:
+
+        async with AsyncExifTool(exiftool_path, processes=2, concurrency=16) as engine:
+            metadata = await engine.read_many(paths)           # {路径: 元数据}
+            results = await engine.apply_many(plan)            # ResultRecorder格式的记录列表
+            async for file_path, metadata in engine.iter_read(paths):
+                ...
+
+    plan可以是 {路径: 元数据} 字典、(路径, 元数据) 序列、计划文件路径或计划文件中的文件条目。
+    processes个ExifTool进程，命令在各进程中流水线执行；concurrency限制同时在途的命令总数，
+    iter_*按完成顺序逐个产出结果，在途的命令也不超过concurrency条，输入再多占用的内存也有上限。
+    取消调用方的任务会放弃尚未完成的命令，但已经发给ExifTool的写入命令仍可能完成。
+    """
+    def __init__(self, executable, backend=None, processes=2, concurrency=16, call_timeout=30.0,
+                 max_retries=1, common_args=None, recorder=None):
+        self.executable = executable
+        self.backend = backend or SUBPROCESS_BACKEND
+        self.concurrency = max(1, concurrency)
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.recorder = recorder
+        common_args = list(common_args if common_args is not None else ExifToolStream.DEFAULT_COMMON_ARGS)
+        self._processes = [_AsyncExifToolProcess(executable, self.backend, common_args)
+                           for _ in range(max(1, processes))]
+        self._semaphore = None
+
+    async def start(self):
+        """启动全部进程；不调用也可以，第一条命令会自动启动"""
+        import asyncio
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(process._ensure_process() for process in self._processes))
+
+    async def close(self):
+        import asyncio
+        await asyncio.gather(*(process.close() for process in self._processes))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def restarts(self):
+        return sum(process.restarts for process in self._processes)
+
+    async def execute(self, params, timeout=None):
+        """执行一条ExifTool命令，返回 (status, stdout, stderr)
+
+        进程崩溃或因其他命令超时而重启时，受牵连的命令最多重试max_retries次。
+        """
+        import asyncio
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                process = min(self._processes, key=lambda p: p.pending_count)
+                status, stdout, stderr = await process.execute(params, timeout or self.call_timeout)
+                if status != ExifToolStream.STATUS_CRASHED:
+                    break
+                log_exiftool.debug("命令因进程重启失败，第%d次重试", attempt + 1)
+            return status, stdout, stderr
+
+    async def read(self, file_path):
+        """读取单个文件的元数据，失败时返回None"""
+        with PERF.measure("exiftool_read"):
+            status, stdout, stderr = await self.execute(["-j", file_path])
+        try:
+            return json.loads(stdout)[0]
+        except (ValueError, IndexError, KeyError):
+            log_read.warning("读取元数据时出错: %s: %s", file_path, stderr.strip())
+            return None
+
+    async def read_many(self, paths):
+        """读取多个文件的元数据，返回按输入顺序排列的 {路径: 元数据}"""
+        paths = list(paths)
+        results = dict.fromkeys(paths)
+        async for file_path, metadata in self.iter_read(paths):
+            results[file_path] = metadata
+        return results
+
+    async def iter_read(self, paths):
+        async for result in self._as_completed(((self._read_pair, (path,)) for path in paths)):
+            yield result
+
+    async def _read_pair(self, file_path):
+        return file_path, await self.read(file_path)
+
+    async def apply(self, file_path, metadata):
+        """把元数据写入单个文件，返回ResultRecorder格式的记录"""
+        changes = {key: value for key, value in metadata.items() if value != "__NO_CHANGE__"}
+        if not changes:
+            return self._record(file_path, "skipped")
+        return await self._write(file_path, changes, ["-overwrite_original"] + ImageMetadataEditor._build_write_args(changes))
+
+    async def apply_entry(self, entry):
+        """执行计划文件中的一个文件条目，规则与PlanApplier相同"""
+        file_path = entry["file"]
+        if not BatchPlan.entry_is_current(entry, file_path):
+            log_job.debug("文件在生成计划后被修改，写入全部计划的元数据: %s", file_path)
+            return await self.apply(file_path, entry["metadata"])
+        if not entry["changes"]:
+            return self._record(file_path, "skipped")
+        return await self._write(file_path, entry["changes"], list(entry["args"][:-1]))
+
+    async def _write(self, file_path, changes, args):
+        started = time.monotonic()
+        status, stdout, stderr = await self.execute(args + [file_path])
+        duration = time.monotonic() - started
+        PERF.add("exiftool_write", duration)
+        if status == 0 and "error" not in stderr.lower():
+            try:
+                file_bytes = os.path.getsize(file_path)
+            except OSError:
+                file_bytes = 0
+            return self._record(file_path, "success", changes, "", duration, file_bytes)
+        if status in (ExifToolStream.STATUS_TIMEOUT, ExifToolStream.STATUS_CRASHED):
+            log_write.warning("已隔离文件: %s: %s", file_path, stderr.strip())
+            return self._record(file_path, "quarantined", changes, stderr.strip(), duration)
+        log_write.warning("应用元数据时出错: %s: %s", file_path, stderr.strip())
+        return self._record(file_path, "failed", changes, stderr.strip(), duration)
+
+    def _record(self, file_path, status, changes=None, error="", duration=None, file_bytes=0):
+        if self.recorder is not None:
+            self.recorder.write(file_path, status, changes, error, duration, file_bytes)
+        return {
+            "file": file_path,
+            "status": status,
+            "error": error,
+            "tags": changes or {},
+            "duration_ms": round(duration * 1000, 3) if duration is not None else None,
+            "bytes_written": file_bytes,
+        }
+
+    async def apply_many(self, plan):
+        """应用整个计划，返回按完成顺序排列的记录列表"""
+        return [record async for record in self.iter_apply(plan)]
+
+    async def iter_apply(self, plan):
+        async for record in self._as_completed(self._plan_calls(plan)):
+            yield record
+
+    def _plan_calls(self, plan):
+        if isinstance(plan, str):
+            plan = (record for record in BatchPlan.iter_records(plan) if record["type"] == "file")
+        elif isinstance(plan, dict):
+            plan = plan.items()
+        for item in plan:
+            if isinstance(item, dict):
+                yield self.apply_entry, (item,)
+            else:
+                yield self.apply, tuple(item)
+
+    async def _as_completed(self, calls):
+        """按完成顺序产出结果，同时运行的任务不超过concurrency个；迭代提前结束或被取消时取消剩余任务"""
+        import asyncio
+        calls = iter(calls)
+        running = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(running) < self.concurrency:
+                    call = next(calls, None)
+                    if call is None:
+                        exhausted = True
+                        break
+                    func, args = call
+                    running.add(asyncio.ensure_future(func(*args)))
+                if not running:
+                    return
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
 
-# 自定义文件项类，支持复选框
-class FileListItem(QWidget):
-    def __init__(self, file_path, parent=None):
-        super().__init__(parent)
-        self.file_path = file_path
-        self.file_name = os.path.basename(file_path)
-        
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(2, 2, 2, 2)
-        
-        self.checkbox = QCheckBox()
-        self.checkbox.setChecked(True)  # 默认选中
-        
-        self.label = QLabel(self.file_name)
-        self.label.setToolTip(file_path)
-        
-        layout.addWidget(self.checkbox)
-        layout.addWidget(self.label, 1)  # 标签占据剩余空间
+# 批处理进度的节流显示：按固定帧率合并更新，并显示吞吐量和预计剩余时间
+class ProgressReporter:
+    """代替每个文件都调用setValue、setLabelText和processEvents
+
+    update()只比较一次时间，没到刷新时间时立即返回；刷新时记录界面更新本身的耗时，
+    下一次刷新至少间隔 耗时/max_ui_share，界面更新占用的时间不超过批处理时间的max_ui_share。
+    """
+
+    def __init__(self, progress_dialog, total, title="正在处理", fps=10, max_ui_share=0.05):
+        self.dialog = progress_dialog
+        self.total = total
+        self.title = title
+        self.interval = 1.0 / fps
+        self.max_ui_share = max_ui_share
+        self.started = time.monotonic()
+        self.ui_time = 0.0       # 界面更新累计耗时
+        self.refreshes = 0
+        self._next_refresh = 0.0
+        self._canceled = False
+
+    def update(self, done, current_name="", bytes_done=0, force=False):
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return
+        elapsed = now - self.started
+        files_per_second = done / elapsed if elapsed > 0 else 0.0
+        text = f"{self.title} ({done}/{self.total})"
+        if current_name:
+            text += f": {current_name}"
+        if done and elapsed > 0:
+            text += f"\n{files_per_second:.1f} 文件/秒"
+            if bytes_done:
+                text += f", {bytes_done / elapsed / 1024 / 1024:.1f} MB/秒"
+            if done < self.total:
+                text += f", 预计剩余 {self.format_eta((self.total - done) / files_per_second)}"
+        self.dialog.setValue(min(done, self.total))
+        self.dialog.setLabelText(text)
+        QApplication.processEvents()
+        self._canceled = self.dialog.wasCanceled()
+        cost = time.monotonic() - now
+        self.ui_time += cost
+        self.refreshes += 1
+        self._next_refresh = now + cost + max(self.interval, cost / self.max_ui_share)
+
+    def set_title(self, title):
+        self.title = title
+        self._next_refresh = 0.0
+
+    def canceled(self):
+        """是否已取消；取消按钮的点击在刷新时处理，最多延迟一帧"""
+        return self._canceled
+
+    @staticmethod
+    def format_eta(seconds):
+        seconds = int(seconds + 0.5)
+        if seconds < 60:
+            return f"{seconds}秒"
+        if seconds < 3600:
+            return f"{seconds // 60}分{seconds % 60:02d}秒"
+        return f"{seconds // 3600}小时{seconds % 3600 // 60:02d}分"
+
+# 自适应调整每批提交给ExifTool的文件数量
+class AdaptiveChunkScheduler:
+    """根据每批的实际耗时和吞吐量调整批大小
+
+    - 一批在目标时间内完成且吞吐量没有下降时，逐步增大批大小
+    - 一批耗时明显超过目标时间时，批大小减半
+    - 同时限制在途的文件字节数和参数字符数，避免大文件占满内存或超出命令行长度限制
+    """
+    def __init__(self, min_chunk=1, max_chunk=256, initial_chunk=8, target_latency=1.0,
+                 max_inflight_bytes=512 * 1024 * 1024, max_inflight_chars=32000, cost_model=None):
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.chunk_size = max(min_chunk, min(initial_chunk, max_chunk))
+        self.target_latency = target_latency
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_inflight_chars = max_inflight_chars
+        self.files_per_second = 0.0
+        self.bytes_per_second = 0.0
+        self.cost_model = cost_model  # 传入CostModel时，每批的耗时同时作为耗时模型的样本
+
+    def admit(self, inflight_count, inflight_bytes, inflight_chars, file_bytes, file_chars):
+        """判断是否还能再提交一个文件；没有在途文件时总是允许，保证超大文件也能被处理"""
+        if inflight_count == 0:
+            return True
+        if inflight_count >= self.chunk_size:
+            return False
+        if inflight_bytes + file_bytes > self.max_inflight_bytes:
+            return False
+        if inflight_chars + file_chars > self.max_inflight_chars:
+            return False
+        return True
+
+    def record_chunk(self, file_count, byte_count, elapsed):
+        """记录一批的处理结果并调整下一批的大小"""
+        if file_count <= 0 or elapsed <= 0:
+            return
+        if self.cost_model is not None:
+            self.cost_model.add(file_count, byte_count, elapsed)
+        files_per_second = file_count / elapsed
+        bytes_per_second = byte_count / elapsed
+        previous_files_per_second = self.files_per_second
+        # 指数加权平均，平滑单批的波动
+        if self.files_per_second == 0:
+            self.files_per_second = files_per_second
+            self.bytes_per_second = bytes_per_second
+        else:
+            self.files_per_second = 0.7 * self.files_per_second + 0.3 * files_per_second
+            self.bytes_per_second = 0.7 * self.bytes_per_second + 0.3 * bytes_per_second
+
+        if elapsed > self.target_latency * 2:
+            # 太慢：批大小减半
+            self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+        elif elapsed < self.target_latency and files_per_second >= previous_files_per_second * 0.9:
+            # 足够快且吞吐量没有明显下降：增大批大小
+            self.chunk_size = min(self.max_chunk, max(self.chunk_size + 1, int(self.chunk_size * 1.5)))
+
+# 根据本机实测的每文件和每字节耗时估算批处理时间
+class CostModel:
+    """批处理耗时 ≈ 每文件耗时 × 文件数 + 每MB耗时 × MB数
+
+    样本为实际批处理中每批的耗时（由AdaptiveChunkScheduler记录）和试运行时的校准写入，
+    用最小二乘拟合两个系数；旧样本按decay逐渐衰减，机器或ExifTool版本变化后估算会跟着更新。
+    """
+    def __init__(self, decay=0.98):
+        self.decay = decay
+        self.samples = 0
+        self._sums = [0.0] * 5  # Σf², Σf·m, Σm², Σf·t, Σm·t（f文件数，m为MB数，t为秒）
+
+    def add(self, file_count, byte_count, elapsed):
+        if file_count <= 0 or elapsed <= 0:
+            return
+        mb = byte_count / 1024 / 1024
+        terms = (file_count * file_count, file_count * mb, mb * mb, file_count * elapsed, mb * elapsed)
+        self._sums = [s * self.decay + term for s, term in zip(self._sums, terms)]
+        self.samples += 1
+
+    def coefficients(self):
+        """返回 (每文件秒数, 每MB秒数)，还没有样本时返回None"""
+        ff, fm, mm, ft, mt = self._sums
+        if ff <= 0:
+            return None
+        det = ff * mm - fm * fm
+        if det > 1e-9 * ff * mm:
+            per_file = (ft * mm - mt * fm) / det
+            per_mb = (ff * mt - fm * ft) / det
+            if per_file >= 0 and per_mb >= 0:
+                return per_file, per_mb
+            if per_file < 0:
+                return 0.0, mt / mm
+        # 样本的平均文件大小都差不多时无法区分两个系数，只按文件数估算
+        return ft / ff, 0.0
+
+    def estimate(self, file_count, byte_count):
+        coefficients = self.coefficients()
+        if coefficients is None:
+            return None
+        per_file, per_mb = coefficients
+        return per_file * file_count + per_mb * byte_count / 1024 / 1024
+
+    def describe(self):
+        coefficients = self.coefficients()
+        if coefficients is None:
+            return {"samples": self.samples}
+        return {"samples": self.samples, "per_file_ms": round(coefficients[0] * 1000, 3),
+                "per_mb_ms": round(coefficients[1] * 1000, 3)}
+
+    def to_json(self):
+        return json.dumps({"samples": self.samples, "sums": self._sums})
+
+    @classmethod
+    def from_json(cls, text):
+        model = cls()
+        try:
+            data = json.loads(text or "{}")
+            sums = [float(s) for s in data.get("sums", [])]
+            if len(sums) == 5:
+                model._sums = sums
+                model.samples = int(data.get("samples", 0))
+        except (ValueError, TypeError, AttributeError):
+            log_settings.warning("耗时模型设置无效，重新开始统计")
+        return model
+
+# 按计划文件流式应用元数据，不依赖界面，可以在任何装有ExifTool的机器上运行
+class PlanApplier:
+    """逐行读取计划文件并在同一个ExifTool进程中流水线提交写入命令，
+    内存中只保留在途的命令（最多max_pending条），计划文件再大占用的内存也有上限。
+
+    文件的大小和修改时间与生成计划时一致时直接使用计划中的参数（无需修改的文件跳过）；
+    否则写入计划中的全部元数据，因为此时无法确认生成计划时的比较结果是否仍然成立。
+    root不为空时，把计划中的公共目录替换为root，用于在文件位于其他路径的机器上执行。
+    传入pool时从ExifTool进程池借用进程，否则单独启动一个进程。
+    """
+    def __init__(self, executable, backend=None, max_pending=32, call_timeout=30.0, root="",
+                 recorder=None, report_interval=5.0, pool=None):
+        self.executable = executable
+        self.backend = backend
+        self.max_pending = max_pending
+        self.call_timeout = call_timeout
+        self.root = root
+        self.recorder = recorder
+        self.report_interval = report_interval
+        self.pool = pool
+        self.header = {}
+        self.counts = {"success": 0, "skipped": 0, "failed": 0, "quarantined": 0}
+        self._last_report = time.monotonic()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """停止提交新的文件（可以从其他线程调用），已提交的命令仍会执行完"""
+        self._cancel.set()
+
+    @property
+    def canceled(self):
+        return self._cancel.is_set()
+
+    def relocate(self, file_path):
+        plan_root = self.header.get("root", "")
+        if not self.root or not plan_root:
+            return file_path
+        relative = os.path.relpath(file_path, plan_root)
+        if relative.startswith(os.pardir):
+            return file_path
+        return os.path.join(self.root, relative)
+
+    def run(self, plan_path):
+        """执行整个计划，返回各状态的文件数"""
+        if self.pool is not None:
+            stream = self.pool.acquire(max_pending=self.max_pending, call_timeout=self.call_timeout)
+        else:
+            stream = ExifToolStream(self.executable, max_pending=self.max_pending, call_timeout=self.call_timeout,
+                                    backend=self.backend)
+            stream.start()
+        try:
+            for record in BatchPlan.iter_records(plan_path):
+                if record["type"] == "header":
+                    self.header = record
+                    log_job.info("执行计划: %s（%s，%d 个文件）", plan_path, record.get("mode", ""),
+                                 record.get("total", 0))
+                    continue
+                if self._cancel.is_set():
+                    break
+                self._submit(stream, record)
+                # 顺便取回已经完成的结果，不阻塞
+                while self._collect(stream, timeout=0):
+                    pass
+            while stream.pending_count > 0:
+                self._collect(stream, timeout=0.1)
+        finally:
+            if self.pool is not None:
+                self.pool.release(stream)
+            else:
+                stream.close()
+        return dict(self.counts)
+
+    def _submit(self, stream, entry):
+        file_path = self.relocate(entry["file"])
+        if BatchPlan.entry_is_current(entry, file_path):
+            if not entry["changes"]:
+                self._record(file_path, "skipped")
+                return
+            changes, file_bytes = entry["changes"], entry["size"]
+            params = list(entry["args"][:-1]) + [file_path]
+        else:
+            try:
+                file_bytes = os.path.getsize(file_path)
+            except OSError as e:
+                self._record(file_path, "failed", entry["changes"], str(e))
+                return
+            log_job.debug("文件在生成计划后被修改，写入全部计划的元数据: %s", file_path)
+            changes = {key: value for key, value in entry["metadata"].items() if value != "__NO_CHANGE__"}
+            params = ["-overwrite_original"] + ImageMetadataEditor._build_write_args(changes) + [file_path]
+        while not stream.can_submit():
+            self._collect(stream, timeout=0.1)
+        stream.submit(params, tag=(file_path, changes, file_bytes, time.monotonic()))
+
+    def _collect(self, stream, timeout):
+        result = stream.get_result(timeout=timeout)
+        if result is None:
+            return False
+        (file_path, changes, file_bytes, submitted), status, stdout, stderr = result
+        duration = time.monotonic() - submitted
+        PERF.add("exiftool_write", duration)
+        if status == 0 and "error" not in stderr.lower():
+            self._record(file_path, "success", changes, "", duration, file_bytes)
+        elif status in (ExifToolStream.STATUS_TIMEOUT, ExifToolStream.STATUS_CRASHED):
+            log_write.warning("已隔离文件: %s: %s", file_path, stderr.strip())
+            self._record(file_path, "quarantined", changes, stderr.strip(), duration)
+        else:
+            log_write.warning("应用元数据时出错: %s: %s", file_path, stderr.strip())
+            self._record(file_path, "failed", changes, stderr.strip(), duration)
+        return True
+
+    def _record(self, file_path, status, changes=None, error="", duration=None, file_bytes=0):
+        self.counts[status] += 1
+        if self.recorder is not None:
+            self.recorder.write(file_path, status, changes, error, duration, file_bytes if status == "success" else 0)
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            log_job.info("已处理 %d/%d 个文件", sum(self.counts.values()), self.header.get("total", 0))
+
+# 多台机器通过共享文件夹分担同一个计划：计划拆分为分片，各工作进程用原子重命名认领分片
+class ShardedJob:
+    """分片任务的目录结构（只需要共享文件系统，不需要协调服务）:
+    job.json                          原计划的计划头和分片数
+    pending/shard_00000.jsonl         待处理的分片，每个分片本身就是一个完整的计划文件
+    claimed/shard_00000.jsonl~工作进程  已被认领的分片，工作进程定期更新其修改时间作为租约心跳
+    done/shard_00000.jsonl            已完成的分片
+    results/shard_00000.jsonl         分片的处理结果（ResultRecorder的JSONL格式）
+
+    认领、完成和收回都是同一文件系统内的os.rename，同一时刻只有一个进程能成功。
+    租约超过lease_timeout秒没有续期的分片（工作进程崩溃或所在机器断开）由其他工作进程放回pending；
+    原工作进程如果只是暂时卡住，续期或完成时发现分片已被收回，就放弃该分片。
+    写入的都是计划中的最终值，分片被重复执行是安全的。
+    租约时间以共享文件系统的时钟为准（touch一个文件后读取其修改时间），各机器的时钟不需要同步。
+    """
+    SEPARATOR = "~"
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        self.pending_dir = os.path.join(job_dir, "pending")
+        self.claimed_dir = os.path.join(job_dir, "claimed")
+        self.done_dir = os.path.join(job_dir, "done")
+        self.results_dir = os.path.join(job_dir, "results")
+
+    @classmethod
+    def split(cls, plan_path, job_dir, shard_size=1000):
+        """逐行读取计划并拆分为分片，返回ShardedJob；内存中最多只保留一个分片的条目"""
+        job = cls(job_dir)
+        for directory in (job.pending_dir, job.claimed_dir, job.done_dir, job.results_dir):
+            os.makedirs(directory, exist_ok=True)
+        header = None
+        entries = []
+        shard_count = 0
+
+        def write_shard():
+            nonlocal shard_count
+            name = f"shard_{shard_count:05d}.jsonl"
+            temp_path = os.path.join(job_dir, f".{name}.tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(dict(header, total=len(entries), shard=shard_count), ensure_ascii=False) + "\n")
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            # 写完整个分片后才放入pending，工作进程不会读到写了一半的分片
+            os.replace(temp_path, os.path.join(job.pending_dir, name))
+            shard_count += 1
+            entries.clear()
+
+        for record in BatchPlan.iter_records(plan_path):
+            if header is None:
+                header = record
+                continue
+            entries.append(record)
+            if len(entries) >= shard_size:
+                write_shard()
+        if entries:
+            write_shard()
+        with open(os.path.join(job_dir, "job.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(header, shards=shard_count, shard_size=shard_size), f, ensure_ascii=False)
+        return job
+
+    def fs_now(self):
+        """共享文件系统的当前时间"""
+        clock_path = os.path.join(self.job_dir, ".clock")
+        with open(clock_path, "a"):
+            pass
+        os.utime(clock_path)
+        return os.stat(clock_path).st_mtime
+
+    def claim(self, worker_id):
+        """认领一个待处理的分片，返回 (分片名, 认领后的路径)，没有待处理的分片时返回None"""
+        for name in sorted(os.listdir(self.pending_dir)):
+            claimed_path = os.path.join(self.claimed_dir, f"{name}{self.SEPARATOR}{worker_id}")
+            try:
+                os.rename(os.path.join(self.pending_dir, name), claimed_path)
+            except FileNotFoundError:
+                continue  # 已被其他工作进程认领
+            # rename不改变修改时间，认领后立即续期，租约从现在开始计算
+            os.utime(claimed_path)
+            return name, claimed_path
+        return None
+
+    @staticmethod
+    def renew(claimed_path):
+        """续期租约；分片已被其他工作进程收回时抛出FileNotFoundError"""
+        os.utime(claimed_path)
+
+    def complete(self, name, claimed_path, result_path):
+        """标记分片完成并把结果放到分片旁边；分片已被收回时抛出FileNotFoundError"""
+        os.rename(claimed_path, os.path.join(self.done_dir, name))
+        os.replace(result_path, os.path.join(self.results_dir, name))
+
+    def release(self, name, claimed_path):
+        """放弃分片，放回pending由其他工作进程处理"""
+        try:
+            os.rename(claimed_path, os.path.join(self.pending_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def recover_expired(self, lease_timeout):
+        """把租约已过期的分片放回pending，返回收回的分片数"""
+        now = self.fs_now()
+        recovered = 0
+        for entry in os.scandir(self.claimed_dir):
+            try:
+                if now - entry.stat().st_mtime <= lease_timeout:
+                    continue
+                name, _, worker_id = entry.name.rpartition(self.SEPARATOR)
+                os.rename(entry.path, os.path.join(self.pending_dir, name))
+            except OSError:
+                continue  # 已被完成或被其他工作进程收回
+            log_job.warning("分片 %s 的租约已过期（工作进程 %s），重新放回待处理", name, worker_id)
+            recovered += 1
+        return recovered
+
+    def status(self):
+        claimed = sorted(os.listdir(self.claimed_dir))
+        return {
+            "pending": len(os.listdir(self.pending_dir)),
+            "claimed": len(claimed),
+            "done": len(os.listdir(self.done_dir)),
+            "workers": sorted({name.rpartition(self.SEPARATOR)[2] for name in claimed}),
+        }
+
+    def work(self, worker_id, make_applier, lease_timeout=300.0, poll_interval=5.0):
+        """不断认领并执行分片，直到所有分片完成，返回本进程处理的各状态文件数
+
+        make_applier(recorder)返回用于执行一个分片的PlanApplier；
+        没有待处理的分片但其他工作进程还在处理时，等待它们完成或租约过期后接手。
+        """
+        totals = {"success": 0, "skipped": 0, "failed": 0, "quarantined": 0}
+        while True:
+            self.recover_expired(lease_timeout)
+            claim = self.claim(worker_id)
+            if claim is None:
+                status = self.status()
+                if status["pending"] == 0 and status["claimed"] == 0:
+                    return totals
+                time.sleep(poll_interval)
+                continue
+
+            name, claimed_path = claim
+            log_job.info("工作进程 %s 认领分片 %s", worker_id, name)
+            result_path = os.path.join(self.results_dir, f"{name}{self.SEPARATOR}{worker_id}.part")
+            recorder = ResultRecorder(result_path, "jsonl")
+            applier = make_applier(recorder)
+            lost = threading.Event()
+            stop = threading.Event()
+
+            def heartbeat():
+                while not stop.wait(lease_timeout / 3):
+                    try:
+                        self.renew(claimed_path)
+                    except OSError:
+                        lost.set()
+                        applier.cancel()
+                        return
+
+            thread = threading.Thread(target=heartbeat, daemon=True)
+            thread.start()
+            try:
+                counts = applier.run(claimed_path)
+            except BaseException:
+                self.release(name, claimed_path)
+                raise
+            finally:
+                stop.set()
+                thread.join()
+                recorder.close()
+
+            if not lost.is_set():
+                try:
+                    self.complete(name, claimed_path, result_path)
+                except FileNotFoundError:
+                    lost.set()
+            if lost.is_set():
+                log_job.warning("分片 %s 的租约已丢失，由其他工作进程重新处理", name)
+                try:
+                    os.remove(result_path)
+                except OSError:
+                    pass
+                continue
+            for status, count in counts.items():
+                totals[status] += count
+
+# 本机HTTP/JSON任务服务，供流水线中的其他程序提交元数据改写任务
+class JobService:
+    """只监听127.0.0.1，不需要显示器。接口:
+    POST   /jobs               提交任务: {"files": [路径], "template": {...}, "seed": 整数, "reference_time": "..."}
+                               或 {"plan": {路径: 元数据}}；返回202和任务编号，队列已满时返回429
+    GET    /jobs               所有任务的状态
+    GET    /jobs/<编号>         任务状态和各状态的文件数
+    GET    /jobs/<编号>/events  进度流（NDJSON，每行一个状态快照），任务结束后关闭连接
+    GET    /jobs/<编号>/results 每个文件的处理结果（NDJSON，ResultRecorder的记录格式），执行期间返回已完成的部分
+    DELETE /jobs/<编号>         取消排队中或正在执行的任务
+    GET    /health             队列长度、正在执行的任务数和ExifTool进程池状态
+
+    任务排在容量为max_queue的队列中，由concurrency个线程各自从进程池借用一个ExifTool进程执行；
+    每个任务先生成计划文件（保存在jobs文件夹中），再用PlanApplier流式写入，写入的是完整的目标值。
+    """
+    FINAL_STATES = ("done", "failed", "canceled")
+    MAX_BODY = 64 * 1024 * 1024
+    MAX_FINISHED = 1000   # 最多保留多少个已结束任务的状态
+    LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+    def __init__(self, editor, concurrency=2, max_queue=16, progress_interval=0.5):
+        self.editor = editor
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+        self.jobs = {}   # {job_id: 任务状态}，按提交顺序
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._server = None
+        self._stopped = False
+        self._shutdown_lock = threading.Lock()
+        # 进程数与并发任务数相同，每个任务独占一个ExifTool进程
+        if editor.exiftool_pool is not None:
+            editor.exiftool_pool.close()
+        self.pool = ExifToolPool(editor.exiftool_path, size=self.concurrency, call_timeout=editor.exiftool_timeout,
+                                 backend=editor.exiftool_backend)
+        editor.exiftool_pool = self.pool
+        self.pool.start()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.concurrency)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, request):
+        """校验并排队一个任务，返回任务状态；请求无效时抛出ValueError，队列已满时抛出queue.Full"""
+        if not isinstance(request, dict):
+            raise ValueError("请求必须是JSON对象")
+        if "plan" in request:
+            plan = request["plan"]
+            if not isinstance(plan, dict) or not all(isinstance(path, str) and isinstance(metadata, dict)
+                                                     for path, metadata in plan.items()):
+                raise ValueError("plan必须是 {文件路径: 元数据对象}")
+            total = len(plan)
+        else:
+            files = request.get("files")
+            if not isinstance(files, list) or not all(isinstance(path, str) for path in files):
+                raise ValueError("缺少files（文件路径列表）或plan")
+            if request.get("template") is not None and not isinstance(request["template"], dict):
+                raise ValueError("template必须是JSON对象")
+            seed = request.get("seed")
+            # bool是int的子类，JSON中的true/false不能当作种子
+            if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+                raise ValueError("seed必须是整数")
+            if request.get("reference_time"):
+                datetime.datetime.strptime(request["reference_time"], "%Y-%m-%d %H:%M:%S")
+            total = len(files)
+        job = {
+            "job_id": uuid.uuid4().hex[:16],
+            "status": "queued",
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total": total,
+            "counts": {"success": 0, "skipped": 0, "failed": 0, "quarantined": 0},
+            "error": "",
+            "plan": "",
+            "results": "",
+            "_request": request,
+            "_applier": None,
+            "_started": None,
+        }
+        with self._lock:
+            self._queue.put_nowait(job)
+            self.jobs[job["job_id"]] = job
+            self._prune()
+        log_job.info("收到任务 %s: %d 个文件", job["job_id"], total)
+        return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                job["status"] = "canceled"
+            elif job["status"] == "running" and job["_applier"] is not None:
+                job["_applier"].cancel()
+        return job
+
+    def snapshot(self, job):
+        """任务状态中可以公开的字段，正在执行时包含实时的文件数和吞吐量"""
+        applier = job["_applier"]
+        counts = dict(applier.counts) if applier is not None else dict(job["counts"])
+        done = sum(counts.values())
+        result = {key: value for key, value in job.items() if not key.startswith("_")}
+        result["counts"] = counts
+        result["done"] = done
+        if job["_started"] is not None:
+            elapsed = time.monotonic() - job["_started"]
+            result["elapsed"] = round(elapsed, 3)
+            result["files_per_second"] = round(done / elapsed, 1) if elapsed > 0 else 0.0
+        return result
+
+    def health(self):
+        with self._lock:
+            running = sum(1 for job in self.jobs.values() if job["status"] == "running")
+        return {"queued": self._queue.qsize(), "queue_capacity": self._queue.maxsize, "running": running,
+                "concurrency": self.concurrency, "pool": self.pool.health()}
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in self.FINAL_STATES]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED)]:
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job["status"] == "canceled":
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                log_job.error("任务 %s 出错: %s", job["job_id"], e)
+                job["status"] = "failed"
+                job["error"] = str(e)
+
+    def _run(self, job):
+        request = job["_request"]
+        job["status"] = "running"
+        job["_started"] = time.monotonic()
+        if "plan" in request:
+            files_metadata, generation = request["plan"], None
+            mode_name = "服务任务"
+        else:
+            reference_time = None
+            if request.get("reference_time"):
+                reference_time = datetime.datetime.strptime(request["reference_time"], "%Y-%m-%d %H:%M:%S")
+            template = request.get("template")
+            files_metadata, generation = self.editor._generate_files_metadata(
+                request["files"], template, request.get("seed"), reference_time)
+            mode_name = "自定义模式" if template is not None else "随机模式"
+        plan = self.editor.build_plan(files_metadata, mode_name, generation, diff=False)
+        job["plan"] = plan.save()
+        # 执行期间调用方可以通过/results读取已完成的部分，每条记录立即写入文件
+        recorder = ResultRecorder.create("jsonl", plan.header["plan_id"], flush_interval=1)
+        job["results"] = recorder.path
+        applier = PlanApplier(self.editor.exiftool_path, backend=self.editor.exiftool_backend,
+                              call_timeout=self.editor.exiftool_timeout, recorder=recorder, pool=self.pool)
+        job["_applier"] = applier
+        try:
+            job["counts"] = applier.run(job["plan"])
+        finally:
+            recorder.close()
+            job["_applier"] = None
+        job["status"] = "canceled" if applier.canceled else "done"
+        log_job.info("任务 %s 完成: %s", job["job_id"], job["counts"])
+
+    @staticmethod
+    def _host_name(host):
+        """去掉Host请求头中的端口和IPv6地址的方括号，返回小写的主机名；格式不对时原样返回"""
+        host = host.strip().lower()
+        if host.startswith("["):
+            # [::1] 或 [::1]:8765，方括号后面只能是端口
+            address, bracket, rest = host[1:].partition("]")
+            if bracket and (not rest or (rest[0] == ":" and rest[1:].isdigit())):
+                return address
+            return host
+        if host.count(":") == 1:
+            name, port = host.split(":")
+            return name if port.isdigit() else host
+        # 没有端口，或者是不带方括号的IPv6地址（如 ::1）
+        return host
+
+    def serve(self, port=8765):
+        """在127.0.0.1上提供服务，直到被中断或调用shutdown()；shutdown()已经调用过时立即返回"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                log_app.debug("HTTP %s", format % args)
+
+            def _send_json(self, status, data, headers=None):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self):
+                """拒绝Host不是本机的请求（防止DNS重绑定），返回 (任务, 子路径) 或在出错时返回None"""
+                if service._host_name(self.headers.get("Host") or "") not in service.LOCAL_HOSTS:
+                    self._send_json(403, {"error": "只接受来自本机的请求"})
+                    return None
+                parts = [part for part in self.path.split("?")[0].split("/") if part]
+                if len(parts) >= 2 and parts[0] == "jobs":
+                    with service._lock:
+                        job = service.jobs.get(parts[1])
+                    if job is None:
+                        self._send_json(404, {"error": "任务不存在"})
+                        return None
+                    return job, parts[2:]
+                return None, parts
+
+            def do_GET(self):
+                route = self._route()
+                if route is None:
+                    return
+                job, parts = route
+                if job is None:
+                    if parts == ["health"]:
+                        self._send_json(200, service.health())
+                    elif parts == ["jobs"]:
+                        with service._lock:
+                            jobs = list(service.jobs.values())
+                        self._send_json(200, [service.snapshot(job) for job in jobs])
+                    else:
+                        self._send_json(404, {"error": "未知的路径"})
+                elif not parts:
+                    self._send_json(200, service.snapshot(job))
+                elif parts == ["events"]:
+                    self._stream_events(job)
+                elif parts == ["results"]:
+                    self._stream_results(job)
+                else:
+                    self._send_json(404, {"error": "未知的路径"})
+
+            def do_POST(self):
+                route = self._route()
+                if route is None:
+                    return
+                job, parts = route
+                if job is not None or parts != ["jobs"]:
+                    self._send_json(404, {"error": "未知的路径"})
+                    return
+                if self.headers.get("Content-Length") is None:
+                    self._send_json(411, {"error": "请求缺少Content-Length"})
+                    return
+                try:
+                    length = int(self.headers["Content-Length"])
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    self._send_json(400, {"error": "Content-Length无效"})
+                    return
+                if length == 0:
+                    self._send_json(400, {"error": "请求体为空"})
+                    return
+                if length > service.MAX_BODY:
+                    self._send_json(413, {"error": "请求过大"})
+                    return
+                try:
+                    job = service.submit(json.loads(self.rfile.read(length)))
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                except queue.Full:
+                    # 背压：队列已满时让调用方稍后重试
+                    self._send_json(429, {"error": "任务队列已满"}, {"Retry-After": "5"})
+                    return
+                self._send_json(202, service.snapshot(job), {"Location": f"/jobs/{job['job_id']}"})
+
+            def do_DELETE(self):
+                route = self._route()
+                if route is None:
+                    return
+                job, parts = route
+                if job is None or parts:
+                    self._send_json(404, {"error": "未知的路径"})
+                    return
+                service.cancel(job["job_id"])
+                self._send_json(200, service.snapshot(job))
+
+            def _stream_events(self, job):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    while True:
+                        snapshot = service.snapshot(job)
+                        self.wfile.write((json.dumps(snapshot, ensure_ascii=False) + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                        if snapshot["status"] in service.FINAL_STATES:
+                            return
+                        time.sleep(service.progress_interval)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 调用方已断开
+
+            def _stream_results(self, job):
+                if not job["results"] or not os.path.exists(job["results"]):
+                    self._send_json(409, {"error": "任务还没有开始执行"})
+                    return
+                # 任务执行期间文件还在追加写入，只返回到最后一个换行为止的完整记录
+                with open(job["results"], "rb") as f:
+                    data = f.read()
+                data = data[:data.rfind(b"\n") + 1]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        # 与shutdown()互斥：要么shutdown()看到这个服务并停止它，要么这里看到已经停止而不再启动
+        with self._lock:
+            stopped = self._stopped
+            if not stopped:
+                self._server = server
+        if stopped:
+            server.server_close()
+            return
+        log_app.info("任务服务已启动: http://127.0.0.1:%d/ （并发 %d，队列容量 %d）",
+                     server.server_address[1], self.concurrency, self._queue.maxsize)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def shutdown(self):
+        """停止HTTP服务和执行任务的线程，排队中的任务被取消，正在执行的任务会先执行完。
+
+        不能在serve()正在运行的线程中调用（要等serve_forever退出）；在serve()之前调用时，之后的serve()立即返回。
+        重复调用时等待第一次调用完成后返回。
+        """
+        with self._shutdown_lock:
+            with self._lock:
+                if self._stopped:
+                    return
+                self._stopped = True
+                server = self._server
+            if server is not None:
+                server.shutdown()
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    job["status"] = "canceled"
+            for _ in self._workers:
+                self._queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            self.pool.close()
+            log_app.info("任务服务已停止")
+
+# 监视文件夹的已处理文件索引，追加写入，程序重启后不会重复处理同一个文件
+class WatchIndex:
+    """索引文件每行一个JSON记录 {"file", "size", "mtime_ns", "status", "error", "time"}，同一文件以最后一条为准。
+
+    记录的是处理后文件的大小和修改时间（写入元数据会改变它们），文件之后又被修改时会重新处理。
+    write()与ResultRecorder.write()的参数相同，可以直接作为PlanApplier的recorder，各工作线程可以同时调用。
+    """
+    def __init__(self, path, fsync_interval=200, fsync_seconds=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_seconds = fsync_seconds
+        self.entries = {}   # {file_path: (size, mtime_ns, status)}
+        self.counts = {"success": 0, "skipped": 0, "failed": 0, "quarantined": 0}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._file = None
+
+    @staticmethod
+    def default_path():
+        return os.path.join(BatchJournal.journal_dir(), "watch_index.jsonl")
+
+    def open(self):
+        """加载已有的索引；重复的记录较多时先压缩文件，再以追加方式打开"""
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        self.entries[record["file"]] = (record["size"], record["mtime_ns"], record["status"])
+                    except (ValueError, KeyError, TypeError):
+                        # 程序崩溃时最后一行可能不完整
+                        continue
+        if lines > 2 * len(self.entries) + 1000:
+            self._compact()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        log_job.info("已处理文件索引: %s（%d 个文件）", self.path, len(self.entries))
+        return self
+
+    def _compact(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for file_path, (size, mtime_ns, status) in self.entries.items():
+                f.write(json.dumps({"file": file_path, "size": size, "mtime_ns": mtime_ns, "status": status},
+                                   ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def is_processed(self, file_path, size, mtime_ns):
+        entry = self.entries.get(file_path)
+        return entry is not None and entry[0] == size and entry[1] == mtime_ns
+
+    def write(self, file_path, status, tags=None, error="", duration=None, bytes_written=0):
+        try:
+            stat = os.stat(file_path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime_ns = -1, 0
+        record = {"file": file_path, "size": size, "mtime_ns": mtime_ns, "status": status,
+                  "error": error or "", "time": datetime.datetime.now().isoformat(timespec="seconds")}
+        with self._lock:
+            self.entries[file_path] = (size, mtime_ns, status)
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._pending += 1
+            now = time.monotonic()
+            if self._pending >= self.fsync_interval or now - self._last_sync >= self.fsync_seconds:
+                os.fsync(self._file.fileno())
+                self._pending = 0
+                self._last_sync = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+# Linux的inotify接口，通过ctypes调用libc，不需要额外安装依赖
+class _Inotify:
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY | IN_DELETE_SELF
+    _EVENT_HEADER = 16  # struct inotify_event: int wd; uint32 mask, cookie, len
 
-class ImageMetadataEditor(QMainWindow):
     def __init__(self):
+        import ctypes
+        import ctypes.util
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify只在Linux上可用")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self.directories = {}  # {wd: 目录}
+
+    def add_watch(self, directory):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            # 通常是超过了 fs.inotify.max_user_watches
+            raise OSError(ctypes.get_errno(), f"无法监视文件夹: {directory}")
+        self.directories[wd] = directory
+
+    def read_events(self, timeout):
+        """等待最多timeout秒，返回 [(路径, mask)]；mask含IN_Q_OVERFLOW时路径为None"""
+        import select
+        import struct
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self._EVENT_HEADER <= len(data):
+            wd, mask, _, name_length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + self._EVENT_HEADER:offset + self._EVENT_HEADER + name_length].rstrip(b"\0")
+            offset += self._EVENT_HEADER + name_length
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            if mask & self.IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is not None:
+                events.append((os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+# 监视文件夹：新图片写入完成后，自动按保存的模板分小批写入元数据
+class FolderWatcher:
+    """Linux上用inotify接收新文件的通知，inotify不可用时每隔poll_interval秒扫描一次文件夹；
+    启动时和inotify事件队列溢出时也会完整扫描一次，处理程序未运行期间加入的文件。
+
+    新文件的大小和修改时间连续stable_seconds秒不变才算写入完成。写入完成的文件攒够batch_size个，
+    或最早的文件已等待batch_wait秒，就生成一个小批次的计划，交给workers个工作线程，
+    每个线程从ExifTool进程池借用一个进程用PlanApplier流式写入。工作线程都忙时小批次最多排队queue_size个，
+    之后主循环暂停取新的批次，写入完成的文件继续在内存中累积。
+    已处理的文件记录在WatchIndex中，文件没有再被修改时重启后不会重复处理。
+    """
+    def __init__(self, editor, roots, template=None, index=None, workers=2, batch_size=200, batch_wait=2.0,
+                 stable_seconds=2.0, poll_interval=5.0, use_inotify=True, queue_size=4):
+        self.editor = editor
+        self.roots = [os.path.normpath(os.path.abspath(root)) for root in roots]
+        self.template = template
+        self.index = index or WatchIndex(WatchIndex.default_path())
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.inotify = None
+        self.batches = 0
+        self._candidates = {}  # {file_path: (size, mtime_ns, 最后一次变化的时间)}
+        self._ready = []       # 已写入完成、等待组成批次的文件
+        self._ready_since = None
+        self._inflight = set()  # 已交给工作线程、尚未处理完的文件
+        self._inflight_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._last_scan = 0.0
+        self.pool = None
+        self._threads = []
+
+    def stop(self):
+        """停止监视（可以从其他线程或信号处理函数中调用），已排队的批次会先处理完"""
+        self._stop.set()
+
+    def run(self):
+        """监视直到stop()被调用，返回各状态的文件数"""
+        self.index.open()
+        if self.use_inotify:
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                log_job.info("inotify不可用，改为每%g秒扫描一次: %s", self.poll_interval, e)
+                self.inotify = None
+        if self.editor.exiftool_pool is not None:
+            self.editor.exiftool_pool.close()
+        self.pool = ExifToolPool(self.editor.exiftool_path, size=self.workers, call_timeout=self.editor.exiftool_timeout,
+                                 backend=self.editor.exiftool_backend)
+        self.editor.exiftool_pool = self.pool
+        self.pool.start()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        log_job.info("开始监视: %s（%s）", ", ".join(self.roots), "inotify" if self.inotify else "定时扫描")
+        try:
+            # 先添加监视再扫描，扫描期间新加入的文件也不会漏掉
+            if self.inotify is not None:
+                for root in self.roots:
+                    self._watch_tree(root)
+            self._scan()
+            while not self._stop.is_set():
+                tick = min(0.5, self.stable_seconds / 2 or 0.5)
+                if self.inotify is not None:
+                    self._handle_events(self.inotify.read_events(tick))
+                else:
+                    self._stop.wait(tick)
+                    if time.monotonic() - self._last_scan >= self.poll_interval:
+                        self._scan()
+                self._check_stable()
+                self._dispatch()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+            if self.inotify is not None:
+                self.inotify.close()
+            self.pool.close()
+            self.index.close()
+        log_job.info("停止监视，共处理 %d 个批次: %s", self.batches, self.index.counts)
+        return dict(self.index.counts)
+
+    def _watch_tree(self, root):
+        """监视root及其所有子文件夹"""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                self.inotify.add_watch(directory)
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                log_job.warning("无法监视文件夹: %s: %s", directory, e)
+
+    def _handle_events(self, events):
+        for file_path, mask in events:
+            if file_path is None:
+                log_job.warning("inotify事件队列溢出，重新扫描")
+                self._scan()
+            elif mask & _Inotify.IN_ISDIR:
+                if mask & (_Inotify.IN_CREATE | _Inotify.IN_MOVED_TO):
+                    # 新文件夹中在添加监视之前就写入的文件由扫描找到
+                    self._watch_tree(file_path)
+                    self._scan([file_path])
+            elif file_path.lower().endswith(FolderScanner.IMAGE_EXTENSIONS):
+                self._observe(os.path.normpath(file_path))
+
+    def _scan(self, roots=None):
+        scanner = FolderScanner(roots or self.roots, check_magic=False)
+        scanner._run()
+        for file_path, size, mtime_ns in scanner.take_batches():
+            if not self.index.is_processed(file_path, size, mtime_ns):
+                self._observe(file_path, size, mtime_ns)
+        self._last_scan = time.monotonic()
+
+    def _observe(self, file_path, size=None, mtime_ns=None):
+        """记录一个新的或有变化的文件，从现在起开始检查它是否写入完成"""
+        if file_path in self._candidates:
+            return
+        with self._inflight_lock:
+            if file_path in self._inflight:
+                return
+        if size is None:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        self._candidates[file_path] = (size, mtime_ns, time.monotonic())
+
+    def _check_stable(self):
+        now = time.monotonic()
+        for file_path, (size, mtime_ns, since) in list(self._candidates.items()):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # 文件已被删除或移走
+                del self._candidates[file_path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._candidates[file_path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - since < self.stable_seconds:
+                continue
+            del self._candidates[file_path]
+            if self.index.is_processed(file_path, size, mtime_ns):
+                continue
+            if size == 0 or not FolderScanner.looks_like_image(file_path):
+                self.index.write(file_path, "skipped", error="不是支持的图片文件")
+                continue
+            if not self._ready:
+                self._ready_since = now
+            self._ready.append(file_path)
+
+    def _dispatch(self):
+        """把写入完成的文件分成小批次交给工作线程；队列已满时留到下一轮"""
+        while self._ready and (len(self._ready) >= self.batch_size
+                               or time.monotonic() - self._ready_since >= self.batch_wait):
+            if self._queue.full():
+                return
+            files, self._ready = self._ready[:self.batch_size], self._ready[self.batch_size:]
+            self._ready_since = time.monotonic()
+            with self._inflight_lock:
+                self._inflight.update(files)
+            files_metadata, generation = self.editor._generate_files_metadata(files, self.template)
+            plan = self.editor.build_plan(files_metadata, "自定义模式" if self.template is not None else "随机模式",
+                                          generation, diff=False)
+            self._queue.put((plan.save(), files))
+            self.batches += 1
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            plan_path, files = item
+            applier = PlanApplier(self.editor.exiftool_path, backend=self.editor.exiftool_backend,
+                                  call_timeout=self.editor.exiftool_timeout, recorder=self.index, pool=self.pool)
+            try:
+                counts = applier.run(plan_path)
+                log_job.info("已处理 %d 个新文件: %s", len(files), counts)
+                # 结果已记录在索引中，小批次的计划文件不再保留
+                os.remove(plan_path)
+            except Exception as e:
+                log_job.error("处理小批次时出错: %s: %s", plan_path, e)
+            finally:
+                with self._inflight_lock:
+                    self._inflight.difference_update(files)
+
+# 跨会话保存的元数据索引（SQLite），重新打开大量图片时不必再用ExifTool逐个读取
+class MetadataIndex:
+    """每个文件一行: 路径、大小、修改时间、用于排序和筛选的几个常用标签，以及zlib压缩的完整元数据。
+
+    大小和修改时间与文件当前的os.stat结果一致时记录才有效，文件被其他程序修改后自动失效。
+    本程序写入元数据后，用写入的值更新常用标签和新的大小、修改时间，完整元数据标记为需要重新读取。
+    新记录先在内存中累积，攒够flush_size条或调用flush()时在一个事务中写入；可以在多个线程中调用。
+    """
+    SCHEMA_VERSION = 1
+    # 列名 -> 标签名（不含组名）
+    TAG_COLUMNS = {"make": "Make", "model": "Model", "lens": "LensModel", "date_taken": "DateTimeOriginal"}
+
+    def __init__(self, path, flush_size=500):
+        self.path = path
+        self.flush_size = flush_size
+        self._connection = None
+        self._pending = {}  # {path: 行}，尚未写入数据库的记录
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_path():
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.join(script_dir, "metadata_index.sqlite3")
+
+    def open(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        if self.path != ":memory:":
+            # WAL模式下读取不会被写入阻塞，同一索引可以被多个进程使用
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != self.SCHEMA_VERSION:
+            # 索引只是缓存，格式不同时直接重建
+            connection.execute("DROP TABLE IF EXISTS files")
+        connection.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+            make TEXT, model TEXT, lens TEXT, date_taken TEXT, metadata BLOB, updated REAL)""")
+        connection.execute("CREATE INDEX IF NOT EXISTS files_make_model ON files(make, model)")
+        connection.execute("CREATE INDEX IF NOT EXISTS files_date_taken ON files(date_taken)")
+        connection.execute(f"PRAGMA user_version={self.SCHEMA_VERSION}")
+        connection.commit()
+        self._connection = connection
+        return self
+
+    @classmethod
+    def tag_values(cls, metadata):
+        """从ExifTool读取的元数据（"组:标签"形式）或写入的元数据（只有标签名）中取出常用标签的值"""
+        values = dict.fromkeys(cls.TAG_COLUMNS)
+        for full_key, value in metadata.items():
+            if full_key.startswith("Composite:"):
+                continue
+            tag = full_key.split(":")[-1]
+            for column, column_tag in cls.TAG_COLUMNS.items():
+                if tag == column_tag and values[column] is None and str(value).strip() not in ("", "__CLEAR__"):
+                    values[column] = str(value)
+        return values
+
+    def get(self, file_path, size, mtime_ns):
+        """返回文件的完整元数据，没有记录、记录已失效或写入后尚未重新读取时返回None"""
+        with self._lock:
+            row = self._pending.get(file_path)
+            if row is None and self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT path, size, mtime_ns, make, model, lens, date_taken, metadata FROM files WHERE path = ?",
+                    (file_path,)).fetchone()
+        if row is None or row[1] != size or row[2] != mtime_ns or row[7] is None:
+            return None
+        try:
+            return json.loads(zlib.decompress(row[7]).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+    def put(self, file_path, size, mtime_ns, metadata):
+        """记录读取到的完整元数据"""
+        values = self.tag_values(metadata)
+        blob = zlib.compress(json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+        self._queue((file_path, size, mtime_ns, *values.values(), blob))
+
+    def record_write(self, file_path, changes):
+        """本程序成功写入后调用：用写入的值更新常用标签，完整元数据需要重新读取"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        columns = self.lookup([file_path]).get(file_path)
+        values = dict(zip(self.TAG_COLUMNS, columns[2:])) if columns else dict.fromkeys(self.TAG_COLUMNS)
+        for column, tag in self.TAG_COLUMNS.items():
+            if tag in changes and changes[tag] != "__NO_CHANGE__":
+                values[column] = None if changes[tag] in ("", "__CLEAR__") else str(changes[tag])
+        self._queue((file_path, stat.st_size, stat.st_mtime_ns, *values.values(), None))
+
+    def _queue(self, row):
+        with self._lock:
+            self._pending[row[0]] = row
+            if len(self._pending) < self.flush_size:
+                return
+        self.flush()
+
+    def lookup(self, paths):
+        """批量查询常用标签，返回 {路径: (大小, 修改时间, make, model, lens, date_taken)}，调用方负责比较大小和修改时间"""
+        found = {}
+        paths = list(paths)
+        with self._lock:
+            for file_path in paths:
+                row = self._pending.get(file_path)
+                if row is not None:
+                    found[file_path] = row[1:7]
+            if self._connection is None:
+                return found
+            remaining = [file_path for file_path in paths if file_path not in found]
+            # SQLite限制单条语句的参数个数，分块查询
+            for start in range(0, len(remaining), 500):
+                chunk = remaining[start:start + 500]
+                query = ("SELECT path, size, mtime_ns, make, model, lens, date_taken FROM files WHERE path IN ("
+                         + ",".join("?" * len(chunk)) + ")")
+                for row in self._connection.execute(query, chunk):
+                    found[row[0]] = tuple(row[1:])
+        return found
+
+    def flush(self):
+        with self._lock:
+            if not self._pending or self._connection is None:
+                return
+            rows, self._pending = list(self._pending.values()), {}
+            now = time.time()
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, make, model, lens, date_taken, metadata, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [row + (now,) for row in rows])
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM files")
+
+    def count(self):
+        self.flush()
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+# 元数据选项表（品牌、型号、软件、镜头等），保存在程序目录下的数据文件中
+class MetadataOptions:
+    """加载并校验metadata_options.json，建立按品牌查找型号、软件和镜头的索引
+
+    用户可以在程序目录下的device_profiles文件夹中放置JSON文件添加设备，格式为：
+    {"format_version": 1, "devices": [{"make": "品牌", "type": "mobile", "models": [...],
+    "software": [...], "lenses": [...]}]}，type可以是mobile、camera或other。
+    """
+    FORMAT_VERSION = 1
+    REQUIRED_LISTS = ("make", "software", "lens_model", "exposure_time", "fnumber", "iso",
+                      "focal_length", "white_balance", "flash", "orientation")
+    DEVICE_TYPES = ("mobile", "camera", "other")
+
+    def __init__(self, data):
+        self.data_version = data.get("data_version", "")
+        self.metadata_options = data["metadata_options"]
+        self.metadata_options_cn = data["metadata_options_cn"]
+        self.en_to_cn_mapping = data["en_to_cn_mapping"]
+        self.cn_to_en_mapping = {field: {cn: en for en, cn in mapping.items()}
+                                 for field, mapping in self.en_to_cn_mapping.items()}
+        self.brands = data.get("brands", {})
+        self.mobile_lenses = data.get("mobile_lenses", [])
+        self.combo_extras = data.get("combo_extras", {})
+        self._profile_software = {}  # {品牌: 用户配置中指定的软件}
+        self._profile_lenses = {}    # {品牌: 用户配置中指定的镜头}
+        self._build_index()
+
+    @staticmethod
+    def default_path():
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "metadata_options.json")
+
+    @staticmethod
+    def profile_dir():
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), "device_profiles")
+
+    @classmethod
+    def load(cls, path=None, profile_dir=None):
+        """读取并校验选项文件，出错时抛出OSError或ValueError；无效的用户设备配置只打印错误并跳过"""
+        path = path or cls.default_path()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        errors = cls.validate(data)
+        if errors:
+            raise ValueError(f"{os.path.basename(path)} 格式错误: " + "; ".join(errors))
+        options = cls(data)
+
+        profile_dir = profile_dir or cls.profile_dir()
+        if os.path.isdir(profile_dir):
+            for name in sorted(os.listdir(profile_dir)):
+                if name.lower().endswith(".json"):
+                    options.load_profile(os.path.join(profile_dir, name))
+        return options
+
+    @classmethod
+    def validate(cls, data):
+        """检查数据文件的版本和结构，返回错误信息列表"""
+        if not isinstance(data, dict):
+            return ["根节点必须是对象"]
+        errors = []
+        version = data.get("format_version")
+        if not isinstance(version, int) or version > cls.FORMAT_VERSION:
+            errors.append(f"不支持的格式版本 {version!r}（当前程序支持 {cls.FORMAT_VERSION}）")
+        options = data.get("metadata_options")
+        if not isinstance(options, dict):
+            return errors + ["缺少metadata_options"]
+        for key in cls.REQUIRED_LISTS:
+            values = options.get(key)
+            if not isinstance(values, list) or not values or not all(isinstance(v, str) for v in values):
+                errors.append(f"metadata_options.{key} 必须是非空的字符串列表")
+        models = options.get("model")
+        if not isinstance(models, dict):
+            errors.append("metadata_options.model 必须是 {品牌: [型号]} 对象")
+        else:
+            for make in options.get("make", []):
+                if not models.get(make):
+                    errors.append(f"品牌 {make} 没有型号")
+        for key in ("metadata_options_cn", "en_to_cn_mapping"):
+            if not isinstance(data.get(key), dict):
+                errors.append(f"缺少{key}")
+        for make, brand in data.get("brands", {}).items():
+            if brand.get("type", "other") not in cls.DEVICE_TYPES:
+                errors.append(f"品牌 {make} 的类型无效: {brand.get('type')}")
+        return errors
+
+    def load_profile(self, path):
+        """合并一个用户设备配置文件"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+            if profile.get("format_version", 1) > self.FORMAT_VERSION:
+                raise ValueError(f"不支持的格式版本 {profile.get('format_version')}")
+            devices = profile.get("devices")
+            if not isinstance(devices, list):
+                raise ValueError("缺少devices列表")
+            for device in devices:
+                self.add_device(device)
+            log_settings.info("已加载设备配置: %s（%d 个设备）", os.path.basename(path), len(devices))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            log_settings.warning("设备配置 %s 无效，已跳过: %s", os.path.basename(path), e)
+
+    def add_device(self, device):
+        """添加一个设备：品牌不存在时新建，型号、软件和镜头追加到已有列表中"""
+        make = device.get("make")
+        models = device.get("models", [])
+        if not isinstance(make, str) or not make or not models:
+            raise ValueError("每个设备必须包含make和非空的models")
+        device_type = device.get("type", self.brands.get(make, {}).get("type", "other"))
+        if device_type not in self.DEVICE_TYPES:
+            raise ValueError(f"设备类型无效: {device_type}")
+
+        if make not in self.metadata_options["make"]:
+            self.metadata_options["make"].append(make)
+        known_models = self.metadata_options["model"].setdefault(make, [])
+        known_models.extend(m for m in models if m not in known_models)
+        self.brands.setdefault(make, {})["type"] = device_type
+        for key, target, store in (("software", "software", self._profile_software),
+                                   ("lenses", "lens_model", self._profile_lenses)):
+            values = device.get(key, [])
+            if values:
+                entries = store.setdefault(make, [])
+                entries.extend(v for v in values if v not in entries)
+                self.metadata_options[target].extend(v for v in values if v not in self.metadata_options[target])
+        self._build_index()
+
+    def _build_index(self):
+        """预先计算每个品牌可用的软件和镜头，随机生成和下拉框直接查表"""
+        software = self.metadata_options["software"]
+        lenses = self.metadata_options["lens_model"]
+        self.software_by_make = {}
+        self.lenses_by_make = {}
+        for make in self.metadata_options["make"]:
+            brand = self.brands.get(make, {})
+            prefixes = tuple(brand.get("software_prefixes", ()))
+            matched = self._profile_software.get(make, []) + [s for s in software if prefixes and s.startswith(prefixes)]
+            self.software_by_make[make] = matched or software
+
+            if brand.get("type") == "mobile" and self.mobile_lenses:
+                # 移动设备品牌使用移动镜头术语
+                matched = self.mobile_lenses
+            elif brand.get("type") == "camera":
+                # 相机品牌使用带有品牌名称的特定镜头
+                matched = [l for l in lenses if l.startswith(f"{make} ") or "mm" in l] or lenses
+            else:
+                matched = lenses
+            # 用户配置中指定的镜头排在前面
+            profile_lenses = self._profile_lenses.get(make, [])
+            self.lenses_by_make[make] = profile_lenses + [l for l in matched if l not in profile_lenses]
+
+    def software_for(self, make):
+        return self.software_by_make.get(make, self.metadata_options["software"])
+
+    def lenses_for(self, make):
+        return self.lenses_by_make.get(make, self.metadata_options["lens_model"])
+
+class ImageMetadataEditor(QMainWindow):
+    def __init__(self, exiftool_backend=None):
+        """exiftool_backend: 启动ExifTool进程的后端，默认运行真实的exiftool；
+        测试和基准测试可以传入FakeExifToolBackend，此时不查找、也不保存ExifTool路径"""
         super().__init__()
         # 应用程序版本
         self.app_version = "1.0.0"
@@ -76,25 +3784,61 @@ class ImageMetadataEditor(QMainWindow):
         self.setWindowTitle(f"图片元数据编辑器 v{self.app_version}")
         self.setMinimumSize(1200, 800)
         
-        # 存储已添加的文件路径
-        self.file_paths = []
+        # 已添加的文件（列式存储，见FileTable）
+        self.file_table = FileTable()
+        self.folder_scanner = None
         self.current_file_path = ""
         self.current_metadata = None
-        
+
+        # 已读取的文件元数据缓存 {file_path: (size, mtime_ns, metadata)}
+        self.metadata_cache = {}
+
         # 初始化设置对象
         self.settings = QSettings("ImageMetadataEditor", "settings")
+        PERF.enabled = self.settings.value("perf_enabled", True, type=bool)
+        self.perf_panel = None
         
         # 设置ExifTool路径
+        self.exiftool_backend = exiftool_backend or SUBPROCESS_BACKEND
         self.exiftool_path = ""  # 初始化为空
+        # ExifTool版本和可写入的文件类型，按可执行文件缓存在设置中
+        self.exiftool_info = {}
+
+        # 单条ExifTool命令的超时时间（秒），超时后重启进程并重试
+        self.exiftool_timeout = self.settings.value("exiftool_timeout", 30.0, type=float)
+        # 界面中读取单个文件时的超时时间（秒），在界面线程中等待，比批量写入的超时短得多
+        self.exiftool_read_timeout = self.settings.value("exiftool_read_timeout", 5.0, type=float)
+
+        # 根据实测的每文件和每字节耗时估算批处理时间；模拟后端的耗时没有意义，不读取也不保存
+        if self.exiftool_backend is SUBPROCESS_BACKEND:
+            self.cost_model = CostModel.from_json(self.settings.value("cost_model", ""))
+        else:
+            self.cost_model = CostModel()
+
+        # 跨会话的元数据索引；模拟后端读到的不是文件的真实内容，索引只保存在内存中
+        index_path = MetadataIndex.default_path() if self.exiftool_backend is SUBPROCESS_BACKEND else ":memory:"
+        try:
+            self.metadata_index = MetadataIndex(index_path).open()
+        except sqlite3.Error as e:
+            log_read.warning("无法打开元数据索引，本次只在内存中保存: %s", e)
+            self.metadata_index = MetadataIndex(":memory:").open()
+        atexit.register(self.metadata_index.close)
         
         # 初始化元数据选项
         self._init_metadata_options()
+        STARTUP_TIMER.mark("元数据选项")
         
         # 初始化界面组件
         self.init_ui()
+        STARTUP_TIMER.mark("创建界面")
         
         # 检查ExifTool路径并更新UI
         self.check_exiftool_path()
+        STARTUP_TIMER.mark("查找ExifTool")
+
+        # 在后台预先启动ExifTool进程，第一次读取文件时不必等待进程启动
+        self.exiftool_pool = None
+        self.start_exiftool()
         
         # 使用绝对路径设置图标
         try:
@@ -107,211 +3851,81 @@ class ImageMetadataEditor(QMainWindow):
             elif os.path.exists("001.ico"):
                 self.setWindowIcon(QIcon("001.ico"))
         except Exception as e:
-            print(f"设置窗口图标出错: {e}")
+            log_app.warning("设置窗口图标出错: %s", e)
         
         # 加载首选项
         self.load_settings()
         
         # 初始化文件列表
-        self.files = []
         self.current_index = -1
         
         # 设置应用程序样式，确保对话框能够更好地显示
         QApplication.setStyle("Fusion")
         
-        # 初始化ExifTool进程
-        self.exiftool_process = None
-        self.start_exiftool()
-        
         # 设置事件过滤器，用于处理自定义悬停提示
         self.image_preview.installEventFilter(self)
         
         # 加载上次会话的设置
         self.load_last_session_settings()
+        STARTUP_TIMER.mark("加载设置")
     
-    # 添加一个简单的start_exiftool方法
     def start_exiftool(self):
-        """初始化ExifTool进程"""
-        try:
-            if self.exiftool_path and os.path.exists(self.exiftool_path):
-                # 如果exiftool.exe存在，则打开一个持久化进程
-                self.exiftool_process = exiftool.ExifToolHelper(executable=self.exiftool_path)
-                print(f"ExifTool已初始化: {self.exiftool_path}")
-            else:
-                # 使用默认路径或者自动搜索
-                try:
-                    self.exiftool_process = exiftool.ExifToolHelper()
-                    print("ExifTool已使用默认路径初始化")
-                except Exception as e:
-                    print(f"无法初始化ExifTool: {str(e)}")
-                    # 不要中断应用程序，让UI仍然可以显示
-                    pass
-        except Exception as e:
-            print(f"ExifTool初始化错误: {str(e)}")
-            # 报错但不中断应用程序运行
+        """（重新）创建ExifTool进程池，进程在后台启动和预热"""
+        if self.exiftool_pool is not None:
+            self.exiftool_pool.close()
+            self.exiftool_pool = None
+        if not self.exiftool_backend.available(self.exiftool_path):
+            log_exiftool.warning("ExifTool路径无效，暂不启动ExifTool进程")
+            return
+        pool_size = self.pool_size_spin.value() if hasattr(self, 'pool_size_spin') else 2
+        self.exiftool_pool = ExifToolPool(self.exiftool_path, size=pool_size, call_timeout=self.exiftool_timeout,
+                                          backend=self.exiftool_backend)
+        self.exiftool_pool.start()
+        log_exiftool.info("正在后台启动%d个ExifTool进程: %s", pool_size, self.exiftool_path)
+
+    def update_pool_status(self):
+        """在界面上显示ExifTool进程池的状态"""
+        if not hasattr(self, 'pool_status_label'):
+            return
+        if self.exiftool_pool is None:
+            self.pool_status_label.setText("进程: 未启动")
+            return
+        health = self.exiftool_pool.health()
+        text = f"ExifTool {self.exiftool_info['version']} | " if self.exiftool_info.get("version") else ""
+        text += f"进程: 存活 {health['alive']}/{health['size']}, 忙碌 {health['busy']}, 重启 {health['restarts']}"
+        if health["warming"]:
+            text += f", 启动中 {health['warming']}"
+        self.pool_status_label.setText(text)
+
+    def closeEvent(self, event):
+        if self.exiftool_pool is not None:
+            self.exiftool_pool.close()
+        super().closeEvent(event)
     
     def _init_metadata_options(self):
-        """初始化所有元数据选项"""
-        # Camera makes and models
-        self.metadata_options = {
-            "make": ["Apple", "Samsung", "Huawei", "Xiaomi", "Google", "OnePlus", "OPPO", "Vivo", "Sony", "LG", 
-                     "Nokia", "Motorola", "Honor", "Realme", "ZTE", "Asus", "Lenovo", "Meizu", "Canon", "Nikon", 
-                     "Panasonic", "Fujifilm", "Olympus", "Pentax", "Leica", "GoPro", "DJI"],
-            "model": {
-                "Apple": ["iPhone 15 Pro Max", "iPhone 15 Pro", "iPhone 15 Plus", "iPhone 15", 
-                          "iPhone 14 Pro Max", "iPhone 14 Pro", "iPhone 14 Plus", "iPhone 14",
-                          "iPhone 13 Pro Max", "iPhone 13 Pro", "iPhone 13", "iPhone 13 Mini",
-                          "iPhone 12 Pro Max", "iPhone 12 Pro", "iPhone 12", "iPhone 12 Mini",
-                          "iPhone 11 Pro Max", "iPhone 11 Pro", "iPhone 11", "iPhone XS Max", 
-                          "iPhone XS", "iPhone XR", "iPhone X", "iPhone SE (3rd gen)", 
-                          "iPhone SE (2nd gen)", "iPad Pro 12.9-inch (6th gen)", "iPad Pro 11-inch (4th gen)"],
-                "Samsung": ["Galaxy S23 Ultra", "Galaxy S23+", "Galaxy S23", "Galaxy S22 Ultra", 
-                            "Galaxy S22+", "Galaxy S22", "Galaxy S21 FE", "Galaxy S21 Ultra", 
-                            "Galaxy S21+", "Galaxy S21", "Galaxy Z Fold5", "Galaxy Z Fold4", 
-                            "Galaxy Z Fold3", "Galaxy Z Flip5", "Galaxy Z Flip4", "Galaxy Z Flip3",
-                            "Galaxy Note 20 Ultra", "Galaxy Note 20", "Galaxy A54", "Galaxy A53",
-                            "Galaxy A34", "Galaxy A33", "Galaxy M34", "Galaxy F54"],
-                "Huawei": ["P60 Pro", "P60", "P50 Pro", "P50", "P40 Pro+", "P40 Pro", "P40", 
-                           "Mate 50 Pro", "Mate 50", "Mate 40 Pro+", "Mate 40 Pro", "Mate 40", 
-                           "Mate 30 Pro", "Mate 30", "Mate X3", "Mate X2", "Mate Xs2", "Mate Xs",
-                           "Nova 12 Pro", "Nova 12", "Nova 11 Pro", "Nova 11", "Nova 10 Pro", "Nova 10"],
-                "Xiaomi": ["Xiaomi 13 Ultra", "Xiaomi 13 Pro", "Xiaomi 13", "Xiaomi 13 Lite", 
-                           "Xiaomi 12 Ultra", "Xiaomi 12 Pro", "Xiaomi 12", "Xiaomi 12 Lite", 
-                           "Xiaomi 12S Ultra", "Xiaomi 12S Pro", "Xiaomi 12S", "Xiaomi 11 Ultra", 
-                           "Xiaomi 11 Pro", "Xiaomi 11", "Redmi Note 12 Pro+", "Redmi Note 12 Pro", 
-                           "Redmi Note 12", "Redmi Note 11 Pro+", "Redmi Note 11 Pro", "Redmi Note 11",
-                           "POCO F5 Pro", "POCO F5", "POCO F4 GT", "POCO F4", "POCO X5 Pro", "POCO X5"],
-                "Google": ["Pixel 7 Pro", "Pixel 7", "Pixel 7a", "Pixel 6 Pro", "Pixel 6", "Pixel 6a",
-                           "Pixel 5", "Pixel 5a", "Pixel 4 XL", "Pixel 4", "Pixel 4a", "Pixel 3 XL", 
-                           "Pixel 3", "Pixel 3a XL", "Pixel 3a", "Pixel Fold"],
-                "OnePlus": ["OnePlus 11", "OnePlus 10 Pro", "OnePlus 10T", "OnePlus 10R", "OnePlus 9 Pro", 
-                            "OnePlus 9", "OnePlus 9R", "OnePlus 9RT", "OnePlus 8 Pro", "OnePlus 8", "OnePlus 8T", 
-                            "OnePlus Nord 3", "OnePlus Nord 2T", "OnePlus Nord 2", "OnePlus Nord CE 3", "OnePlus Nord CE 2"],
-                "OPPO": ["Find X6 Pro", "Find X6", "Find X5 Pro", "Find X5", "Find X5 Lite", "Find X3 Pro",
-                         "Find X3", "Find X3 Lite", "Find X3 Neo", "Find N2 Flip", "Find N2", "Find N",
-                         "Reno10 Pro+", "Reno10 Pro", "Reno10", "Reno9 Pro+", "Reno9 Pro", "Reno9",
-                         "Reno8 Pro+", "Reno8 Pro", "Reno8", "F23", "F21 Pro", "F19 Pro+"],
-                "Vivo": ["X90 Pro+", "X90 Pro", "X90", "X80 Pro", "X80", "X70 Pro+", "X70 Pro", "X70",
-                         "X60 Pro+", "X60 Pro", "X60", "V29 Pro", "V29", "V27 Pro", "V27", "V25 Pro", "V25",
-                         "V23 Pro", "V23", "Y100", "Y77", "Y73", "Y55"],
-                "Sony": ["Xperia 1 V", "Xperia 1 IV", "Xperia 1 III", "Xperia 1 II", "Xperia 1",
-                         "Xperia 5 IV", "Xperia 5 III", "Xperia 5 II", "Xperia 5", "Xperia 10 V", 
-                         "Xperia 10 IV", "Xperia 10 III", "Xperia 10 II", "Xperia 10", "Xperia Pro-I", "Xperia Pro"],
-                "LG": ["V60 ThinQ", "V50 ThinQ", "V40 ThinQ", "G8 ThinQ", "G7 ThinQ", "Velvet", "Wing", "K92", "K52", "K42", "Stylo 6"],
-                "Nokia": ["X30", "X20", "X10", "G60", "G50", "G21", "G20", "G10", "C32", "C22", "C21", "C12", "C02"],
-                "Motorola": ["Edge 40 Pro", "Edge 40", "Edge 30 Ultra", "Edge 30 Pro", "Edge 30", "Edge 20 Pro", 
-                             "Edge 20", "Razr 40 Ultra", "Razr 40", "Moto G84", "Moto G73", "Moto G72", "Moto G53", "Moto G52"],
-                "Honor": ["Magic5 Pro", "Magic5", "Magic4 Pro", "Magic4", "Magic V2", "Magic Vs", "Magic V",
-                          "Honor 90 Pro", "Honor 90", "Honor 80 Pro", "Honor 80", "Honor 70 Pro+", "Honor 70 Pro", "Honor 70"],
-                "Realme": ["GT 5 Pro", "GT 5", "GT 3 Pro", "GT 3", "GT Neo5", "GT Neo3", "GT Neo2", "GT Neo",
-                           "11 Pro+", "11 Pro", "11", "10 Pro+", "10 Pro", "10", "9 Pro+", "9 Pro", "9"],
-                "ZTE": ["Axon 40 Ultra", "Axon 30 Ultra", "Axon 20", "Blade A73", "Blade A72", "Blade A52"],
-                "Asus": ["Zenfone 10", "Zenfone 9", "Zenfone 8", "ROG Phone 7 Ultimate", "ROG Phone 7", "ROG Phone 6"],
-                "Lenovo": ["Legion Phone Duel 2", "Legion Phone Duel", "K14 Plus", "K14", "K13", "K12 Pro"],
-                "Meizu": ["20 Pro", "20", "18 Pro", "18", "17 Pro", "17", "16s Pro", "16s"],
-                "Canon": ["EOS R5", "EOS R6 Mark II", "EOS R6", "EOS R7", "EOS R10", "EOS R50", 
-                          "EOS 5D Mark IV", "EOS 6D Mark II", "EOS 90D", "EOS 850D", "PowerShot G7 X Mark III"],
-                "Nikon": ["Z9", "Z8", "Z7 II", "Z6 II", "Z5", "Z50", "Z30", "D850", "D780", "D7500", "D5600", "D3500", "COOLPIX P1000"],
-                "Panasonic": ["Lumix DC-S5 II", "Lumix DC-S5", "Lumix DC-S1R", "Lumix DC-S1", "Lumix DC-G9", "Lumix DC-GH6", "Lumix DC-GH5 II"],
-                "Fujifilm": ["X-T5", "X-T4", "X-T3", "X-H2S", "X-H2", "X-H1", "X-Pro3", "X-Pro2", "X-E4", "X-S20", "X-S10", "GFX 100S", "GFX 50S II"],
-                "Olympus": ["OM-1", "OM-5", "OM-D E-M1 Mark III", "OM-D E-M5 Mark III", "OM-D E-M10 Mark IV", "PEN E-P7", "Tough TG-6"],
-                "Pentax": ["K-3 Mark III", "K-1 Mark II", "K-70", "KP", "645Z"],
-                "Leica": ["M11", "M10-R", "M10-P", "M10", "Q3", "Q2", "SL2-S", "SL2", "CL", "TL2", "D-Lux 7"],
-                "GoPro": ["HERO11 Black", "HERO10 Black", "HERO9 Black", "HERO8 Black", "MAX"],
-                "DJI": ["Mavic 3 Pro", "Mavic 3", "Air 3", "Air 2S", "Mini 3 Pro", "Mini 3", "Mini 2", "Osmo Action 3", "Osmo Action 2"]
-            },
-            "software": ["iOS 17.2", "iOS 17.1", "iOS 17.0", "iOS 16.7", "iOS 16.6", "iOS 16.5", "iOS 16.4", "iOS 16.3", "iOS 16.2", "iOS 16.1", "iOS 16.0", 
-                         "iOS 15.7", "iOS 15.6", "iOS 15.5", "iOS 15.4", "iOS 15.3", "iOS 15.2", "iOS 15.1", "iOS 15.0",
-                         "Android 14", "Android 13", "Android 12L", "Android 12", "Android 11", "Android 10",
-                         "HarmonyOS 4.0", "HarmonyOS 3.1", "HarmonyOS 3.0", "HarmonyOS 2.0",
-                         "One UI 6.0", "One UI 5.1", "One UI 5.0", "One UI 4.1", "One UI 4.0", "One UI 3.1",
-                         "MIUI 14", "MIUI 13", "MIUI 12.5", "MIUI 12", "MIUI 11",
-                         "ColorOS 14", "ColorOS 13", "ColorOS 12", "ColorOS 11",
-                         "OxygenOS 14", "OxygenOS 13", "OxygenOS 12", "OxygenOS 11",
-                         "Funtouch OS 14", "Funtouch OS 13", "Funtouch OS 12", "Funtouch OS 11",
-                         "Realme UI 5.0", "Realme UI 4.0", "Realme UI 3.0", "Realme UI 2.0",
-                         "MagicOS 8.0", "MagicOS 7.0", "MagicOS 6.0",
-                         "Origin OS 3", "Origin OS 2", "Origin OS",
-                         "Flyme 10", "Flyme 9", "Flyme 8",
-                         "Adobe Photoshop 2024", "Adobe Photoshop 2023", "Adobe Photoshop 2022", "Adobe Photoshop 2021",
-                         "Adobe Lightroom Classic 12.5", "Adobe Lightroom Classic 12.0", "Adobe Lightroom Classic 11.0",
-                         "Adobe Lightroom 7.5", "Adobe Lightroom 7.0", "Adobe Lightroom 6.0",
-                         "Capture One 23", "Capture One 22", "Capture One 21",
-                         "DxO PhotoLab 7", "DxO PhotoLab 6", "DxO PhotoLab 5",
-                         "Luminar AI", "Luminar Neo", "Affinity Photo 2", "Affinity Photo",
-                         "Canon Digital Photo Professional 4", "Nikon NX Studio", "Sony Imaging Edge"],
-            "lens_model": ["Wide camera", "Ultra Wide camera", "Telephoto camera", "Periscope Telephoto camera", 
-                          "Front camera", "Dual lens camera", "Main camera", "Selfie camera", "Macro camera", "Portrait camera",
-                          "Canon EF 24-70mm f/2.8L II USM", "Canon EF 70-200mm f/2.8L IS III USM", "Canon RF 24-70mm F2.8 L IS USM", 
-                          "Canon RF 50mm F1.2 L USM", "Canon RF 70-200mm F2.8 L IS USM", "Canon RF 100-500mm F4.5-7.1 L IS USM",
-                          "Nikon AF-S 24-70mm f/2.8E ED VR", "Nikon AF-S 70-200mm f/2.8E FL ED VR", "Nikon Z 24-70mm f/2.8 S", 
-                          "Nikon Z 50mm f/1.8 S", "Nikon Z 70-200mm f/2.8 VR S", "Nikon Z 100-400mm f/4.5-5.6 VR S",
-                          "Sony FE 24-70mm F2.8 GM II", "Sony FE 70-200mm F2.8 GM OSS II", "Sony FE 16-35mm F2.8 GM", 
-                          "Sony FE 50mm F1.2 GM", "Sony FE 100-400mm F4.5-5.6 GM OSS", "Sony FE 200-600mm F5.6-6.3 G OSS",
-                          "ZEISS Otus 55mm f/1.4", "ZEISS Otus 85mm f/1.4", "ZEISS Batis 25mm f/2", 
-                          "Sigma 35mm F1.4 DG HSM Art", "Sigma 85mm F1.4 DG HSM Art", "Sigma 24-70mm F2.8 DG DN Art",
-                          "Tamron 28-75mm F/2.8 Di III VXD G2", "Tamron 70-180mm F/2.8 Di III VXD", "Tamron 17-28mm F/2.8 Di III RXD"],
-            "exposure_time": ["1/15", "1/30", "1/60", "1/120", "1/240", "1/480", "1/960", "1/1000"],
-            "fnumber": ["1.6", "1.8", "2.0", "2.2", "2.4", "2.8", "4.0"],
-            "iso": ["32", "64", "100", "200", "400", "800", "1600", "3200"],
-            "focal_length": ["3.5mm", "4.2mm", "5.7mm", "6.0mm", "7.5mm", "9.0mm", "10.8mm"],
-            "white_balance": ["Auto", "Manual", "Daylight", "Cloudy", "Tungsten", "Fluorescent"],
-            "flash": ["No Flash", "Flash Fired", "Flash Not Fired", "Auto Flash", "Red-eye Reduction"],
-            "orientation": ["Horizontal (normal)", "Mirror horizontal", "Rotate 180", "Mirror vertical", 
-                            "Mirror horizontal and rotate 270 CW", "Rotate 90 CW", "Mirror horizontal and rotate 90 CW", "Rotate 270 CW"],
-            "latitude_ref": ["N", "S"],
-            "longitude_ref": ["E", "W"],
-            "altitude_ref": ["Above Sea Level", "Below Sea Level"],
-            "country": ["United States", "China", "Japan", "Germany", "United Kingdom", "France", "Italy", 
-                        "Canada", "Australia", "Spain", "Russia", "Brazil", "India", "South Korea", "Mexico", "Taiwan"]
-        }
-        
-        # 中文元数据选项
-        self.metadata_options_cn = {
-            "white_balance": ["自动", "手动", "日光", "阴天", "钨丝灯", "荧光灯"],
-            "flash": ["无闪光灯", "闪光灯已触发", "闪光灯未触发", "自动闪光灯", "红眼减轻"],
-            "orientation": ["水平（正常）", "水平镜像", 
-                            "水平镜像并逆时针旋转270度", "顺时针旋转90度", "水平镜像并逆时针旋转90度", "逆时针旋转270度"],
-            "latitude_ref": ["北纬", "南纬"],
-            "longitude_ref": ["东经", "西经"],
-            "altitude_ref": ["海平面以上", "海平面以下"],
-            "country": ["美国", "中国", "日本", "德国", "英国", "法国", "意大利", 
-                        "加拿大", "澳大利亚", "西班牙", "俄罗斯", "巴西", "印度", "韩国", "墨西哥", "台湾"]
-        }
-        
-        # 英文到中文的映射
-        self.en_to_cn_mapping = {
-            "white_balance": {
-                "Auto": "自动", "Manual": "手动", "Daylight": "日光", 
-                "Cloudy": "阴天", "Tungsten": "钨丝灯", "Fluorescent": "荧光灯"
-            },
-            "flash": {
-                "No Flash": "无闪光灯", "Flash Fired": "闪光灯已触发", 
-                "Flash Not Fired": "闪光灯未触发", "Auto Flash": "自动闪光灯", 
-                "Red-eye Reduction": "红眼减轻"
-            },
-            "latitude_ref": {"N": "北纬", "S": "南纬"},
-            "longitude_ref": {"E": "东经", "W": "西经"},
-            "altitude_ref": {"Above Sea Level": "海平面以上", "Below Sea Level": "海平面以下"}
-        }
-        
-        # 中文到英文的映射
-        self.cn_to_en_mapping = {
-            "white_balance": {
-                "自动": "Auto", "手动": "Manual", "日光": "Daylight", 
-                "阴天": "Cloudy", "钨丝灯": "Tungsten", "荧光灯": "Fluorescent"
-            },
-            "flash": {
-                "无闪光灯": "No Flash", "闪光灯已触发": "Flash Fired", 
-                "闪光灯未触发": "Flash Not Fired", "自动闪光灯": "Auto Flash", 
-                "红眼减轻": "Red-eye Reduction"
-            },
-            "latitude_ref": {"北纬": "N", "南纬": "S"},
-            "longitude_ref": {"东经": "E", "西经": "W"},
-            "altitude_ref": {"海平面以上": "Above Sea Level", "海平面以下": "Below Sea Level"}
-        }
+        """从metadata_options.json加载所有元数据选项，并合并device_profiles目录中的用户设备配置"""
+        try:
+            self.options = MetadataOptions.load()
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(None, "错误", f"无法加载元数据选项文件:\n{e}")
+            sys.exit(1)
+        self.metadata_options = self.options.metadata_options
+        self.metadata_options_cn = self.options.metadata_options_cn
+        self.en_to_cn_mapping = self.options.en_to_cn_mapping
+        self.cn_to_en_mapping = self.options.cn_to_en_mapping
     
     def check_exiftool_path(self):
+        """确定ExifTool路径：已保存的路径 → PATH和常见安装位置 → 后台有限深度搜索
+
+        找到的路径连同版本和功能信息一起缓存，之后启动时直接使用，不再搜索。
+        """
+        # 替身后端不需要真实的可执行文件
+        if self.exiftool_backend is not SUBPROCESS_BACKEND:
+            self.exiftool_path = f"{self.exiftool_backend.name}-exiftool"
+            self.exiftool_path_edit.setText(self.exiftool_path) if hasattr(self, 'exiftool_path_edit') else None
+            self.exiftool_info = ExifToolLocator.probe(self.exiftool_path, backend=self.exiftool_backend) or {}
+            return
+
         # 首先尝试从已保存的设置中获取路径
         settings = QSettings("ImageMetadataEditor", "settings")
         saved_path = settings.value("exiftool_path", "")
@@ -319,10 +3933,11 @@ class ImageMetadataEditor(QMainWindow):
         if saved_path and os.path.exists(saved_path):
             self.exiftool_path = saved_path
             self.exiftool_path_edit.setText(self.exiftool_path) if hasattr(self, 'exiftool_path_edit') else None
-            print(f"使用保存的ExifTool路径: {self.exiftool_path}")
+            log_exiftool.info("使用保存的ExifTool路径: %s", self.exiftool_path)
+            self._load_exiftool_info()
             return
         
-        # 检查默认安装路径
+        # 检查PATH和默认安装路径（只检查文件是否存在，不遍历目录）
         user_profile = os.environ.get('USERPROFILE', '')
         username = os.path.basename(user_profile) if user_profile else "九筒"  # 默认使用九筒作为用户名
         
@@ -344,77 +3959,109 @@ class ImageMetadataEditor(QMainWindow):
             "C:\\Windows\\System32\\exiftool.exe",
         ]
         
-        # 打印所有检查的路径以便调试
-        print("正在检查以下ExifTool路径:")
-        for path in default_paths:
-            print(f"  - {path}")
-        
-        for path in default_paths:
-            if os.path.exists(path):
-                self.exiftool_path = path
-                # 保存找到的路径
-                settings.setValue("exiftool_path", self.exiftool_path)
-                # 如果UI已经初始化，则更新路径显示
-                if hasattr(self, 'exiftool_path_edit'):
-                    self.exiftool_path_edit.setText(self.exiftool_path)
-                print(f"找到并使用ExifTool路径: {self.exiftool_path}")
-                return
+        path = ExifToolLocator.find_quick(default_paths)
+        if path:
+            log_exiftool.info("找到并使用ExifTool路径: %s", path)
+            self._set_exiftool_path(path)
+            return
         
-        # 如果没有找到，尝试搜索可能的目录
+        # 没有找到时在后台搜索可能的目录，限制搜索深度和时间，窗口照常显示
         possible_directories = [
             f"C:\\Users\\{username}\\Desktop",
             os.path.join(os.environ.get('USERPROFILE', ''), "Desktop"),
             os.path.join(os.environ.get('USERPROFILE', ''), "Downloads"),
             os.getcwd()
         ]
-        
-        for directory in possible_directories:
-            if os.path.exists(directory):
-                for root, dirs, files in os.walk(directory):
-                    for file in files:
-                        if file.lower() in ["exiftool.exe", "exiftool(-k).exe", "exiftool.pl"]:
-                            full_path = os.path.join(root, file)
-                            self.exiftool_path = full_path
-                            settings.setValue("exiftool_path", self.exiftool_path)
-                            if hasattr(self, 'exiftool_path_edit'):
-                                self.exiftool_path_edit.setText(self.exiftool_path)
-                            print(f"在目录搜索中找到ExifTool路径: {self.exiftool_path}")
-                            return
-        
-        # 如果没有找到，提示用户手动指定
-        def show_exiftool_dialog():
-            msg = QMessageBox()
-            msg.setWindowTitle("未找到ExifTool")
-            msg.setText("未能找到ExifTool可执行文件。是否指定其位置？\n\n请检查您的ExifTool是否已解压到桌面，路径示例：\nC:\\Users\\九筒\\Desktop\\exiftool-13.27_64\\exiftool.exe")
-            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
-            msg.setDefaultButton(QMessageBox.Yes)
-            
-            if msg.exec_() == QMessageBox.Yes:
-                path, _ = QFileDialog.getOpenFileName(
-                    None, "选择ExifTool可执行文件", "", "可执行文件 (*.exe);;Perl脚本 (*.pl);;所有文件 (*.*)"
-                )
-                if path and os.path.exists(path):
-                    self.exiftool_path = path
-                    # 保存用户选择的路径
-                    settings.setValue("exiftool_path", self.exiftool_path)
-                    # 如果UI已经初始化，则更新路径显示
-                    if hasattr(self, 'exiftool_path_edit'):
-                        self.exiftool_path_edit.setText(self.exiftool_path)
-                    print(f"用户手动选择ExifTool路径: {self.exiftool_path}")
-                else:
-                    show_exiftool_dialog()  # 如果用户取消，再次显示对话框
+        self._start_exiftool_search(possible_directories)
+
+    def _set_exiftool_path(self, path):
+        """使用新的ExifTool路径：保存设置、更新界面并读取版本信息"""
+        self.exiftool_path = path
+        self.settings.setValue("exiftool_path", self.exiftool_path)
+        # 如果UI已经初始化，则更新路径显示
+        if hasattr(self, 'exiftool_path_edit'):
+            self.exiftool_path_edit.setText(self.exiftool_path)
+        self._load_exiftool_info()
+
+    def _start_exiftool_search(self, directories):
+        log_exiftool.info("正在后台搜索ExifTool: %s", ", ".join(directories))
+        self._exiftool_search = {"done": False, "path": None}
+        search = self._exiftool_search
+
+        def run():
+            search["path"] = ExifToolLocator.deep_search(directories)
+            search["done"] = True
+
+        threading.Thread(target=run, daemon=True).start()
+        self.exiftool_search_timer = QTimer(self)
+        self.exiftool_search_timer.timeout.connect(self._check_exiftool_search)
+        self.exiftool_search_timer.start(200)
+
+    def _check_exiftool_search(self):
+        if not self._exiftool_search["done"]:
+            return
+        self.exiftool_search_timer.stop()
+        path = self._exiftool_search["path"]
+        if path:
+            log_exiftool.info("在目录搜索中找到ExifTool路径: %s", path)
+            self._set_exiftool_path(path)
+            self.start_exiftool()
+        else:
+            self.show_exiftool_dialog()
+
+    def show_exiftool_dialog(self):
+        """未找到ExifTool时提示用户手动指定"""
+        msg = QMessageBox()
+        msg.setWindowTitle("未找到ExifTool")
+        msg.setText("未能找到ExifTool可执行文件。是否指定其位置？\n\n请检查您的ExifTool是否已解压到桌面，路径示例：\nC:\\Users\\九筒\\Desktop\\exiftool-13.27_64\\exiftool.exe")
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        msg.setDefaultButton(QMessageBox.Yes)
+        
+        if msg.exec_() == QMessageBox.Yes:
+            path, _ = QFileDialog.getOpenFileName(
+                None, "选择ExifTool可执行文件", "", "可执行文件 (*.exe);;Perl脚本 (*.pl);;所有文件 (*.*)"
+            )
+            if path and os.path.exists(path):
+                log_exiftool.info("用户手动选择ExifTool路径: %s", path)
+                self._set_exiftool_path(path)
+                self.start_exiftool()
             else:
-                # 用户选择No，提示将无法使用程序
-                QMessageBox.critical(
-                    None, "错误", 
-                    "ExifTool是本应用程序正常运行所必需的。"
-                    "请从https://exiftool.org/下载并重试。"
-                )
-                sys.exit(1)
-        
-        # 在主窗口初始化完成后显示对话框
-        QCoreApplication.processEvents()
-        show_exiftool_dialog()
+                self.show_exiftool_dialog()  # 如果用户取消，再次显示对话框
+        else:
+            # 用户选择No，提示将无法使用程序
+            QMessageBox.critical(
+                None, "错误", 
+                "ExifTool是本应用程序正常运行所必需的。"
+                "请从https://exiftool.org/下载并重试。"
+            )
+            QApplication.exit(1)
+
+    def _load_exiftool_info(self):
+        """读取缓存的ExifTool版本和功能信息，可执行文件变化后在后台重新检测"""
+        self.exiftool_info = {}
+        signature = ExifToolLocator.signature(self.exiftool_path)
+        if signature and self.settings.value("exiftool_signature", "") == signature:
+            try:
+                self.exiftool_info = json.loads(self.settings.value("exiftool_info", "{}"))
+                log_exiftool.info("ExifTool版本: %s", self.exiftool_info.get("version", "未知"))
+                return
+            except ValueError:
+                pass
+
+        path = self.exiftool_path
+
+        def run():
+            info = ExifToolLocator.probe(path)
+            if not info or path != self.exiftool_path:
+                return
+            self.exiftool_info = info
+            settings = QSettings("ImageMetadataEditor", "settings")
+            settings.setValue("exiftool_signature", signature)
+            settings.setValue("exiftool_info", json.dumps(info))
+            log_exiftool.info("检测到ExifTool版本: %s, 可写入的文件类型: %d 种",
+                              info.get("version", "未知"), len(info.get("writable_extensions", [])))
+
+        threading.Thread(target=run, daemon=True).start()
     
     def init_ui(self):
         central_widget = QWidget()
@@ -433,11 +4080,72 @@ class ImageMetadataEditor(QMainWindow):
         
         exiftool_browse_button = QPushButton("设置ExifTool路径...")
         exiftool_browse_button.clicked.connect(self.browse_exiftool)
-        
+
+        # 恢复中断的批处理任务
+        resume_job_button = QPushButton("恢复中断的任务")
+        resume_job_button.clicked.connect(self.resume_job)
+        resume_job_button.setToolTip("继续上次未完成的批处理任务，跳过已完成的文件并使用原计划的元数据")
+
+        # 试运行：只生成执行计划，之后可以直接执行保存的计划
+        self.dry_run_check = QCheckBox("试运行")
+        self.dry_run_check.setToolTip("应用元数据时不修改文件，只生成每个文件要写入的字段和ExifTool参数，\n保存为jobs文件夹中的plan_*.jsonl计划文件，并根据本机实测的耗时估算总时间")
+        self.dry_run_check.setChecked(self.settings.value("dry_run", False, type=bool))
+        self.dry_run_check.toggled.connect(lambda checked: self.settings.setValue("dry_run", checked))
+        execute_plan_button = QPushButton("执行计划...")
+        execute_plan_button.clicked.connect(self.execute_plan)
+        execute_plan_button.setToolTip("执行之前试运行保存的计划，不再重新生成随机值，也不再读取文件比较")
+
+        # 流水线批量写入模式
+        self.stream_mode_check = QCheckBox("流水线批量写入")
+        self.stream_mode_check.setToolTip("批量处理时在同一个ExifTool进程中连续提交所有文件的命令，\n不必等待上一个文件完成，适合大量文件")
+        self.stream_mode_check.setChecked(self.settings.value("stream_mode", True, type=bool))
+        self.stream_mode_check.toggled.connect(lambda checked: self.settings.setValue("stream_mode", checked))
+
+        # 处理结果的结构化记录格式
+        self.result_format_combo = QComboBox()
+        self.result_format_combo.addItem("不记录结果", "")
+        self.result_format_combo.addItem("结果记录: JSONL", "jsonl")
+        self.result_format_combo.addItem("结果记录: CSV", "csv")
+        self.result_format_combo.setToolTip("批处理时把每个文件的结果（状态、错误、写入的标签、耗时、字节数）\n边处理边写入jobs文件夹中的result_*文件，便于审计和导入其他工具")
+        index = self.result_format_combo.findData(self.settings.value("result_format", "jsonl"))
+        self.result_format_combo.setCurrentIndex(max(index, 0))
+        self.result_format_combo.currentIndexChanged.connect(
+            lambda _: self.settings.setValue("result_format", self.result_format_combo.currentData()))
+
+        # ExifTool进程池大小和状态
+        self.pool_size_spin = QSpinBox()
+        self.pool_size_spin.setRange(1, 8)
+        self.pool_size_spin.setPrefix("进程数: ")
+        self.pool_size_spin.setValue(self.settings.value("exiftool_pool_size", 2, type=int))
+        self.pool_size_spin.setToolTip("程序启动时预先启动的ExifTool进程数量，修改后立即重启进程池")
+        self.pool_size_spin.valueChanged.connect(self.on_pool_size_changed)
+        self.pool_status_label = QLabel("进程: 未启动")
+        self.pool_status_timer = QTimer(self)
+        self.pool_status_timer.timeout.connect(self.update_pool_status)
+        self.pool_status_timer.start(1000)
+
         exiftool_layout.addWidget(self.exiftool_path_edit)
         exiftool_layout.addWidget(exiftool_browse_button)
+        exiftool_layout.addWidget(self.pool_size_spin)
+        exiftool_layout.addWidget(self.pool_status_label)
+        exiftool_layout.addWidget(self.stream_mode_check)
+        exiftool_layout.addWidget(self.result_format_combo)
         exiftool_group.setLayout(exiftool_layout)
         main_layout.addWidget(exiftool_group)
+
+        # 任务和执行计划的操作单独放一行，避免ExifTool设置行过宽
+        job_group = QGroupBox("批处理任务")
+        job_layout = QHBoxLayout()
+        perf_button = QPushButton("性能统计")
+        perf_button.setToolTip("查看读取、写入、图片解码等各阶段的耗时分布，可导出为JSON")
+        perf_button.clicked.connect(self.show_perf_panel)
+        job_layout.addWidget(resume_job_button)
+        job_layout.addWidget(self.dry_run_check)
+        job_layout.addWidget(execute_plan_button)
+        job_layout.addStretch()
+        job_layout.addWidget(perf_button)
+        job_group.setLayout(job_layout)
+        main_layout.addWidget(job_group)
         
         # Create a horizontal splitter to divide image preview and controls
         splitter = QSplitter(Qt.Horizontal)
@@ -490,6 +4198,11 @@ class ImageMetadataEditor(QMainWindow):
         add_file_button.clicked.connect(self.browse_file)
         add_file_button.setToolTip("选择一个或多个图片文件")
         
+        # 添加文件夹按钮（包含子文件夹）
+        add_folder_button = QPushButton("添加文件夹")
+        add_folder_button.clicked.connect(self.browse_folder)
+        add_folder_button.setToolTip("添加文件夹及其所有子文件夹中的图片，也可以直接拖放文件夹")
+        
         # 清除文件按钮
         clear_files_button = QPushButton("清除全部")
         clear_files_button.clicked.connect(self.clear_file_list)
@@ -509,34 +4222,55 @@ class ImageMetadataEditor(QMainWindow):
         sort_button = QPushButton("排序")
         sort_button.setToolTip("对文件列表进行排序")
         sort_button.clicked.connect(self.show_sort_menu)
+
+        # 按元数据筛选（选中匹配的文件）
+        filter_button = QPushButton("筛选")
+        filter_button.setToolTip("按品牌、型号、镜头或拍摄时间选中文件")
+        filter_button.clicked.connect(self.filter_files_by_metadata)
         
         # 添加批处理提示
         batch_label = QLabel("提示: 支持批量修改多个文件")
         batch_label.setStyleSheet("color: #666; font-style: italic; font-size: 10px;")
         
         file_buttons_layout.addWidget(add_file_button)
+        file_buttons_layout.addWidget(add_folder_button)
         file_buttons_layout.addWidget(clear_files_button)
         file_buttons_layout.addWidget(select_all_button)
         file_buttons_layout.addWidget(invert_selection_button)
         file_buttons_layout.addWidget(sort_button)
+        file_buttons_layout.addWidget(filter_button)
         
         file_list_layout.addLayout(file_buttons_layout)
         file_list_layout.addWidget(batch_label)
         
-        # 文件列表 - 使用QListWidget
-        self.file_list = QListWidget()
+        # 文件列表 - 使用QListView，数据来自FileTable，只有可见的行才会被绘制
+        self.file_list_model = FileListModel(self.file_table, self)
+        self.file_list_model.dataChanged.connect(lambda *args: self.update_progress_label())
+        self.file_list = QListView()
+        self.file_list.setModel(self.file_list_model)
         self.file_list.setSelectionMode(QAbstractItemView.NoSelection)  # 不使用自带的选择模式
         self.file_list.setDragEnabled(False)
         self.file_list.setAcceptDrops(True)
         self.file_list.setMinimumHeight(100)
-        self.file_list.itemClicked.connect(self.on_file_clicked)  # 改为点击事件
+        self.file_list.setUniformItemSizes(True)  # 所有行等高，大量文件时滚动和布局更快
+        self.file_list.clicked.connect(self.on_file_clicked)  # 改为点击事件
         
         file_list_layout.addWidget(self.file_list)
         
-        # 添加进度信息标签
+        # 添加进度信息标签，扫描文件夹时显示已找到的文件数和取消按钮
+        progress_layout = QHBoxLayout()
         self.progress_label = QLabel("")
         self.progress_label.setStyleSheet("color: #555; font-size: 10px;")
-        file_list_layout.addWidget(self.progress_label)
+        self.cancel_scan_button = QPushButton("取消扫描")
+        self.cancel_scan_button.clicked.connect(self.cancel_folder_scan)
+        self.cancel_scan_button.setVisible(False)
+        progress_layout.addWidget(self.progress_label, 1)
+        progress_layout.addWidget(self.cancel_scan_button)
+        file_list_layout.addLayout(progress_layout)
+        
+        # 定时把后台扫描到的文件加入列表
+        self.folder_scan_timer = QTimer(self)
+        self.folder_scan_timer.timeout.connect(self._poll_folder_scan)
         
         # 垂直分割预览区和文件列表
         preview_file_splitter = QSplitter(Qt.Vertical)
@@ -578,6 +4312,43 @@ class ImageMetadataEditor(QMainWindow):
         
         self.custom_layout = QVBoxLayout(custom_tab)
         
+        # 自定义模式的字段区域包含大量下拉框和选项，第一次切换到该标签页时才创建
+        self.custom_tab_built = False
+        
+        # 重置设置按钮部分已删除
+        
+        # 添加标签页
+        tab_widget.addTab(random_tab, "随机模式")
+        tab_widget.addTab(custom_scroll, "自定义模式")
+        self.custom_tab_index = tab_widget.indexOf(custom_scroll)
+        tab_widget.currentChanged.connect(self.on_tab_changed)
+        
+        right_layout.addWidget(tab_widget)
+        
+        # 添加左右部件到分隔器
+        splitter.addWidget(left_side)
+        splitter.addWidget(right_widget)
+        splitter.setSizes([400, 600])  # 设置初始大小比例
+        
+        # 添加所有元素到主布局
+        main_layout.addWidget(splitter)
+        
+        self.setCentralWidget(central_widget)
+        
+        # 设置接受拖放
+        self.setAcceptDrops(True)
+    
+    def on_tab_changed(self, index):
+        if index == self.custom_tab_index:
+            self.build_custom_tab()
+
+    def build_custom_tab(self):
+        """创建自定义模式的所有字段，并恢复保存的设置；只在第一次调用时执行"""
+        if self.custom_tab_built:
+            return
+        self.custom_tab_built = True
+        started = time.perf_counter()
+
         # 添加默认设置按钮区域
         default_settings_group = QGroupBox("设置模板")
         default_settings_layout = QHBoxLayout()
@@ -654,32 +4425,16 @@ class ImageMetadataEditor(QMainWindow):
         
         self.custom_layout.addWidget(apply_button)
         
-        # 重置设置按钮部分已删除
-        
-        # 添加标签页
-        tab_widget.addTab(random_tab, "随机模式")
-        tab_widget.addTab(custom_scroll, "自定义模式")
-        
-        right_layout.addWidget(tab_widget)
-        
-        # 添加左右部件到分隔器
-        splitter.addWidget(left_side)
-        splitter.addWidget(right_widget)
-        splitter.setSizes([400, 600])  # 设置初始大小比例
-        
-        # 添加所有元素到主布局
-        main_layout.addWidget(splitter)
-        
-        self.setCentralWidget(central_widget)
-        
         # 初始化品牌和型号的关联
         if hasattr(self, 'make_combo') and hasattr(self, 'model_combo'):
             self.make_combo.currentTextChanged.connect(self.update_model_options)
             # Initialize model options based on default make
             self.update_model_options(self.make_combo.currentText())
         
-        # 设置接受拖放
-        self.setAcceptDrops(True)
+        # 字段创建之前无法恢复的设置，现在恢复
+        self.load_settings()
+        self.load_last_session_settings()
+        log_app.debug("自定义模式界面已创建，耗时 %.0f 毫秒", (time.perf_counter() - started) * 1000)
     
     def add_section_to_custom(self, title, fields):
         group = QGroupBox(title)
@@ -729,47 +4484,11 @@ class ImageMetadataEditor(QMainWindow):
                         if make not in options:
                             combo.addItem(make)
                 
-                # 软件选项添加所有可能的软件版本
-                elif field_name == "software":
-                    # 添加常用移动设备软件
-                    common_software = [
-                        "iOS 17.2", "iOS 17.1", "iOS 17.0", 
-                        "Android 15", "Android 14", "Android 13",
-                        "One UI 7.0", "One UI 6.1", "One UI 6.0", 
-                        "HarmonyOS 4.0", "HarmonyOS 3.1", 
-                        "MIUI 14", "MIUI 13", 
-                        "OxygenOS 14", "OxygenOS 13",
-                        "ColorOS 14", "ColorOS 13",
-                        "Funtouch OS 14", "Funtouch OS 13"
-                    ]
-                    # 添加常用图片编辑软件
-                    photo_software = [
-                        "Adobe Photoshop 2024", "Adobe Lightroom Classic 12.5",
-                        "Capture One 23", "DxO PhotoLab 7",
-                        "Luminar AI", "Affinity Photo 2"
-                    ]
-                    for software in common_software + photo_software:
-                        if software not in options:
-                            combo.addItem(software)
-                
-                # 镜头型号添加常用手机和相机镜头
-                elif field_name == "lens_model":
-                    # 添加手机设备常用镜头
-                    mobile_lenses = [
-                        "Wide camera", "Ultra Wide camera", "Telephoto camera",
-                        "Periscope Telephoto camera", "Front camera", 
-                        "Main camera", "Selfie camera"
-                    ]
-                    # 添加几款常见相机镜头
-                    camera_lenses = [
-                        "Canon EF 24-70mm f/2.8L II USM",
-                        "Nikon Z 24-70mm f/2.8 S",
-                        "Sony FE 24-70mm F2.8 GM II",
-                        "ZEISS Otus 55mm f/1.4"
-                    ]
-                    for lens in mobile_lenses + camera_lenses:
-                        if lens not in options:
-                            combo.addItem(lens)
+                # 软件和镜头型号添加数据文件中的常用补充选项（手机系统、图片编辑软件、常见镜头）
+                elif field_name in self.options.combo_extras:
+                    for extra in self.options.combo_extras[field_name]:
+                        if extra not in options:
+                            combo.addItem(extra)
                 
                 # 为各种特殊字段添加工具提示
                 if field_name == "exposure_time":
@@ -1017,7 +4736,7 @@ class ImageMetadataEditor(QMainWindow):
                 lens_empty_index = self.lens_model_combo.findText("【空数据】")
                 if lens_empty_index >= 0:
                     self.lens_model_combo.setCurrentIndex(lens_empty_index)
-                    print("品牌变更后保持镜头型号为【空数据】")
+                    log_settings.debug("品牌变更后保持镜头型号为【空数据】")
     
     def update_model_options(self, make):
         """根据选择的相机品牌更新型号下拉框选项"""
@@ -1057,29 +4776,14 @@ class ImageMetadataEditor(QMainWindow):
             return
             
         # 根据品牌添加相关软件
-        if make == "Apple":
-            software_list = [s for s in self.metadata_options["software"] if s.startswith("iOS")]
-        elif make == "Samsung":
-            software_list = [s for s in self.metadata_options["software"] if s.startswith("One UI")]
-        elif make == "Huawei":
-            software_list = [s for s in self.metadata_options["software"] if s.startswith("HarmonyOS") or s.startswith("EMUI")]
-        elif make == "Xiaomi":
-            software_list = [s for s in self.metadata_options["software"] if s.startswith("MIUI")]
-        elif make == "Google":
-            software_list = [s for s in self.metadata_options["software"] if s.startswith("Android")]
-        else:
-            software_list = self.metadata_options["software"]
-        
-        # 添加过滤后的软件选项
-        for software in software_list:
-            self.software_combo.addItem(software)
+        self.software_combo.addItems(self.options.software_for(make))
     
     def update_lens_model_options(self, make):
         """根据选择的相机品牌更新镜头型号下拉框选项"""
         # 如果当前已设置为空数据，保留此设置（避免被覆盖）
         if hasattr(self, "lens_model_combo") and self.lens_model_combo.currentText() == "【空数据】":
             # 用户已明确选择空数据，不更改其选择
-            print("保留镜头型号为【空数据】的设置")
+            log_settings.debug("保留镜头型号为【空数据】的设置")
             return
         
         # 清除当前所有项目
@@ -1094,21 +4798,7 @@ class ImageMetadataEditor(QMainWindow):
             return
             
         # 根据品牌添加相关镜头型号
-        if make in ["Apple", "Samsung", "Huawei", "Xiaomi", "Google", "OnePlus", "OPPO", "Vivo"]:
-            # 移动设备品牌使用移动镜头术语
-            lens_list = ["Wide camera", "Ultra Wide camera", "Telephoto camera", "Front camera", "Main camera", "Selfie camera"]
-        elif make in ["Canon", "Nikon", "Sony", "Fujifilm", "Olympus", "Pentax", "Leica"]:
-            # 相机品牌使用带有品牌名称的特定镜头
-            brand_lens_prefix = f"{make} "
-            lens_list = [l for l in self.metadata_options["lens_model"] if l.startswith(brand_lens_prefix) or "mm" in l]
-            if not lens_list:  # 如果没有找到特定品牌的镜头，使用所有镜头
-                lens_list = self.metadata_options["lens_model"]
-        else:
-            lens_list = self.metadata_options["lens_model"]
-        
-        # 添加过滤后的镜头型号选项
-        for lens in lens_list:
-            self.lens_model_combo.addItem(lens)
+        self.lens_model_combo.addItems(self.options.lenses_for(make))
     
     def browse_file(self):
         file_paths, _ = QFileDialog.getOpenFileNames(
@@ -1117,42 +4807,77 @@ class ImageMetadataEditor(QMainWindow):
         if file_paths:
             self.add_files(file_paths)
     
-    def add_files(self, file_paths):
-        """添加文件到列表，使用自定义项目支持复选框"""
-        # 过滤掉已经添加的文件
-        new_files = [path for path in file_paths if path not in self.file_paths]
+    def browse_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择图片文件夹")
+        if folder:
+            self.add_folders([folder])
+    
+    def add_folders(self, folders):
+        """在后台递归扫描文件夹，找到的图片分批加入文件列表"""
+        if self.folder_scanner is not None and not self.folder_scanner.done:
+            QMessageBox.information(self, "提示", "正在扫描文件夹，请等待扫描完成或取消后再添加")
+            return
+        self.folder_scanner = FolderScanner(folders)
+        self.folder_scanner.start()
+        self.cancel_scan_button.setVisible(True)
+        self.folder_scan_timer.start(100)
+        log_scan.info("开始扫描文件夹: %s", ", ".join(folders))
+    
+    def cancel_folder_scan(self):
+        if self.folder_scanner is not None:
+            self.folder_scanner.cancel()
+    
+    def _poll_folder_scan(self):
+        """取回扫描到的文件加入列表；每次只处理一部分，保证界面保持响应"""
+        scanner = self.folder_scanner
+        if scanner is None:
+            self.folder_scan_timer.stop()
+            return
+        if not scanner.canceled:
+            records = scanner.take_batches(max_files=5000)
+            if records:
+                self._add_file_records(records, update_label=False)
+        if scanner.canceled or (scanner.done and not scanner.has_pending()):
+            self.folder_scan_timer.stop()
+            self.cancel_scan_button.setVisible(False)
+            self.update_progress_label()
+            state = "已取消" if scanner.canceled else "完成"
+            log_scan.info("扫描文件夹%s: 找到 %d 个图片，跳过 %d 个非图片文件", state, scanner.found, scanner.rejected)
+            return
+        self.progress_label.setText(
+            f"正在扫描文件夹... 已找到 {scanner.found} 个图片（已检查 {scanner.scanned} 项），"
+            f"列表中共 {len(self.file_table)} 个文件"
+        )
+    
+    def add_files(self, file_paths, update_label=True):
+        """添加文件到列表，已经添加过的文件会被忽略"""
+        self._add_file_records([(os.path.normpath(path), -1, -1) for path in file_paths], update_label)
+    
+    @PERF.timed("model_update")
+    def _add_file_records(self, records, update_label=True):
+        """添加 (路径, 大小, 修改时间) 记录，大小和修改时间未知时为-1，排序时再读取"""
+        first = len(self.file_table)
+        for path, size, mtime_ns in records:
+            self.file_table.add(path, size, mtime_ns)
+        last = len(self.file_table) - 1
         
         # 如果没有新文件，直接返回
-        if not new_files:
+        if last < first:
             return
-        
-        # 添加新文件到列表和UI
-        for file_path in new_files:
-            # 添加到内部存储
-            self.file_paths.append(file_path)
-            
-            # 创建自定义列表项
-            item_widget = FileListItem(file_path)
-            
-            # 添加到QListWidget
-            list_item = QListWidgetItem()
-            self.file_list.addItem(list_item)
-            self.file_list.setItemWidget(list_item, item_widget)
-            
-            # 设置项高度
-            list_item.setSizeHint(item_widget.sizeHint())
+        self.file_list_model.rows_appended(first, last)
         
         # 更新进度标签
-        self.update_progress_label()
+        if update_label:
+            self.update_progress_label()
         
         # 选择第一个文件并更新预览
-        if self.file_list.count() > 0 and not self.current_file_path:
-            self.current_file_path = self.file_paths[0]
+        if not self.current_file_path:
+            self.current_file_path = self.file_table.path(0)
             self.update_image_preview(self.current_file_path)
     
     def clear_file_list(self):
         """清除文件列表"""
-        if self.file_list.count() == 0:
+        if len(self.file_table) == 0:
             return
             
         reply = QMessageBox.question(
@@ -1164,20 +4889,19 @@ class ImageMetadataEditor(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            self.file_list.clear()
-            self.file_paths = []
+            self.cancel_folder_scan()
+            self.file_table.clear()
+            self.file_list_model.refresh()
             self.current_file_path = ""
             self.image_preview.setText("选择图片后显示预览\n支持拖放图片到此处")
             self.image_info.setText("")
             self.update_progress_label()
     
-    def on_file_clicked(self, item):
+    def on_file_clicked(self, index):
         """当点击文件项时，显示预览而不是选中/取消选中"""
-        # 获取对应的自定义widget
-        item_widget = self.file_list.itemWidget(item)
-        if item_widget:
+        file_path = index.data(Qt.UserRole)
+        if file_path:
             # 更新当前文件路径
-            file_path = item_widget.file_path
             self.current_file_path = file_path
             
             # 更新预览
@@ -1185,35 +4909,24 @@ class ImageMetadataEditor(QMainWindow):
     
     def get_checked_files(self):
         """获取所有被选中的文件路径"""
-        checked_files = []
-        for i in range(self.file_list.count()):
-            item = self.file_list.item(i)
-            item_widget = self.file_list.itemWidget(item)
-            if item_widget and item_widget.checkbox.isChecked():
-                checked_files.append(item_widget.file_path)
-        return checked_files
+        return self.file_table.paths(self.file_table.checked_rows())
     
     def select_all_files(self):
         """选中所有文件"""
-        for i in range(self.file_list.count()):
-            item = self.file_list.item(i)
-            item_widget = self.file_list.itemWidget(item)
-            if item_widget:
-                item_widget.checkbox.setChecked(True)
+        self.file_table.set_all_checked(True)
+        self.file_list_model.refresh()
+        self.update_progress_label()
     
     def invert_file_selection(self):
         """反转所有文件的选择状态"""
-        for i in range(self.file_list.count()):
-            item = self.file_list.item(i)
-            item_widget = self.file_list.itemWidget(item)
-            if item_widget:
-                current_state = item_widget.checkbox.isChecked()
-                item_widget.checkbox.setChecked(not current_state)
+        self.file_table.invert_checked()
+        self.file_list_model.refresh()
+        self.update_progress_label()
     
     def update_progress_label(self):
         """更新进度标签"""
-        total_count = self.file_list.count()
-        checked_count = len(self.get_checked_files())
+        total_count = len(self.file_table)
+        checked_count = self.file_table.checked_count()
         
         if total_count == 0:
             self.progress_label.setText("")
@@ -1250,59 +4963,110 @@ class ImageMetadataEditor(QMainWindow):
         name_desc_action = QAction("按文件名字母降序", self)
         name_desc_action.triggered.connect(lambda: self.sort_files("name_desc"))
         sort_menu.addAction(name_desc_action)
+
+        # 按元数据排序，使用元数据索引，只有索引中没有的文件才需要读取
+        sort_menu.addSeparator()
+        taken_asc_action = QAction("按拍摄时间从早到晚", self)
+        taken_asc_action.triggered.connect(lambda: self.sort_files("taken_asc"))
+        sort_menu.addAction(taken_asc_action)
+
+        taken_desc_action = QAction("按拍摄时间从晚到早", self)
+        taken_desc_action.triggered.connect(lambda: self.sort_files("taken_desc"))
+        sort_menu.addAction(taken_desc_action)
+
+        camera_action = QAction("按相机品牌和型号", self)
+        camera_action.triggered.connect(lambda: self.sort_files("camera_asc"))
+        sort_menu.addAction(camera_action)
         
         # 显示菜单
         sort_menu.exec_(QCursor.pos())
     
+    @PERF.timed("model_update")
     def sort_files(self, sort_type):
         """根据指定的排序类型对文件列表进行排序"""
-        if not self.file_paths or self.file_list.count() == 0:
+        table = self.file_table
+        if len(table) == 0:
             return
-            
-        # 收集当前所有文件信息（路径和选择状态）
-        file_items = []
-        for i in range(self.file_list.count()):
-            item = self.file_list.item(i)
-            item_widget = self.file_list.itemWidget(item)
-            if item_widget:
-                file_items.append({
-                    'path': item_widget.file_path,
-                    'checked': item_widget.checkbox.isChecked()
-                })
-        
-        # 根据排序类型对文件进行排序
-        if sort_type == "size_asc":
-            file_items.sort(key=lambda x: os.path.getsize(x['path']))
-        elif sort_type == "size_desc":
-            file_items.sort(key=lambda x: os.path.getsize(x['path']), reverse=True)
-        elif sort_type == "date_asc":
-            file_items.sort(key=lambda x: os.path.getmtime(x['path']))
-        elif sort_type == "date_desc":
-            file_items.sort(key=lambda x: os.path.getmtime(x['path']), reverse=True)
-        elif sort_type == "name_asc":
-            file_items.sort(key=lambda x: os.path.basename(x['path']).lower())
-        elif sort_type == "name_desc":
-            file_items.sort(key=lambda x: os.path.basename(x['path']).lower(), reverse=True)
-        
-        # 清除当前列表并重建
-        sorted_file_paths = [item['path'] for item in file_items]
-        self.file_list.clear()
-        self.file_paths = sorted_file_paths
-        
-        # 重新添加排序后的文件到列表
-        for item in file_items:
-            file_path = item['path']
-            item_widget = FileListItem(file_path)
-            item_widget.checkbox.setChecked(item['checked'])
-            
-            list_item = QListWidgetItem()
-            self.file_list.addItem(list_item)
-            self.file_list.setItemWidget(list_item, item_widget)
-            list_item.setSizeHint(item_widget.sizeHint())
+        
+        # 大小和修改时间只在第一次按它们排序时读取
+        if sort_type in ("size_asc", "size_desc", "date_asc", "date_desc"):
+            table.ensure_stat()
+        
+        # 根据排序类型计算新的行顺序
+        rows = range(len(table))
+        if sort_type in ("size_asc", "size_desc"):
+            key = table.size.__getitem__
+        elif sort_type in ("date_asc", "date_desc"):
+            key = table.mtime.__getitem__
+        elif sort_type in ("name_asc", "name_desc"):
+            key = lambda row: table.name[row].lower()
+        elif sort_type in ("taken_asc", "taken_desc"):
+            tags = self._indexed_tags()
+            key = lambda row: tags[row][3] or ""
+        elif sort_type == "camera_asc":
+            tags = self._indexed_tags()
+            # 没有品牌的文件排在最后
+            key = lambda row: (tags[row][0] is None, (tags[row][0] or "").lower(), (tags[row][1] or "").lower())
+        else:
+            return
+        order = sorted(rows, key=key, reverse=sort_type.endswith("_desc"))
+        
+        # 重新排列文件表并刷新列表
+        table.reorder(order)
+        self.file_list_model.refresh()
         
         # 更新进度标签
         self.update_progress_label()
     
+    def filter_files_by_metadata(self):
+        """只选中品牌、型号、镜头或拍摄时间包含输入文字的文件"""
+        if len(self.file_table) == 0:
+            return
+        text, ok = QInputDialog.getText(self, "按元数据筛选",
+                                        "选中品牌、型号、镜头或拍摄时间包含以下文字的文件（多个条件用空格分隔，需全部满足）:")
+        if not ok:
+            return
+        terms = text.lower().split()
+        tags = self._indexed_tags()
+        checked = bytearray()
+        for values in tags:
+            haystack = " ".join(value for value in values if value).lower()
+            checked.append(1 if all(term in haystack for term in terms) else 0)
+        self.file_table.checked[:] = checked
+        self.file_list_model.refresh()
+        self.update_progress_label()
+
+    def _indexed_tags(self):
+        """返回文件列表中每一行的常用标签 [(品牌, 型号, 镜头, 拍摄时间)]
+
+        优先使用元数据索引（与文件列表中的大小和修改时间一致才有效），
+        索引中没有或已失效的文件才用ExifTool批量读取，读取结果同时写入索引。
+        """
+        table = self.file_table
+        table.ensure_stat()
+        paths = table.paths()
+
+        def valid(row, path):
+            entry = found.get(path)
+            return entry is not None and entry[0] == table.size[row] and entry[1] == table.mtime[row]
+
+        found = self.metadata_index.lookup(paths)
+        missing = [path for row, path in enumerate(paths) if not valid(row, path)]
+        if missing and self.exiftool_backend.available(self.exiftool_path):
+            log_read.info("元数据索引中没有 %d/%d 个文件，用ExifTool读取", len(missing), len(paths))
+            progress_dialog = QProgressDialog("正在读取元数据...", "取消", 0, len(missing), self)
+            progress_dialog.setWindowTitle("读取元数据")
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            progress_dialog.setMinimumDuration(500)
+            try:
+                self._prefetch_metadata(missing, ProgressReporter(progress_dialog, len(missing), "正在读取元数据"))
+            finally:
+                progress_dialog.close()
+                progress_dialog.deleteLater()
+            found.update(self.metadata_index.lookup(missing))
+        empty = (None,) * len(MetadataIndex.TAG_COLUMNS)
+        return [found[path][2:] if valid(row, path) else empty for row, path in enumerate(paths)]
+
     def update_image_preview(self, file_path):
         """更新图片预览和图片信息"""
         if not file_path or not os.path.exists(file_path):
@@ -1313,7 +5077,7 @@ class ImageMetadataEditor(QMainWindow):
         try:
             # 调试信息 - 输出文件路径和扩展名
             file_ext = os.path.splitext(file_path)[1].lower()
-            print(f"正在加载图片: {file_path}, 扩展名: {file_ext}")
+            log_preview.debug("正在加载图片: %s, 扩展名: %s", file_path, file_ext)
             
             # 设置图片加载中提示
             self.image_preview.setText("正在加载图片...")
@@ -1324,44 +5088,47 @@ class ImageMetadataEditor(QMainWindow):
             # 针对不同格式使用不同加载方法
             if file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif']:
                 # 这些是Qt原生支持较好的格式
-                pixmap = QPixmap(file_path)
+                with PERF.measure("image_decode"):
+                    pixmap = QPixmap(file_path)
                 if not pixmap.isNull():
-                    print(f"使用Qt原生方法成功加载图片")
+                    log_preview.debug("使用Qt原生方法成功加载图片")
             
             # 如果Qt加载失败或是其他格式，尝试用PIL加载
-            if (pixmap is None or pixmap.isNull()) and HAS_PIL:
+            Image = load_pil() if pixmap is None or pixmap.isNull() else None
+            if Image is not None:
                 try:
-                    print(f"尝试使用PIL加载图片...")
+                    log_preview.debug("尝试使用PIL加载图片...")
                     # 用PIL打开图片
-                    pil_image = Image.open(file_path)
+                    with PERF.measure("image_decode"):
+                        pil_image = Image.open(file_path)
                     
-                    # 调试信息
-                    print(f"PIL成功打开图片，模式: {pil_image.mode}, 尺寸: {pil_image.size}")
+                        # 调试信息
+                        log_preview.debug("PIL成功打开图片，模式: %s, 尺寸: %s", pil_image.mode, pil_image.size)
                     
-                    # 转换为RGB模式(如果是RGBA或其他模式)
-                    if pil_image.mode != 'RGB' and pil_image.mode != 'RGBA':
-                        pil_image = pil_image.convert('RGB')
-                        print(f"转换图片到RGB模式")
+                        # 转换为RGB模式(如果是RGBA或其他模式)
+                        if pil_image.mode != 'RGB' and pil_image.mode != 'RGBA':
+                            pil_image = pil_image.convert('RGB')
+                            log_preview.debug("转换图片到RGB模式")
                     
-                    # 转换为QImage
-                    if pil_image.mode == 'RGB':
-                        data = pil_image.tobytes('raw', 'RGB')
-                        q_image = QImage(data, pil_image.width, pil_image.height, pil_image.width * 3, QImage.Format_RGB888)
-                    else:  # RGBA模式
-                        data = pil_image.tobytes('raw', 'RGBA')
-                        q_image = QImage(data, pil_image.width, pil_image.height, pil_image.width * 4, QImage.Format_RGBA8888)
+                        # 转换为QImage
+                        if pil_image.mode == 'RGB':
+                            data = pil_image.tobytes('raw', 'RGB')
+                            q_image = QImage(data, pil_image.width, pil_image.height, pil_image.width * 3, QImage.Format_RGB888)
+                        else:  # RGBA模式
+                            data = pil_image.tobytes('raw', 'RGBA')
+                            q_image = QImage(data, pil_image.width, pil_image.height, pil_image.width * 4, QImage.Format_RGBA8888)
                     
-                    # 转换为QPixmap
-                    pixmap = QPixmap.fromImage(q_image)
+                        # 转换为QPixmap
+                        pixmap = QPixmap.fromImage(q_image)
                     
-                    print(f"使用PIL成功转换图片为QPixmap, 大小: {pixmap.width()}x{pixmap.height()}")
+                    log_preview.debug("使用PIL成功转换图片为QPixmap, 大小: %dx%d", pixmap.width(), pixmap.height())
                 except Exception as e:
-                    print(f"PIL加载图片失败: {e}")
+                    log_preview.warning("PIL加载图片失败: %s", e)
                     pixmap = None
             
             # 如果尝试了上述方法，但仍然加载失败，最后直接使用Qt尝试加载
             if pixmap is None or pixmap.isNull():
-                print("尝试最后的Qt直接加载方式...")
+                log_preview.debug("尝试最后的Qt直接加载方式...")
                 pixmap = QPixmap(file_path)
             
             # 如果加载失败
@@ -1372,7 +5139,7 @@ class ImageMetadataEditor(QMainWindow):
                 
                 self.image_preview.setText(error_msg)
                 self.image_info.setText("")
-                print(f"所有方法均无法加载图片!")
+                log_preview.warning("所有方法均无法加载图片: %s", file_path)
                 return
                 
             # 获取图片信息
@@ -1388,12 +5155,13 @@ class ImageMetadataEditor(QMainWindow):
             
             # 调整图片大小以适应预览区域
             preview_size = min(self.image_preview.width() - 20, self.image_preview.height() - 20)
-            preview_pixmap = pixmap.scaled(
-                preview_size, 
-                preview_size,
-                Qt.KeepAspectRatio, 
-                Qt.SmoothTransformation
-            )
+            with PERF.measure("image_scale"):
+                preview_pixmap = pixmap.scaled(
+                    preview_size, 
+                    preview_size,
+                    Qt.KeepAspectRatio, 
+                    Qt.SmoothTransformation
+                )
             
             # 显示图片
             self.image_preview.setPixmap(preview_pixmap)
@@ -1428,22 +5196,212 @@ class ImageMetadataEditor(QMainWindow):
         except Exception as e:
             self.image_preview.setText(f"加载图片预览时出错: {str(e)}\n尝试安装Pillow库: pip install Pillow")
             self.image_info.setText("")
-            import traceback
-            traceback.print_exc()  # 打印详细错误信息
+            log_preview.exception("加载图片预览时出错: %s", file_path)  # 记录详细错误信息
     
     def get_file_metadata(self, file_path):
         """获取文件的元数据"""
-        if not self.exiftool_path or not os.path.exists(self.exiftool_path) or not file_path or not os.path.exists(file_path):
+        if not self.exiftool_backend.available(self.exiftool_path) or not file_path or not os.path.exists(file_path):
             return None
             
+        # 文件大小和修改时间未变时直接使用缓存
+        cached = self._get_cached_metadata(file_path)
+        if cached is not None:
+            return cached
+
+        # 不使用-n参数，读取的值与写入时使用的可读格式一致，便于比较
+        try:
+            stream = self._acquire_exiftool(max_retries=0,
+                                            call_timeout=min(self.exiftool_read_timeout, self.exiftool_timeout))
+        except OSError as e:
+            log_read.warning("读取元数据时出错: %s", e)
+            return None
         try:
-            with exiftool.ExifToolHelper(executable=self.exiftool_path) as et:
-                metadata = et.get_metadata(file_path)[0]
-                return metadata
+            with PERF.measure("exiftool_read"):
+                status, stdout, stderr = stream.execute(["-j", file_path])
+            if status < 0:
+                # 超时或进程崩溃，看门狗已重启进程，界面不再继续等待
+                log_read.warning("读取元数据失败: %s (%s)", stderr, file_path)
+                return None
+            metadata = json.loads(stdout)[0]
+            self._store_cached_metadata(file_path, metadata)
+            return metadata
         except Exception as e:
-            print(f"读取元数据时出错: {e}")
+            log_read.warning("读取元数据时出错: %s", e)
             return None
-            
+        finally:
+            self.exiftool_pool.release(stream)
+
+    def _acquire_exiftool(self, **kwargs):
+        """从进程池借用一个已预热的ExifTool进程，进程池未启动时先启动"""
+        if self.exiftool_pool is None:
+            self.start_exiftool()
+            if self.exiftool_pool is None:
+                raise OSError("ExifTool路径未设置或无效")
+        kwargs.setdefault("call_timeout", self.exiftool_timeout)
+        return self.exiftool_pool.acquire(**kwargs)
+
+    def _get_cached_metadata(self, file_path):
+        """返回仍然有效的缓存元数据，文件被修改过则返回None"""
+        entry = self.metadata_cache.get(file_path)
+        if entry is None:
+            return self._get_indexed_metadata(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            self.metadata_cache.pop(file_path, None)
+            return None
+        size, mtime_ns, metadata = entry
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            self.metadata_cache.pop(file_path, None)
+            return None
+        return metadata
+
+    def _store_cached_metadata(self, file_path, metadata):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return
+        self.metadata_cache[file_path] = (stat.st_size, stat.st_mtime_ns, metadata)
+        # 读取失败时的空元数据只在本次使用，不写入索引
+        if metadata:
+            self.metadata_index.put(file_path, stat.st_size, stat.st_mtime_ns, metadata)
+
+    def _get_indexed_metadata(self, file_path):
+        """内存缓存中没有时查询元数据索引，大小和修改时间与os.stat一致才使用"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        metadata = self.metadata_index.get(file_path, stat.st_size, stat.st_mtime_ns)
+        if metadata is not None:
+            self.metadata_cache[file_path] = (stat.st_size, stat.st_mtime_ns, metadata)
+        return metadata
+
+    def _record_written(self, file_path, changes):
+        """文件写入成功后内存缓存失效，索引中记录写入的常用标签和新的大小、修改时间"""
+        self.metadata_cache.pop(file_path, None)
+        self.metadata_index.record_write(file_path, changes)
+
+    def _prefetch_metadata(self, file_paths, progress=None):
+        """批量读取尚未缓存的文件元数据，所有读取命令在同一个ExifTool进程中流水线执行
+
+        每个文件单独一条命令，某个文件导致ExifTool卡住时只影响该文件（按有变化处理）；
+        传入ProgressReporter时显示读取进度
+        """
+        if not self.exiftool_backend.available(self.exiftool_path):
+            return
+        missing = [path for path in file_paths if self._get_cached_metadata(path) is None and os.path.exists(path)]
+        if not missing:
+            return
+        try:
+            stream = self._acquire_exiftool(max_retries=0)
+        except OSError as e:
+            log_read.warning("批量读取元数据时出错: %s", e)
+            return
+        def refresh():
+            if progress is not None:
+                progress.update(submitted - stream.pending_count)
+            else:
+                QApplication.processEvents()
+
+        if progress is not None:
+            progress.total = len(missing)
+        try:
+            submitted = 0
+            for file_path in missing:
+                while not stream.can_submit():
+                    self._store_prefetched(stream.get_result(timeout=0.1))
+                    refresh()
+                stream.submit(["-j", file_path], tag=(file_path, time.perf_counter()))
+                submitted += 1
+            while stream.pending_count > 0:
+                self._store_prefetched(stream.get_result(timeout=0.1))
+                refresh()
+        except Exception as e:
+            log_read.warning("批量读取元数据时出错: %s", e)
+        finally:
+            self.exiftool_pool.release(stream)
+            self.metadata_index.flush()
+
+    def _store_prefetched(self, result):
+        if result is None:
+            return
+        (file_path, submitted), status, stdout, stderr = result
+        # 流水线中各命令重叠执行，耗时取从提交到返回结果的时间
+        PERF.add("exiftool_read", time.perf_counter() - submitted)
+        try:
+            self._store_cached_metadata(file_path, json.loads(stdout)[0])
+        except (ValueError, IndexError):
+            # 读取失败的文件记为空元数据（按全部有变化处理），本次批处理中不再重复读取
+            log_read.warning("读取元数据时出错: %s: %s", file_path, stderr.strip())
+            self._store_cached_metadata(file_path, {})
+
+    @staticmethod
+    def _normalize_tag_value(value):
+        """将元数据值规范化以便比较：数值统一为浮点数，其余为去除首尾空白的字符串"""
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        text = str(value).strip()
+
+        # 分数形式，如曝光时间 1/60
+        match = re.match(r"^(-?\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)$", text)
+        if match and float(match.group(2)) != 0:
+            return float(match.group(1)) / float(match.group(2))
+
+        # 度分秒形式的GPS坐标，如 34 deg 3' 7.92" N
+        match = re.match(r"""^(\d+(?:\.\d+)?) deg (\d+(?:\.\d+)?)' (\d+(?:\.\d+)?)"(?: ?[NSEW])?$""", text)
+        if match:
+            degrees, minutes, seconds = (float(g) for g in match.groups())
+            return degrees + minutes / 60 + seconds / 3600
+
+        # 带单位的数值，如焦距 4.2 mm、海拔 100 m
+        match = re.match(r"^(-?\d+(?:\.\d+)?)\s*(?:mm|m|s)?$", text)
+        if match:
+            return float(match.group(1))
+
+        return text
+
+    def _plan_changes(self, file_path, metadata):
+        """与文件当前的元数据比较，只返回需要实际写入的字段"""
+        current = self.get_file_metadata(file_path)
+        if not current:
+            # 无法读取当前元数据时按全部有变化处理
+            return {key: value for key, value in metadata.items() if value != "__NO_CHANGE__"}
+
+        # 按标签名分组当前值，忽略由其他标签计算得出的Composite组
+        current_values = {}
+        for full_key, value in current.items():
+            if full_key.startswith("Composite:") or ":" not in full_key:
+                continue
+            current_values.setdefault(full_key.split(":")[-1], []).append(value)
+
+        changes = {}
+        for key, value in metadata.items():
+            if value == "__NO_CHANGE__":
+                continue
+            existing = [v for v in current_values.get(key, []) if str(v).strip() != ""]
+            if value == "__CLEAR__" or value == "":
+                # 清除数据：文件中本来就没有该字段时无需写入
+                if existing:
+                    changes[key] = value
+                continue
+            planned = self._normalize_tag_value(value)
+            same = bool(existing)
+            for current_value in existing:
+                normalized = self._normalize_tag_value(current_value)
+                if isinstance(planned, float) and isinstance(normalized, float):
+                    same = math.isclose(planned, normalized, rel_tol=1e-4, abs_tol=1e-4)
+                else:
+                    same = planned == normalized
+                if not same:
+                    break
+            if not same:
+                changes[key] = value
+        return changes
+
+    @PERF.timed("dialog_format")
     def format_metadata_tooltip(self, metadata):
         """将完整元数据格式化为工具提示"""
         if not metadata:
@@ -1518,61 +5476,23 @@ class ImageMetadataEditor(QMainWindow):
             QMessageBox.warning(self, "提示", "请至少选中一个文件")
             return
             
+        # 先为所有文件生成计划的元数据，写入任务日志后再统一应用，
+        # 这样中断后恢复任务时可以重放完全相同的随机值
+        all_metadata, generation = self._generate_files_metadata(checked_files)
+
         # 应用到所选文件
         if len(checked_files) > 1:
-            # 批量处理 - 创建进度对话框
-            progress_dialog = QProgressDialog("正在应用随机元数据...", "取消", 0, len(checked_files), self)
-            progress_dialog.setWindowTitle("处理中")
-            progress_dialog.setWindowModality(Qt.WindowModal)
-            progress_dialog.setMinimumDuration(0)
-            progress_dialog.setValue(0)
-            
-            # 存储所有处理结果和每个文件的元数据
-            all_results = []
-            all_metadata = {}
-            
-            try:
-                for i, file_path in enumerate(checked_files):
-                    # 更新进度
-                    progress_dialog.setValue(i)
-                    progress_dialog.setLabelText(f"正在处理 ({i+1}/{len(checked_files)}): {os.path.basename(file_path)}")
-                    QApplication.processEvents()
-                    
-                    # 检查用户是否取消
-                    if progress_dialog.wasCanceled():
-                        break
-                    
-                    # 为每个文件创建独立的随机元数据
-                    random_metadata = self.create_random_metadata()
-                    
-                    # 为这个文件生成特定的变化（时间戳、GPS等轻微随机化）
-                    slightly_varied_metadata = self.slightly_vary_metadata(random_metadata, file_path)
-                    
-                    # 存储每个文件的元数据用于批处理预览
-                    all_metadata[file_path] = slightly_varied_metadata
-                    
-                    # 应用元数据并获取结果
-                    result = self._apply_metadata_to_file(file_path, slightly_varied_metadata)
-                    # 记录处理结果
-                    all_results.append((file_path, result, slightly_varied_metadata))
-            finally:
-                # 确保进度对话框关闭
-                progress_dialog.setValue(len(checked_files))  # 确保进度条到达100%
-                progress_dialog.close()
-                QApplication.processEvents()  # 立即处理所有待处理的事件，确保对话框关闭
-                progress_dialog.deleteLater()
-            
-            # 显示一个总结性的成功消息
-            self._show_batch_results(all_results, "随机模式")
+            # 批量应用并显示总结性的结果
+            self.apply_metadata(all_metadata, mode_name="随机模式", generation=generation)
         else:
             # 单个文件处理
             file_path = checked_files[0]
-            
-            # 为单个文件创建独立的随机元数据
-            random_metadata = self.create_random_metadata()
-            
-            # 为文件生成特定的随机元数据（微调）
-            slightly_varied_metadata = self.slightly_vary_metadata(random_metadata, file_path)
+            slightly_varied_metadata = all_metadata[file_path]
+
+            # 试运行时只生成计划
+            if self.dry_run_check.isChecked():
+                self.create_dry_run_plan(all_metadata, "随机模式", generation)
+                return
             
             # 应用元数据
             result = self._apply_metadata_to_file(file_path, slightly_varied_metadata)
@@ -1585,107 +5505,85 @@ class ImageMetadataEditor(QMainWindow):
     
     def _show_batch_results(self, results, mode_name):
         """显示批量处理结果的总结对话框
-        results: 元组列表 [(file_path, result, metadata), ...]
+        results: 元组列表 [(file_path, status, metadata), ...]，status为"success"、"failed"、"skipped"或"quarantined"
         mode_name: 模式名称，例如"随机模式"或"自定义模式"
         """
         if not results:
             return
             
-        # 计算成功和失败的数量
-        success_count = sum(1 for _, result, _ in results if result)
-        failed_count = len(results) - success_count
+        # 计算成功、跳过和失败的数量
+        success_count = sum(1 for _, status, _ in results if status == "success")
+        skipped_count = sum(1 for _, status, _ in results if status == "skipped")
+        quarantined_files = [file_path for file_path, status, _ in results if status == "quarantined"]
+        failed_count = len(results) - success_count - skipped_count - len(quarantined_files)
         
         # 创建结果文本
         result_text = f"批量处理完成\n\n成功: {success_count} 个文件\n"
+        if skipped_count > 0:
+            result_text += f"跳过（元数据无变化）: {skipped_count} 个文件\n"
         if failed_count > 0:
             result_text += f"失败: {failed_count} 个文件\n"
-        
-        # 添加详细信息
-        details_text = "详细信息:\n\n"
-        for file_path, result, metadata in results:
-            file_name = os.path.basename(file_path)
+        if quarantined_files:
+            # 导致ExifTool卡住或崩溃的文件单独列出，方便用户检查
+            result_text += f"已隔离（ExifTool超时或崩溃）: {len(quarantined_files)} 个文件\n"
+            for file_path in quarantined_files[:10]:
+                result_text += f"  {os.path.basename(file_path)}\n"
+            if len(quarantined_files) > 10:
+                result_text += f"  ...以及{len(quarantined_files) - 10}个其他文件\n"
+        
+        # 用表格显示每个文件的结果，详细信息只在选中某一行时才生成
+        with PERF.measure("dialog_format"):
+            model = BatchTableModel(results, self._format_table_value)
+            dialog = BatchTableDialog(f"{mode_name}处理结果", result_text.rstrip(), model,
+                                      self._format_result_details, [("确定", True)], self)
+        dialog.exec_()
+
+    def _format_table_value(self, key, value):
+        """表格单元格中显示的值，特殊标记转换为中文"""
+        if value == "__NO_CHANGE__":
+            return "【不修改】"
+        if value == "__CLEAR__":
+            return "【清除数据】"
+        return value
+
+    @PERF.timed("dialog_format")
+    def _format_result_details(self, file_path, status, metadata):
+        """生成单个文件的处理结果详情"""
+        status_text = {"success": "成功", "skipped": "已跳过（元数据无变化）",
+                       "quarantined": "已隔离（ExifTool超时或崩溃）"}.get(status, "失败")
+        details_text = f"文件: {os.path.basename(file_path)}\n"
+        details_text += f"状态: {status_text}\n"
+        details_text += f"路径: {file_path}\n"
+        try:
             file_info = os.stat(file_path)
-            file_size = self._format_file_size(file_info.st_size)
+            details_text += f"大小: {self._format_file_size(file_info.st_size)}\n"
             mod_time = datetime.datetime.fromtimestamp(file_info.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
-            
-            status = "成功" if result else "失败"
-            details_text += f"文件: {file_name}\n"
-            details_text += f"状态: {status}\n"
-            details_text += f"路径: {file_path}\n"
-            details_text += f"大小: {file_size}\n"
             details_text += f"修改时间: {mod_time}\n"
-            
-            if result:
-                # 添加应用的元数据摘要（更详细）
-                details_text += f"应用的元数据:\n"
-                
-                # 设备信息
-                if any(key in metadata for key in ["Make", "Model", "Software", "LensModel"]):
-                    details_text += "== 设备信息 ==\n"
-                    for key in ["Make", "Model", "Software", "LensModel"]:
-                        if key in metadata and metadata[key]:
-                            details_text += f"  {key}: {metadata[key]}\n"
-                
-                # 拍摄参数
-                if any(key in metadata for key in ["ExposureTime", "FNumber", "ISO", "FocalLength", "WhiteBalance", "Flash", "Orientation"]):
-                    details_text += "== 拍摄参数 ==\n"
-                    for key in ["ExposureTime", "FNumber", "ISO", "FocalLength", "WhiteBalance", "Flash", "Orientation"]:
-                        if key in metadata and metadata[key]:
-                            details_text += f"  {key}: {metadata[key]}\n"
-                
-                # 日期信息
-                if any(key in metadata for key in ["DateTimeOriginal", "CreateDate", "ModifyDate"]):
-                    details_text += "== 日期信息 ==\n"
-                    for key in ["DateTimeOriginal", "CreateDate", "ModifyDate"]:
-                        if key in metadata and metadata[key]:
-                            details_text += f"  {key}: {metadata[key]}\n"
-                
-                # GPS信息
-                gps_keys = ["GPSLatitude", "GPSLatitudeRef", "GPSLongitude", "GPSLongitudeRef", 
-                           "GPSAltitude", "GPSAltitudeRef", "GPSTimeStamp", "GPSDateStamp"]
-                if any(key in metadata for key in gps_keys):
-                    details_text += "== GPS信息 ==\n"
-                    for key in gps_keys:
-                        if key in metadata and metadata[key]:
-                            details_text += f"  {key}: {metadata[key]}\n"
-                
-                # 其他信息
-                other_keys = ["Creator", "Copyright", "Description", "Title", "Keywords", "Location"]
-                if any(key in metadata for key in other_keys):
-                    details_text += "== 其他信息 ==\n"
-                    for key in other_keys:
+        except OSError:
+            details_text += "文件已不存在或无法访问\n"
+
+        if status == "success":
+            # 添加应用的元数据摘要，按类别分组
+            details_text += "应用的元数据:\n"
+            groups = [
+                ("设备信息", ["Make", "Model", "Software", "LensModel"]),
+                ("拍摄参数", ["ExposureTime", "FNumber", "ISO", "FocalLength", "WhiteBalance", "Flash", "Orientation"]),
+                ("日期信息", ["DateTimeOriginal", "CreateDate", "ModifyDate"]),
+                ("GPS信息", ["GPSLatitude", "GPSLatitudeRef", "GPSLongitude", "GPSLongitudeRef",
+                            "GPSAltitude", "GPSAltitudeRef", "GPSTimeStamp", "GPSDateStamp"]),
+                ("其他信息", ["Creator", "Copyright", "Description", "Title", "Keywords", "Location"]),
+            ]
+            for group_name, keys in groups:
+                if any(key in metadata for key in keys):
+                    details_text += f"== {group_name} ==\n"
+                    for key in keys:
                         if key in metadata and metadata[key]:
                             details_text += f"  {key}: {metadata[key]}\n"
-            else:
-                details_text += "应用失败，无法写入元数据。请检查文件权限或格式是否支持。\n"
-            
-            details_text += "--------------------------------\n\n"
-        
-        # 创建自定义对话框
-        msg_box = QMessageBox(self)
-        msg_box.setWindowTitle(f"{mode_name}处理结果")
-        msg_box.setText(result_text)
-        msg_box.setDetailedText(details_text)
-        
-        # 设置更大的尺寸
-        msg_box.setMinimumWidth(600)
-        
-        # 替换标准按钮为中文按钮
-        ok_button = msg_box.addButton("确定", QMessageBox.AcceptRole)
-        msg_box.setDefaultButton(ok_button)
-        
-        # 修改系统生成的"Show Details..."按钮文本为中文
-        for button in msg_box.buttons():
-            if msg_box.buttonRole(button) == QMessageBox.ActionRole:
-                button.setText("显示详情...")
-        
-        # 显示对话框
-        msg_box.exec_()
-        
-        # 手动设置文本编辑区域的大小
-        detail_text_edit = msg_box.findChild(QTextEdit)
-        if detail_text_edit:
-            detail_text_edit.setMinimumSize(600, 500)
+        elif status == "failed":
+            details_text += "应用失败，无法写入元数据。请检查文件权限或格式是否支持。\n"
+        elif status == "quarantined":
+            details_text += "处理该文件时ExifTool多次超时或崩溃，文件可能已损坏，已跳过。\n"
+        return details_text
     
     def _format_file_size(self, size_in_bytes):
         """格式化文件大小显示"""
@@ -1707,45 +5605,18 @@ class ImageMetadataEditor(QMainWindow):
             
         # 收集自定义元数据（基础模板）
         custom_metadata_template = self.collect_custom_metadata()
+
+        # 为每个文件单独生成标记为随机的字段，并添加微小变化使其更真实
+        all_metadata, generation = self._generate_files_metadata(checked_files, custom_metadata_template)
             
         # 批量处理多个文件
         if len(checked_files) > 1:
-            # 创建每个文件的元数据
-            all_metadata = {}
-            
-            # 为每个文件单独生成随机值
-            for file_path in checked_files:
-                # 复制基本模板
-                file_metadata = custom_metadata_template.copy()
-                
-                # 为所有标记为随机生成的字段生成独立的随机值
-                # 创建独立的随机元数据基础
-                random_metadata = self.create_random_metadata()
-                
-                # 填充所有标记为随机的字段
-                for key, value in file_metadata.items():
-                    if value is None and key in random_metadata:  # None表示随机生成
-                        file_metadata[key] = random_metadata[key]
-                
-                # 添加微小变化使其更真实
-                varied_metadata = self.slightly_vary_metadata(file_metadata, file_path)
-                all_metadata[file_path] = varied_metadata
-            
             # 显示批量预览
-            self._show_batch_preview(all_metadata, "自定义")
+            self._show_batch_preview(all_metadata, "自定义", generation)
         else:
             # 单个文件处理
             file_path = checked_files[0]
-            
-            # 处理所有设置为随机的字段
-            file_metadata = custom_metadata_template.copy()
-            random_metadata = self.create_random_metadata()
-            for key, value in file_metadata.items():
-                if value is None and key in random_metadata:  # None表示随机生成
-                    file_metadata[key] = random_metadata[key]
-                    
-            # 添加微小变化使其更真实
-            varied_metadata = self.slightly_vary_metadata(file_metadata, file_path)
+            varied_metadata = all_metadata[file_path]
             
             # 显示预览和确认
             msg = QMessageBox()
@@ -1779,6 +5650,11 @@ class ImageMetadataEditor(QMainWindow):
             
             # 应用元数据
             if msg.clickedButton() == apply_button:
+                # 试运行时只生成计划
+                if self.dry_run_check.isChecked():
+                    self.create_dry_run_plan(all_metadata, "自定义模式", generation)
+                    return
+
                 # 应用元数据
                 result = self._apply_metadata_to_file(file_path, varied_metadata)
                 
@@ -1788,70 +5664,67 @@ class ImageMetadataEditor(QMainWindow):
                 else:
                     QMessageBox.warning(self, "失败", f"无法应用自定义元数据到文件:\n{os.path.basename(file_path)}")
     
-    def create_random_metadata(self):
-        """创建随机元数据的辅助方法"""
+    def _generate_files_metadata(self, file_paths, template=None, seed=None, reference_time=None):
+        """为每个文件生成最终要写入的元数据，返回 ({file_path: metadata}, generation)
+
+        template为None时全部字段随机生成，否则只填充模板中值为None的字段。
+        每个文件的随机数由种子和文件路径决定，相同的文件、模板、种子和参考时间总是生成相同的结果；
+        generation记录这些输入，保存在计划文件中以便重新生成。
+        """
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        if reference_time is None:
+            reference_time = datetime.datetime.now().replace(microsecond=0)
+        files_metadata = {}
+        for file_path in file_paths:
+            # 每个文件使用独立的随机数生成器，不改变全局随机状态，多个线程可以同时生成
+            rng = random.Random(f"{seed}:{file_path}")
+            random_metadata = self.create_random_metadata(reference_time, rng)
+            if template is None:
+                file_metadata = random_metadata
+            else:
+                file_metadata = template.copy()
+                for key, value in file_metadata.items():
+                    if value is None and key in random_metadata:  # None表示随机生成
+                        file_metadata[key] = random_metadata[key]
+            files_metadata[file_path] = self.slightly_vary_metadata(file_metadata, file_path, rng)
+        generation = {"seed": seed, "reference_time": reference_time.strftime("%Y-%m-%d %H:%M:%S"),
+                      "template": template}
+        return files_metadata, generation
+
+    @PERF.timed("metadata_generate")
+    def create_random_metadata(self, reference_time=None, rng=None):
+        """创建随机元数据的辅助方法，随机日期以reference_time（默认为当前时间）为基准
+
+        rng为random.Random实例，不传入时使用全局随机数生成器
+        """
+        rng = rng or random
         # 复制当前的generate_random_metadata方法的逻辑，但仅返回元数据，不进行应用
-        make = random.choice(self.metadata_options["make"])
-        model = random.choice(self.metadata_options["model"][make])
-        
-        # 为选择的品牌选择合适的软件
-        software = None
-        if make == "Apple":
-            software = random.choice([s for s in self.metadata_options["software"] if s.startswith("iOS")])
-        elif make == "Samsung":
-            software = random.choice([s for s in self.metadata_options["software"] if s.startswith("One UI")])
-        elif make == "Huawei":
-            software = random.choice([s for s in self.metadata_options["software"] if s.startswith("HarmonyOS") or s.startswith("EMUI")])
-        elif make == "Xiaomi":
-            software = random.choice([s for s in self.metadata_options["software"] if s.startswith("MIUI")])
-        elif make == "Google":
-            software = random.choice([s for s in self.metadata_options["software"] if s.startswith("Android")])
-        else:
-            software = random.choice(self.metadata_options["software"])
-        
-        # 为选择的品牌选择合适的镜头型号
-        lens_model = None
-        if make in ["Apple", "Samsung", "Huawei", "Xiaomi", "Google", "OnePlus", "OPPO", "Vivo"]:
-            # 移动设备品牌使用移动镜头术语
-            mobile_lenses = ["Wide camera", "Ultra Wide camera", "Telephoto camera", "Front camera", "Main camera", "Selfie camera"]
-            lens_model = random.choice(mobile_lenses)
-        elif make in ["Canon", "Nikon", "Sony", "Fujifilm", "Olympus", "Pentax", "Leica"]:
-            # 相机品牌使用带有品牌名称的特定镜头
-            brand_lens_prefix = f"{make} "
-            lens_options = [l for l in self.metadata_options["lens_model"] if l.startswith(brand_lens_prefix) or "mm" in l]
-            if lens_options:
-                lens_model = random.choice(lens_options)
-            else:
-                lens_model = random.choice(self.metadata_options["lens_model"])
-        else:
-            lens_model = random.choice(self.metadata_options["lens_model"])
+        make = rng.choice(self.metadata_options["make"])
+        model = rng.choice(self.metadata_options["model"][make])
+        
+        # 为选择的品牌选择合适的软件和镜头型号（按品牌预先建立的索引）
+        software = rng.choice(self.options.software_for(make))
+        lens_model = rng.choice(self.options.lenses_for(make))
         
         # Random date within the last 3 years
-        days_ago = random.randint(0, 365 * 3)
-        random_date = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+        days_ago = rng.randint(0, 365 * 3)
+        random_date = (reference_time or datetime.datetime.now()) - datetime.timedelta(days=days_ago)
         date_string = random_date.strftime("%Y:%m:%d %H:%M:%S")
         
         # Random GPS coordinates (roughly covering populated areas)
-        latitude = random.uniform(-60, 70)
-        longitude = random.uniform(-180, 180)
-        altitude = random.uniform(0, 3000)
+        latitude = rng.uniform(-60, 70)
+        longitude = rng.uniform(-180, 180)
+        altitude = rng.uniform(0, 3000)
         lat_ref = "N" if latitude >= 0 else "S"
         lon_ref = "E" if longitude >= 0 else "W"
         
         # 随机选择中文选项然后映射到英文
-        white_balance_cn = random.choice(self.metadata_options_cn["white_balance"])
-        flash_cn = random.choice(self.metadata_options_cn["flash"])
+        white_balance_cn = rng.choice(self.metadata_options_cn["white_balance"])
+        flash_cn = rng.choice(self.metadata_options_cn["flash"])
         
-        white_balance_map = {
-            "自动": "Auto", "手动": "Manual", "日光": "Daylight", 
-            "阴天": "Cloudy", "钨丝灯": "Tungsten", "荧光灯": "Fluorescent"
-        }
-        
-        flash_map = {
-            "无闪光灯": "No Flash", "闪光灯已触发": "Flash Fired", 
-            "闪光灯未触发": "Flash Not Fired", "自动闪光灯": "Auto Flash", 
-            "红眼减轻": "Red-eye Reduction"
-        }
+        white_balance_map = self.cn_to_en_mapping["white_balance"]
+        flash_map = self.cn_to_en_mapping["flash"]
         
         # Generate all metadata
         metadata = {
@@ -1860,13 +5733,13 @@ class ImageMetadataEditor(QMainWindow):
             "Model": model,
             "Software": software,
             "LensModel": lens_model,
-            "ExposureTime": random.choice(self.metadata_options["exposure_time"]),
-            "FNumber": random.choice(self.metadata_options["fnumber"]),
-            "ISO": random.choice(self.metadata_options["iso"]),
-            "FocalLength": random.choice(self.metadata_options["focal_length"]),
+            "ExposureTime": rng.choice(self.metadata_options["exposure_time"]),
+            "FNumber": rng.choice(self.metadata_options["fnumber"]),
+            "ISO": rng.choice(self.metadata_options["iso"]),
+            "FocalLength": rng.choice(self.metadata_options["focal_length"]),
             "WhiteBalance": white_balance_map.get(white_balance_cn, "Auto"),
             "Flash": flash_map.get(flash_cn, "No Flash"),
-            "Orientation": random.choice(self.metadata_options["orientation"]),
+            "Orientation": rng.choice(self.metadata_options["orientation"]),
             
             # Date and Time
             "DateTimeOriginal": date_string,
@@ -1879,37 +5752,31 @@ class ImageMetadataEditor(QMainWindow):
             "GPSLongitude": abs(longitude),
             "GPSLongitudeRef": lon_ref,
             "GPSAltitude": altitude,
-            "GPSAltitudeRef": random.choice(["Above Sea Level", "Below Sea Level"]),
+            "GPSAltitudeRef": rng.choice(["Above Sea Level", "Below Sea Level"]),
             "GPSTimeStamp": random_date.strftime("%H:%M:%S"),
             "GPSDateStamp": random_date.strftime("%Y:%m:%d"),
             
             # IPTC/XMP
-            "Creator": f"摄影师{random.randint(1, 999)}",
+            "Creator": f"摄影师{rng.randint(1, 999)}",
             "Copyright": f"(C){random_date.year} 摄影师, 保留所有权利",  # 使用(C)代替©符号避免编码问题
             "Description": f"使用{make} {model}拍摄的照片",
-            "Title": f"IMG_{random.randint(1000, 9999)}"
+            "Title": f"IMG_{rng.randint(1000, 9999)}"
         }
         
         # 添加关键词和位置信息
-        metadata["Keywords"] = ", ".join(random.sample(["自然", "人像", "风景", "城市", "旅行", "人物", "美食", "建筑"], k=random.randint(1, 3)))
-        metadata["Location"] = f"地点{random.randint(1, 100)}"
+        metadata["Keywords"] = ", ".join(rng.sample(["自然", "人像", "风景", "城市", "旅行", "人物", "美食", "建筑"], k=rng.randint(1, 3)))
+        metadata["Location"] = f"地点{rng.randint(1, 100)}"
         
         return metadata
     
-    def collect_custom_metadata(self):
+    @PERF.timed("metadata_generate")
+    def collect_custom_metadata(self, fill_random=True):
+        """收集自定义模式的设置；fill_random为False时【随机生成】的字段保留为None，由_generate_files_metadata为每个文件生成"""
         metadata = {}
         
         # 中文到英文映射
-        white_balance_map = {
-            "自动": "Auto", "手动": "Manual", "日光": "Daylight", 
-            "阴天": "Cloudy", "钨丝灯": "Tungsten", "荧光灯": "Fluorescent"
-        }
-        
-        flash_map = {
-            "无闪光灯": "No Flash", "闪光灯已触发": "Flash Fired", 
-            "闪光灯未触发": "Flash Not Fired", "自动闪光灯": "Auto Flash", 
-            "红眼减轻": "Red-eye Reduction"
-        }
+        white_balance_map = self.cn_to_en_mapping["white_balance"]
+        flash_map = self.cn_to_en_mapping["flash"]
         
         # Helper function to get value based on field type
         def get_field_value(field_name, field_type):
@@ -2011,7 +5878,7 @@ class ImageMetadataEditor(QMainWindow):
             metadata.pop(key)
         
         # Fill in random values for None fields and handle CLEAR
-        random_metadata = self.create_random_metadata()
+        random_metadata = self.create_random_metadata() if fill_random else {}
         for key, value in list(metadata.items()):  # 使用list创建副本进行迭代
             if value is None and key in random_metadata:
                 metadata[key] = random_metadata[key]
@@ -2021,6 +5888,7 @@ class ImageMetadataEditor(QMainWindow):
         
         return metadata
     
+    @PERF.timed("dialog_format")
     def format_metadata_for_preview(self, metadata):
         formatted = []
         
@@ -2087,25 +5955,33 @@ class ImageMetadataEditor(QMainWindow):
         
         return "\n".join(formatted)
     
-    def apply_metadata(self, metadata):
+    def apply_metadata(self, metadata, mode_name="批量应用", journal=None, planned=None, generation=None):
         """应用元数据到文件，可以是单个文件或多个文件
-        
+
         参数:
         - metadata: 可以是单个元数据字典，或者是{file_path: metadata}格式的字典
-        
+        - mode_name: 结果对话框中显示的模式名称
+        - journal: 恢复任务时传入已有的任务日志，否则新建一个
+        - planned: 执行保存的计划时传入 {file_path: 计划条目}，文件没有变化时直接使用计划中的写入字段
+        - generation: 生成随机值用的种子和参考时间，试运行时保存在计划文件中
+
         返回:
         - 成功应用元数据的文件数量
         """
-        # 检查是否有图片
-        if not self.file_paths:
-            QMessageBox.warning(self, "警告", "请先添加图片文件")
-            return 0
-            
+        # 恢复任务或执行计划时文件列表可以为空，直接使用日志或计划中的元数据
+        if journal is None and planned is None:
+            # 检查是否有图片
+            if len(self.file_table) == 0:
+                QMessageBox.warning(self, "警告", "请先添加图片文件")
+                return 0
+
         # 检查是否选择了图片（通过复选框）
         checked_files = self.get_checked_files()
-        
+
         # 如果metadata是字典的字典（多个文件），直接使用它
-        if isinstance(metadata, dict) and all(isinstance(k, str) and os.path.exists(k) for k in metadata.keys()):
+        if journal is not None or planned is not None:
+            files_metadata = metadata
+        elif isinstance(metadata, dict) and all(isinstance(k, str) and os.path.exists(k) for k in metadata.keys()):
             files_metadata = metadata
         else:
             # 单个元数据字典应用到选中的文件
@@ -2116,7 +5992,39 @@ class ImageMetadataEditor(QMainWindow):
                 # 没有选中的文件
                 QMessageBox.warning(self, "警告", "请至少选中一个文件进行处理")
                 return 0
-        
+
+        # 试运行：只生成执行计划，不修改文件
+        if journal is None and planned is None and self.dry_run_check.isChecked():
+            self.create_dry_run_plan(files_metadata, mode_name, generation)
+            return 0
+
+        # 生成计划后没有被修改过的文件直接使用计划中的写入字段，不再读取比较
+        planned_changes = {}
+        for file_path, entry in (planned or {}).items():
+            if BatchPlan.entry_is_current(entry):
+                planned_changes[file_path] = entry["changes"]
+            else:
+                log_job.info("文件在生成计划后被修改，重新比较: %s", file_path)
+
+        # 记录任务计划，中断后可以通过"恢复中断的任务"继续
+        if journal is None:
+            try:
+                journal = BatchJournal.create(mode_name, files_metadata)
+            except OSError as e:
+                # 日志写入失败不影响正常处理，只是无法恢复
+                log_job.warning("创建任务日志时出错: %s", e)
+        else:
+            journal.reopen()
+
+        # 边处理边写入结构化的结果记录
+        recorder = None
+        result_format = self.result_format_combo.currentData()
+        if result_format:
+            try:
+                recorder = ResultRecorder.create(result_format, journal.job_info.get("job_id") if journal else None)
+            except OSError as e:
+                log_job.warning("创建结果记录文件时出错: %s", e)
+
         # 创建进度对话框
         progress_dialog = QProgressDialog("正在应用元数据...", "取消", 0, len(files_metadata), self)
         progress_dialog.setWindowTitle("处理中")
@@ -2127,55 +6035,307 @@ class ImageMetadataEditor(QMainWindow):
         # 应用元数据到每个文件
         success_count = 0
         results = []
-        
+        canceled = False
+        total = len(files_metadata)
+
         try:
-            for i, (file_path, file_metadata) in enumerate(files_metadata.items()):
-                # 更新进度
-                progress_dialog.setValue(i)
-                progress_dialog.setLabelText(f"正在处理 ({i+1}/{len(files_metadata)}): {os.path.basename(file_path)}")
-                QApplication.processEvents()  # 确保UI更新
-                
-                # 检查用户是否取消
-                if progress_dialog.wasCanceled():
-                    break
-                    
-                success = self._apply_metadata_to_file(file_path, file_metadata)
-                if success:
-                    success_count += 1
-                results.append((file_path, success, file_metadata))
+            # 批量读取当前元数据，用于跳过没有变化的字段和文件
+            progress = ProgressReporter(progress_dialog, total, "正在读取文件当前的元数据")
+            progress.update(0, force=True)
+            self._prefetch_metadata([path for path in files_metadata if path not in planned_changes], progress)
+
+            # 进度按固定帧率刷新，界面更新不会拖慢处理
+            progress = ProgressReporter(progress_dialog, total, "正在应用元数据")
+            if self.stream_mode_check.isChecked() and len(files_metadata) > 1:
+                # 流水线模式：所有文件在同一个ExifTool进程中连续执行
+                results, success_count, canceled = self._apply_metadata_streaming(
+                    files_metadata, progress, journal, recorder, planned_changes)
+            else:
+                results, success_count, canceled = self._apply_metadata_sequential(
+                    files_metadata, progress, journal, recorder, planned_changes)
         finally:
+            self.metadata_index.flush()
+            if recorder is not None:
+                recorder.close()
+                log_job.info("处理结果已记录到: %s", recorder.path)
+            # 用户取消或异常中断时保留日志为未完成状态，以便之后恢复
+            if journal is not None:
+                if not canceled and len(results) == total:
+                    journal.finish()
+                else:
+                    journal.close()
+
             # 确保无论如何进度对话框都会关闭
             progress_dialog.setValue(len(files_metadata))  # 确保进度条到达100%
             progress_dialog.close()
             QApplication.processEvents()  # 立即处理所有待处理的事件，确保对话框关闭
             progress_dialog.deleteLater()  # 安全地销毁对话框
+        log_write.debug("进度界面刷新 %d 次，耗时 %.1f 毫秒", progress.refreshes, progress.ui_time * 1000)
+        self._save_cost_model()
+        
+        # 在文件列表中用颜色标记每个文件的处理结果
+        with PERF.measure("model_update"):
+            for file_path, status, _ in results:
+                self.file_table.set_status(file_path, status)
+                if status == "success":
+                    self.file_table.forget_stat(file_path)
+            self.file_list_model.refresh()
         
         # 显示结果
         if len(results) > 1:  # 多个文件时显示批量结果对话框
-            self._show_batch_results(results, "批量应用")
+            self._show_batch_results(results, mode_name)
         elif len(results) == 1:  # 单个文件时显示简单消息
-            file_path, success, _ = results[0]
-            if success:
+            file_path, status, _ = results[0]
+            if status == "success":
                 QMessageBox.information(self, "成功", f"元数据已成功应用到文件:\n{os.path.basename(file_path)}")
+            elif status == "skipped":
+                QMessageBox.information(self, "无需修改", f"文件的元数据与要应用的值一致，已跳过:\n{os.path.basename(file_path)}")
             else:
                 QMessageBox.warning(self, "失败", f"无法应用元数据到文件:\n{os.path.basename(file_path)}")
                 
         return success_count
     
-    def _apply_metadata_to_file(self, file_path, metadata):
-        """应用元数据到单个文件，返回操作是否成功"""
-        if not self.exiftool_path or not os.path.exists(self.exiftool_path):
-            QMessageBox.critical(self, "错误", "ExifTool路径未设置或无效，无法修改元数据")
-            return False
-            
-        if not file_path or not os.path.exists(file_path):
-            print(f"文件不存在: {file_path}")
-            return False
-            
-        # 创建临时文件名
-        temp_file = file_path + "_temp"
-        
-        # 拼接ExifTool命令
+    def _apply_metadata_sequential(self, files_metadata, progress, journal, recorder=None, planned_changes=None):
+        """非流水线模式下应用元数据，返回 (results, success_count, canceled)
+
+        连续的、要写入的字段完全相同的文件合并为一条ExifTool命令执行，
+        每条命令包含的文件数由AdaptiveChunkScheduler根据实测耗时调整，并受字节数和命令长度限制。
+        """
+        success_count = 0
+        written_bytes = 0
+        results = []
+        planned_changes = planned_changes or {}
+        scheduler = AdaptiveChunkScheduler(cost_model=self.cost_model)
+        group = {"paths": [], "sizes": [], "changes": None, "bytes": 0, "chars": 0}
+
+        def flush_group():
+            nonlocal success_count, written_bytes
+            if not group["paths"]:
+                return
+            paths, changes = group["paths"], group["changes"]
+            errors = {}
+            started = time.monotonic()
+            if len(paths) > 1 and self._write_metadata(paths, changes) == "success":
+                statuses = ["success"] * len(paths)
+            else:
+                # 单个文件或合并执行失败时逐个处理，找出具体失败的文件
+                statuses = [self._write_metadata([path], changes, errors) for path in paths]
+            elapsed = time.monotonic() - started
+            scheduler.record_chunk(len(paths), group["bytes"], elapsed)
+            for path, status, file_bytes in zip(paths, statuses, group["sizes"]):
+                if status == "success":
+                    success_count += 1
+                    written_bytes += file_bytes
+                results.append((path, status, changes))
+                if journal is not None:
+                    journal.mark_done(path, status)
+                if recorder is not None:
+                    recorder.write(path, status, changes, errors.get(path, ""), elapsed / len(paths),
+                                   file_bytes if status == "success" else 0)
+            group.update(paths=[], sizes=[], changes=None, bytes=0, chars=0)
+
+        for file_path, file_metadata in files_metadata.items():
+            # 更新进度（按帧率节流）
+            progress.update(len(results), os.path.basename(file_path), written_bytes)
+
+            # 检查用户是否取消
+            if progress.canceled():
+                flush_group()
+                return results, success_count, True
+
+            # 只写入与当前值不同的字段，全部相同则跳过该文件
+            changes = planned_changes.get(file_path)
+            if changes is None:
+                changes = self._plan_changes(file_path, file_metadata)
+            if not changes:
+                results.append((file_path, "skipped", changes))
+                if journal is not None:
+                    journal.mark_done(file_path, "skipped")
+                if recorder is not None:
+                    recorder.write(file_path, "skipped")
+                continue
+
+            try:
+                file_bytes = self._known_file_size(file_path)
+            except OSError:
+                file_bytes = 0
+            file_chars = len(file_path) + 1
+            if changes != group["changes"] or not scheduler.admit(
+                    len(group["paths"]), group["bytes"], group["chars"], file_bytes, file_chars):
+                flush_group()
+            if not group["paths"]:
+                group["changes"] = changes
+                group["chars"] = sum(len(arg) + 1 for arg in self._build_write_args(changes))
+            group["paths"].append(file_path)
+            group["sizes"].append(file_bytes)
+            group["bytes"] += file_bytes
+            group["chars"] += file_chars
+
+        flush_group()
+        return results, success_count, False
+
+    def _write_metadata(self, file_paths, metadata, errors=None):
+        """用一条ExifTool命令把相同的元数据写入一个或多个文件
+
+        返回"success"、"failed"，或者在超时/进程崩溃且重试后仍失败时返回"quarantined"；
+        传入errors字典时，失败的文件会记录对应的错误信息
+        """
+        command = self._build_write_args(metadata)
+        if not command:
+            return "success"
+        try:
+            stream = self._acquire_exiftool()
+        except OSError as e:
+            log_write.warning("应用元数据时出错: %s", e)
+            if errors is not None:
+                errors.update((file_path, str(e)) for file_path in file_paths)
+            return "failed"
+        try:
+            with PERF.measure("exiftool_write"):
+                status, stdout, stderr = stream.execute(["-overwrite_original"] + command + list(file_paths))
+        finally:
+            self.exiftool_pool.release(stream)
+
+        if status in (ExifToolStream.STATUS_TIMEOUT, ExifToolStream.STATUS_CRASHED):
+            log_write.warning("已隔离文件: %s: %s", ", ".join(file_paths), stderr.strip())
+            if errors is not None:
+                errors.update((file_path, stderr.strip()) for file_path in file_paths)
+            return "quarantined"
+        if status != 0 or "error" in stderr.lower():
+            log_write.warning("应用元数据时出错: %s", stderr.strip())
+            if errors is not None:
+                errors.update((file_path, stderr.strip()) for file_path in file_paths)
+            return "failed"
+        for file_path in file_paths:
+            log_write.debug("元数据已成功应用到: %s", file_path)
+            self._record_written(file_path, metadata)
+        return "success"
+
+    def _apply_metadata_streaming(self, files_metadata, progress, journal, recorder=None, planned_changes=None):
+        """在单个ExifTool进程中流水线执行所有文件的写入，返回 (results, success_count, canceled)
+
+        按顺序提交每个文件的参数块，结果按完成顺序逐条处理，不需要一次性构造全部命令。
+        在途文件数由AdaptiveChunkScheduler根据实测的每批耗时动态调整，并限制在途字节数。
+        """
+        success_count = 0
+        written_bytes = 0
+        results = []
+        canceled = False
+        planned_changes = planned_changes or {}
+
+        scheduler = AdaptiveChunkScheduler(cost_model=self.cost_model)
+        try:
+            stream = self._acquire_exiftool(max_pending=scheduler.max_chunk)
+        except OSError as e:
+            log_write.warning("获取ExifTool进程失败，改为逐个处理: %s", e)
+            return self._apply_metadata_sequential(files_metadata, progress, journal, recorder, planned_changes)
+
+        inflight = {"count": 0, "bytes": 0, "chars": 0}
+        window = {"start": time.monotonic(), "files": 0, "bytes": 0}
+
+        def record(file_path, status, changes, error="", duration=None, file_bytes=0):
+            nonlocal success_count, written_bytes
+            if status == "success":
+                success_count += 1
+                written_bytes += file_bytes
+                self._record_written(file_path, changes)
+            results.append((file_path, status, changes))
+            if journal is not None:
+                journal.mark_done(file_path, status)
+            if recorder is not None:
+                recorder.write(file_path, status, changes, error, duration,
+                               file_bytes if status == "success" else 0)
+            progress.update(len(results), os.path.basename(file_path), written_bytes)
+
+        def collect(timeout):
+            result = stream.get_result(timeout=timeout)
+            if result is None:
+                return False
+            (file_path, changes, file_bytes, file_chars, submitted), status, stdout, stderr = result
+            inflight["count"] -= 1
+            inflight["bytes"] -= file_bytes
+            inflight["chars"] -= file_chars
+            # 流水线中各命令重叠执行，耗时取从提交到返回结果的时间
+            duration = time.monotonic() - submitted
+            PERF.add("exiftool_write", duration)
+            if status == 0 and "error" not in stderr.lower():
+                record(file_path, "success", changes, "", duration, file_bytes)
+            elif status in (ExifToolStream.STATUS_TIMEOUT, ExifToolStream.STATUS_CRASHED):
+                # 多次重试后仍然卡住或导致ExifTool崩溃的文件，隔离后继续处理其他文件
+                log_write.warning("已隔离文件: %s: %s", file_path, stderr.strip())
+                record(file_path, "quarantined", changes, stderr.strip(), duration)
+            else:
+                log_write.warning("应用元数据时出错: %s: %s", file_path, stderr.strip())
+                record(file_path, "failed", changes, stderr.strip(), duration)
+
+            # 每完成一批，根据这一批的耗时调整批大小
+            window["files"] += 1
+            window["bytes"] += file_bytes
+            if window["files"] >= scheduler.chunk_size or inflight["count"] == 0:
+                now = time.monotonic()
+                scheduler.record_chunk(window["files"], window["bytes"], now - window["start"])
+                window.update(start=now, files=0, bytes=0)
+            return True
+
+        try:
+            for file_path, file_metadata in files_metadata.items():
+                progress.update(len(results), os.path.basename(file_path), written_bytes)
+                if progress.canceled():
+                    canceled = True
+                    break
+
+                # 只写入与当前值不同的字段，全部相同则跳过该文件
+                changes = planned_changes.get(file_path)
+                if changes is None:
+                    changes = self._plan_changes(file_path, file_metadata)
+                if not changes:
+                    record(file_path, "skipped", changes)
+                    continue
+                try:
+                    file_bytes = self._known_file_size(file_path)
+                except OSError as e:
+                    record(file_path, "failed", changes, str(e))
+                    continue
+                params = ["-overwrite_original"] + self._build_write_args(changes) + [file_path]
+                file_chars = sum(len(p) + 1 for p in params)
+
+                # 在途文件数或字节数达到上限时，先取回已完成的结果
+                while not scheduler.admit(inflight["count"], inflight["bytes"], inflight["chars"], file_bytes, file_chars):
+                    collect(timeout=0.1)
+                    progress.update(len(results), "", written_bytes)
+
+                if inflight["count"] == 0:
+                    window["start"] = time.monotonic()
+                stream.submit(params, tag=(file_path, changes, file_bytes, file_chars, time.monotonic()))
+                inflight["count"] += 1
+                inflight["bytes"] += file_bytes
+                inflight["chars"] += file_chars
+
+                # 顺便取回已经完成的结果，不阻塞
+                while collect(timeout=0):
+                    pass
+
+            # 等待所有在途命令完成（取消时也要等待，已提交的命令仍会被执行）
+            while inflight["count"] > 0:
+                collect(timeout=0.1)
+                progress.update(len(results), "", written_bytes)
+        finally:
+            self.exiftool_pool.release(stream)
+
+        log_write.info("批处理吞吐量: %.1f 文件/秒, %.1f MB/秒, 最终批大小: %d", scheduler.files_per_second,
+                       scheduler.bytes_per_second / 1024 / 1024, scheduler.chunk_size)
+        return results, success_count, canceled
+
+    def _known_file_size(self, file_path):
+        """文件大小优先使用扫描文件夹时已经读取的值，没有记录时才stat"""
+        row = self.file_table.row_of(file_path)
+        if row >= 0 and self.file_table.size[row] >= 0:
+            return self.file_table.size[row]
+        return os.path.getsize(file_path)
+
+    @staticmethod
+    def _build_write_args(metadata):
+        """将元数据字典转换为ExifTool的写入参数"""
         command = []
         for key, value in metadata.items():
             # 处理特殊情况：空值或清除标记
@@ -2187,22 +6347,26 @@ class ImageMetadataEditor(QMainWindow):
             else:
                 # 正常值
                 command.append(f"-{key}={value}")
-        
-        if not command:
-            # 没有任何修改
-            return True
+        return command
+
+    def _apply_metadata_to_file(self, file_path, metadata, skip_unchanged=True):
+        """应用元数据到单个文件，返回操作是否成功
+
+        skip_unchanged为True时先与文件当前的元数据比较，只写入有变化的字段
+        """
+        if not self.exiftool_backend.available(self.exiftool_path):
+            QMessageBox.critical(self, "错误", "ExifTool路径未设置或无效，无法修改元数据")
+            return False
             
-        try:
-            # 使用with语句确保进程关闭
-            with exiftool.ExifToolHelper(executable=self.exiftool_path) as et:
-                # 对单个文件应用所有元数据修改
-                et.execute("-overwrite_original", *command, file_path)
-                print(f"元数据已成功应用到: {file_path}")
-                return True
-        except Exception as e:
-            print(f"应用元数据时出错: {e}")
+        if not file_path or not os.path.exists(file_path):
+            log_write.warning("文件不存在: %s", file_path)
             return False
-    
+            
+        if skip_unchanged:
+            metadata = self._plan_changes(file_path, metadata)
+
+        return self._write_metadata([file_path], metadata) == "success"
+
     def save_settings(self):
         # 保存ExifTool路径
         self.settings.setValue("exiftool_path", self.exiftool_path)
@@ -2269,7 +6433,8 @@ class ImageMetadataEditor(QMainWindow):
     def load_settings(self):
         """加载软件设置"""
         # 加载ExifTool路径
-        self.exiftool_path = self.settings.value("exiftool_path", "")
+        if self.exiftool_backend is SUBPROCESS_BACKEND:
+            self.exiftool_path = self.settings.value("exiftool_path", "")
         
         try:
             # 自定义模式下的设置
@@ -2323,24 +6488,28 @@ class ImageMetadataEditor(QMainWindow):
                                     saved_text = self.settings.value(f"custom/{field_name}/text", "")
                                     text.setText(saved_text)
                 except Exception as e:
-                    print(f"加载{field_name}设置时出错: {str(e)}")
+                    log_settings.warning("加载%s设置时出错: %s", field_name, e)
             
             # 加载每个字段的状态
             for field_name, field_type in custom_fields:
                 load_field_state(field_name, field_type)
                 
         except Exception as e:
-            print(f"加载设置时出错: {str(e)}")
+            log_settings.warning("加载设置时出错: %s", e)
     
     def browse_exiftool(self):
         path, _ = QFileDialog.getOpenFileName(
             self, "选择ExifTool可执行文件", "", "可执行文件 (*.exe);;所有文件 (*.*)"
         )
         if path and os.path.exists(path):
-            self.exiftool_path = path
-            self.exiftool_path_edit.setText(self.exiftool_path)
-            # 保存新的ExifTool路径
-            self.settings.setValue("exiftool_path", self.exiftool_path)
+            # 保存新的ExifTool路径并读取版本信息
+            self._set_exiftool_path(path)
+            # 使用新的路径重新启动进程池
+            self.start_exiftool()
+
+    def on_pool_size_changed(self, value):
+        self.settings.setValue("exiftool_pool_size", value)
+        self.start_exiftool()
 
     def handle_no_change(self, field_name):
         """处理'不修改'按钮点击事件"""
@@ -2564,63 +6733,263 @@ class ImageMetadataEditor(QMainWindow):
         
         QMessageBox.information(self, "重置完成", "所有设置已恢复为默认值。")
 
-    def _show_batch_preview(self, all_metadata, mode_name):
-        """显示批量处理预览"""
-        # 创建预览对话框
-        preview_dialog = QMessageBox()
-        preview_dialog.setWindowTitle(f"批量{mode_name}元数据预览")
-        preview_dialog.setText(f"将为 {len(all_metadata)} 个文件应用{mode_name}元数据。")
-        
-        # 创建详细文本
-        preview_text = "每个文件的元数据详情：\n\n"
-        for file_path, metadata in all_metadata.items():
-            file_name = os.path.basename(file_path)
-            preview_text += f"=== {file_name} ===\n"
-            preview_text += self.format_metadata_for_preview(metadata)
-            preview_text += "\n\n" + "-"*40 + "\n\n"
-        
-        preview_dialog.setDetailedText(preview_text)
-        
-        # 设置更大的尺寸
-        preview_dialog.setMinimumWidth(700)
-        
-        # 自定义按钮
-        apply_button = preview_dialog.addButton(f"应用到所有文件", QMessageBox.ApplyRole)
-        cancel_button = preview_dialog.addButton("取消", QMessageBox.RejectRole)
-        preview_dialog.setDefaultButton(apply_button)
-        
-        # 修改系统生成的"Show Details..."按钮文本
-        for button in preview_dialog.buttons():
-            if preview_dialog.buttonRole(button) == QMessageBox.ActionRole:
-                button.setText("查看详情...")
-        
-        # 显示对话框
-        result = preview_dialog.exec_()
-        
-        # 手动设置文本编辑区域的大小
-        detail_text_edit = preview_dialog.findChild(QTextEdit)
-        if detail_text_edit:
-            detail_text_edit.setMinimumSize(600, 500)
-        
-        if preview_dialog.clickedButton() == apply_button:
+    def _show_batch_preview(self, all_metadata, mode_name, generation=None):
+        """显示批量处理预览，每个文件一行，选中后显示完整的元数据"""
+        rows = [(file_path, "pending", metadata) for file_path, metadata in all_metadata.items()]
+        model = BatchTableModel(rows, self._format_table_value)
+        dialog = BatchTableDialog(
+            f"批量{mode_name}元数据预览",
+            f"将为 {len(all_metadata)} 个文件应用{mode_name}元数据。选择一行查看该文件的元数据详情。",
+            model,
+            lambda file_path, status, metadata: (f"=== {os.path.basename(file_path)} ===\n"
+                                                 + self.format_metadata_for_preview(metadata)),
+            [("应用到所有文件", True), ("取消", False)],
+            self)
+
+        if dialog.exec_() == QDialog.Accepted:
             # 处理每个文件
-            self._apply_batch_metadata(all_metadata)
+            self._apply_batch_metadata(all_metadata, generation)
             
-    def _apply_batch_metadata(self, all_metadata):
+    def _apply_batch_metadata(self, all_metadata, generation=None):
         """批量应用元数据到多个文件"""
         # 直接调用apply_metadata处理批量元数据
-        self.apply_metadata(all_metadata)
-    
-    def slightly_vary_metadata(self, base_metadata, file_path):
-        """为每个文件稍微变化随机元数据以增加真实性"""
+        self.apply_metadata(all_metadata, generation=generation)
+
+    def show_perf_panel(self):
+        """打开（或切换到）性能统计面板"""
+        if self.perf_panel is None:
+            self.perf_panel = PerfPanel(PERF, self.settings, self)
+        self.perf_panel.refresh()
+        self.perf_panel.show()
+        self.perf_panel.raise_()
+
+    def resume_job(self):
+        """恢复最近一次中断的批处理任务，跳过已完成的文件并重放计划中的元数据"""
+        journals = BatchJournal.find_unfinished()
+        if not journals:
+            QMessageBox.information(self, "提示", "没有找到未完成的批处理任务")
+            return
+
+        journal = journals[0]
+        remaining = journal.remaining()
+        mode_name = journal.job_info.get("mode", "批量应用")
+        created = journal.job_info.get("created", "")
+
+        # 计划中已不存在的文件无法恢复，直接记为失败
+        missing = [path for path in remaining if not os.path.exists(path)]
+        for path in missing:
+            remaining.pop(path)
+
+        reply = QMessageBox.question(
+            self,
+            "恢复任务",
+            f"找到未完成的任务（{mode_name}，创建于 {created}）:\n\n"
+            f"计划文件: {len(journal.plan)} 个\n"
+            f"已完成: {len(journal.completed)} 个\n"
+            f"待处理: {len(remaining)} 个\n"
+            + (f"已不存在: {len(missing)} 个\n" if missing else "")
+            + "\n是否继续处理剩余文件？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        journal.reopen()
+        for path in missing:
+            journal.mark_done(path, "failed")
+
+        if not remaining:
+            journal.finish()
+            QMessageBox.information(self, "完成", "该任务的所有文件都已处理完毕")
+            return
+
+        self.apply_metadata(remaining, mode_name=mode_name, journal=journal)
+
+    def build_plan(self, files_metadata, mode_name, generation=None, diff=True, progress_dialog=None):
+        """生成执行计划（不保存）；diff为True时与文件当前的元数据比较，只写入有变化的字段，
+        否则不读取文件，计划写入全部字段。传入进度对话框时显示进度，用户取消时返回None"""
+        entries = []
+        if diff:
+            progress = None
+            if progress_dialog is not None:
+                progress = ProgressReporter(progress_dialog, len(files_metadata), "正在读取文件当前的元数据")
+                progress.update(0, force=True)
+            self._prefetch_metadata(list(files_metadata), progress)
+        progress = None
+        if progress_dialog is not None:
+            progress = ProgressReporter(progress_dialog, len(files_metadata), "正在生成执行计划")
+        for file_path, metadata in files_metadata.items():
+            if progress is not None:
+                progress.update(len(entries), os.path.basename(file_path))
+                if progress.canceled():
+                    return None
+            entries.append(self._plan_entry(file_path, metadata, diff))
+        if diff:
+            self._calibrate_cost_model(entries)
+        return BatchPlan.create(mode_name, entries, self.exiftool_path, ExifToolStream.DEFAULT_COMMON_ARGS,
+                                self.cost_model, generation, diff)
+
+    def create_dry_run_plan(self, files_metadata, mode_name, generation=None):
+        """试运行：与文件当前的元数据比较，生成每个文件要写入的字段和ExifTool参数，
+        保存为计划文件并估算执行时间，不修改任何文件；返回BatchPlan，取消或出错时返回None"""
+        if not self.exiftool_backend.available(self.exiftool_path):
+            QMessageBox.critical(self, "错误", "ExifTool路径未设置或无效，无法读取文件当前的元数据")
+            return None
+
+        progress_dialog = QProgressDialog("正在生成执行计划...", "取消", 0, len(files_metadata), self)
+        progress_dialog.setWindowTitle("试运行")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+        progress_dialog.setValue(0)
+        try:
+            plan = self.build_plan(files_metadata, mode_name, generation, progress_dialog=progress_dialog)
+        finally:
+            progress_dialog.close()
+            QApplication.processEvents()
+            progress_dialog.deleteLater()
+        if plan is None:
+            return None
+        try:
+            plan.save()
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"无法保存执行计划:\n{e}")
+            return None
+        log_job.info("执行计划已保存到: %s", plan.path)
+        self._show_plan(plan)
+        return plan
+
+    def _plan_entry(self, file_path, metadata, diff=True):
+        """单个文件的计划条目，记录生成计划时的文件大小和修改时间，执行时据此判断计划是否仍然有效"""
+        try:
+            stat = os.stat(file_path)
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        except OSError:
+            size, mtime_ns = -1, -1
+        if diff:
+            changes = self._plan_changes(file_path, metadata)
+        else:
+            changes = {key: value for key, value in metadata.items() if value != "__NO_CHANGE__"}
+        args = ["-overwrite_original"] + self._build_write_args(changes) + [file_path] if changes else []
+        return {"type": "file", "file": file_path, "size": size, "mtime_ns": mtime_ns,
+                "metadata": metadata, "changes": changes, "args": args}
+
+    def _calibrate_cost_model(self, entries, min_samples=3):
+        """耗时模型的样本不足时，把最小、中等和最大的几个文件复制到临时文件夹，
+        实际写入计划中的字段并计时，作为模型的样本；原文件不受影响"""
+        if self.cost_model.samples >= min_samples:
+            return
+        candidates = sorted((entry for entry in entries if entry["changes"] and entry["size"] > 0),
+                            key=lambda entry: entry["size"])
+        if not candidates:
+            return
+        picks = [candidates[i] for i in sorted({0, len(candidates) // 2, len(candidates) - 1})]
+        with tempfile.TemporaryDirectory(prefix="metadata_calibrate_") as temp_dir:
+            for index, entry in enumerate(picks):
+                copy_path = os.path.join(temp_dir, f"{index}_{os.path.basename(entry['file'])}")
+                try:
+                    shutil.copyfile(entry["file"], copy_path)
+                    stream = self._acquire_exiftool()
+                except OSError as e:
+                    log_job.warning("校准耗时模型时出错: %s", e)
+                    break
+                try:
+                    started = time.perf_counter()
+                    status, _, _ = stream.execute(["-overwrite_original"] + self._build_write_args(entry["changes"])
+                                                  + [copy_path])
+                    elapsed = time.perf_counter() - started
+                finally:
+                    self.exiftool_pool.release(stream)
+                if status == 0:
+                    self.cost_model.add(1, entry["size"], elapsed)
+        log_job.info("耗时模型: %s", self.cost_model.describe())
+        self._save_cost_model()
+
+    def _save_cost_model(self):
+        if self.exiftool_backend is SUBPROCESS_BACKEND:
+            self.settings.setValue("cost_model", self.cost_model.to_json())
+
+    def _describe_estimate(self, plan):
+        """计划的预计耗时文字，按当前的耗时模型重新估算"""
+        estimate = plan.estimate(self.cost_model)
+        if estimate is None:
+            return "无法估算（还没有耗时样本）"
+        text = ProgressReporter.format_eta(estimate) if estimate >= 1 else "不到1秒"
+        return f"{text}（根据本机 {self.cost_model.samples} 个耗时样本估算）"
+
+    def _show_plan(self, plan):
+        """用表格显示试运行生成的计划，选中一行显示该文件的写入字段和ExifTool参数"""
+        write_files, write_bytes = plan.write_totals()
+        summary = (f"试运行完成，没有修改任何文件。\n\n"
+                   f"计划文件: {plan.path}\n"
+                   f"需要写入: {write_files} 个文件（{self._format_file_size(write_bytes)}）\n"
+                   f"无需修改: {len(plan.entries) - write_files} 个文件\n"
+                   f"预计耗时: {self._describe_estimate(plan)}")
+        entries = {entry["file"]: entry for entry in plan.entries}
+
+        def format_details(file_path, status, changes):
+            entry = entries[file_path]
+            text = f"=== {os.path.basename(file_path)} ===\n"
+            if not entry["changes"]:
+                return text + "元数据与文件当前的值一致，执行时跳过"
+            return (text + self.format_metadata_for_preview(entry["changes"])
+                    + "\n\nExifTool参数:\n" + "\n".join(entry["args"]))
+
+        rows = [(entry["file"], "pending" if entry["changes"] else "skipped", entry["changes"])
+                for entry in plan.entries]
+        with PERF.measure("dialog_format"):
+            model = BatchTableModel(rows, self._format_table_value)
+            dialog = BatchTableDialog(f"{plan.header.get('mode', '')}试运行计划", summary, model, format_details,
+                                      [("立即执行计划", True), ("关闭", False)], self)
+        if dialog.exec_() == QDialog.Accepted:
+            self._execute_plan(plan)
+
+    def execute_plan(self):
+        """选择并执行之前试运行保存的计划"""
+        path, _ = QFileDialog.getOpenFileName(self, "选择执行计划", BatchJournal.journal_dir(),
+                                              "执行计划 (plan_*.jsonl);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            plan = BatchPlan.load(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "错误", f"无法读取执行计划:\n{e}")
+            return
+        write_files, write_bytes = plan.write_totals()
+        reply = QMessageBox.question(
+            self,
+            "执行计划",
+            f"执行计划（{plan.header.get('mode', '')}，创建于 {plan.header.get('created', '')}）:\n\n"
+            f"计划文件: {len(plan.entries)} 个\n"
+            f"需要写入: {write_files} 个文件（{self._format_file_size(write_bytes)}）\n"
+            f"预计耗时: {self._describe_estimate(plan)}\n"
+            "\n是否执行？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes
+        )
+        if reply == QMessageBox.Yes:
+            self._execute_plan(plan)
+
+    def _execute_plan(self, plan):
+        """按计划中的元数据和写入字段执行，不再生成随机值"""
+        files_metadata = {entry["file"]: entry["metadata"] for entry in plan.entries}
+        planned = {entry["file"]: entry for entry in plan.entries}
+        return self.apply_metadata(files_metadata, mode_name=plan.header.get("mode", "执行计划"), planned=planned)
+
+    @PERF.timed("metadata_generate")
+    def slightly_vary_metadata(self, base_metadata, file_path, rng=None):
+        """为每个文件稍微变化随机元数据以增加真实性
+
+        rng为random.Random实例；不传入时按文件名创建，同一文件总是获得相同的随机变化。
+        使用独立的随机数生成器，不改变全局随机状态，可以在多个线程中同时调用。
+        """
         # 创建一个基础元数据的副本，以免修改原始数据
         varied_metadata = base_metadata.copy()
         
-        # 获取文件名，用作随机种子的一部分，确保同一文件总是获得相同的随机变化
-        file_name = os.path.basename(file_path)
-        # 创建一个基于文件名的随机种子
-        seed = hash(file_name) % 10000
-        random.seed(seed)
+        if rng is None:
+            # 基于文件名的随机种子（hash()的结果每次启动都不同，改用crc32）
+            file_name = os.path.basename(file_path)
+            rng = random.Random(zlib.crc32(file_name.encode("utf-8")) % 10000)
         
         # 大幅调整日期时间（近一年范围内的随机值）
         for date_field in ["DateTimeOriginal", "CreateDate", "ModifyDate"]:
@@ -2630,10 +6999,10 @@ class ImageMetadataEditor(QMainWindow):
                     dt = datetime.datetime.strptime(varied_metadata[date_field], "%Y:%m:%d %H:%M:%S")
                     
                     # 近一年范围内的随机值（-6个月到+6个月）
-                    delta_days = random.randint(-180, 180)  # ±180天（约6个月）
-                    delta_hours = random.randint(-23, 23)   # 随机小时
-                    delta_minutes = random.randint(-59, 59) # 随机分钟
-                    delta_seconds = random.randint(0, 59)   # 随机秒
+                    delta_days = rng.randint(-180, 180)  # ±180天（约6个月）
+                    delta_hours = rng.randint(-23, 23)   # 随机小时
+                    delta_minutes = rng.randint(-59, 59) # 随机分钟
+                    delta_seconds = rng.randint(0, 59)   # 随机秒
                     
                     dt = dt + datetime.timedelta(days=delta_days, 
                                                 hours=delta_hours, 
@@ -2652,7 +7021,7 @@ class ImageMetadataEditor(QMainWindow):
                 try:
                     coord = float(varied_metadata[coord_field])
                     # 1度约等于111公里，所以1000公里约为9度
-                    delta = random.uniform(-9.0, 9.0)
+                    delta = rng.uniform(-9.0, 9.0)
                     
                     # 对于纬度，确保在-90到90之间
                     if coord_field == "GPSLatitude":
@@ -2679,7 +7048,7 @@ class ImageMetadataEditor(QMainWindow):
         if "GPSAltitude" in varied_metadata and varied_metadata["GPSAltitude"] is not None:
             try:
                 altitude = float(varied_metadata["GPSAltitude"])
-                delta = random.uniform(-2000, 2000)
+                delta = rng.uniform(-2000, 2000)
                 varied_metadata["GPSAltitude"] = max(0, altitude + delta)  # 确保高度不为负
             except (ValueError, TypeError):
                 pass
@@ -2694,7 +7063,7 @@ class ImageMetadataEditor(QMainWindow):
                     num, denom = float(num), float(denom)
                     value = num / denom
                     # 在原值基础上上下浮动30%
-                    factor = random.uniform(0.7, 1.3)
+                    factor = rng.uniform(0.7, 1.3)
                     new_value = value * factor
                     
                     # 转回分数形式
@@ -2711,7 +7080,7 @@ class ImageMetadataEditor(QMainWindow):
             try:
                 fnumber = float(varied_metadata["FNumber"])
                 # 光圈F值通常按照sqrt(2)的倍数变化（即1档）
-                stops = random.uniform(-1, 1)  # ±1档
+                stops = rng.uniform(-1, 1)  # ±1档
                 new_fnumber = fnumber * (2 ** (stops/2))
                 varied_metadata["FNumber"] = str(round(new_fnumber, 1))
             except (ValueError, TypeError):
@@ -2721,7 +7090,7 @@ class ImageMetadataEditor(QMainWindow):
         if "ISO" in varied_metadata and varied_metadata["ISO"]:
             try:
                 iso = int(varied_metadata["ISO"])
-                delta = random.randint(-100, 100)
+                delta = rng.randint(-100, 100)
                 new_iso = max(100, iso + delta)  # 确保ISO不低于100
                 varied_metadata["ISO"] = str(new_iso)
             except (ValueError, TypeError):
@@ -2734,23 +7103,20 @@ class ImageMetadataEditor(QMainWindow):
                 if "mm" in focal_str:
                     focal = float(focal_str.replace("mm", "").strip())
                     # 上下浮动20%
-                    delta_percent = random.uniform(-0.2, 0.2)
+                    delta_percent = rng.uniform(-0.2, 0.2)
                     new_focal = focal * (1 + delta_percent)
                     varied_metadata["FocalLength"] = f"{int(new_focal)} mm"
             except (ValueError, TypeError):
                 pass
         
         # 随机切换白平衡或闪光灯设置
-        if "WhiteBalance" in varied_metadata and random.random() < 0.3:  # 30%的概率改变白平衡
+        if "WhiteBalance" in varied_metadata and rng.random() < 0.3:  # 30%的概率改变白平衡
             white_balance_options = ["Auto", "Manual", "Daylight", "Cloudy", "Tungsten", "Fluorescent"]
-            varied_metadata["WhiteBalance"] = random.choice(white_balance_options)
+            varied_metadata["WhiteBalance"] = rng.choice(white_balance_options)
             
-        if "Flash" in varied_metadata and random.random() < 0.3:  # 30%的概率改变闪光灯设置
+        if "Flash" in varied_metadata and rng.random() < 0.3:  # 30%的概率改变闪光灯设置
             flash_options = ["No Flash", "Flash Fired", "Flash Not Fired", "Auto Flash", "Red-eye Reduction"]
-            varied_metadata["Flash"] = random.choice(flash_options)
-        
-        # 重置随机种子，避免影响程序其他部分
-        random.seed()
+            varied_metadata["Flash"] = rng.choice(flash_options)
         
         return varied_metadata
 
@@ -2767,10 +7133,14 @@ class ImageMetadataEditor(QMainWindow):
         # 获取拖放的文件URL
         urls = event.mimeData().urls()
         
-        # 提取文件路径
+        # 提取文件路径，文件夹在后台递归扫描
         file_paths = []
+        folders = []
         for url in urls:
             file_path = url.toLocalFile()
+            if os.path.isdir(file_path):
+                folders.append(file_path)
+                continue
             
             # 检查是否是支持的图片格式
             _, ext = os.path.splitext(file_path)
@@ -2780,6 +7150,8 @@ class ImageMetadataEditor(QMainWindow):
         # 添加文件
         if file_paths:
             self.add_files(file_paths)
+        if folders:
+            self.add_folders(folders)
             
         event.acceptProposedAction()
 
@@ -2829,10 +7201,10 @@ class ImageMetadataEditor(QMainWindow):
             session_settings.setValue("current_settings", default_settings)
             session_settings.sync()  # 确保设置被写入到存储
             
-            print("设置已保存: ", len(default_settings), "项")
+            log_settings.info("设置已保存: %d 项", len(default_settings))
             QMessageBox.information(self, "保存成功", "当前设置已成功保存为模板，并将在下次启动时自动加载")
         except Exception as e:
-            print(f"保存设置时出错: {str(e)}")
+            log_settings.error("保存设置时出错: %s", e)
             QMessageBox.warning(self, "保存失败", f"保存设置时出错: {str(e)}")
 
     def reset_to_default_settings(self):
@@ -2858,31 +7230,52 @@ class ImageMetadataEditor(QMainWindow):
             if reply != QMessageBox.Yes:
                 return
             
-            # 恢复所有控件的值
-            for key, value in template_settings.items():
-                control = getattr(self, key, None)
-                if control:
-                    if isinstance(control, QComboBox):
-                        index = control.findText(value)
-                        if index >= 0:
-                            control.setCurrentIndex(index)
-                    elif isinstance(control, QLineEdit):
-                        control.setText(value)
+            self._restore_template_controls(template_settings)
             
             QMessageBox.information(self, "加载完成", "已从保存的模板中恢复设置")
         except Exception as e:
-            print(f"加载模板设置时出错: {str(e)}")
+            log_settings.warning("加载模板设置时出错: %s", e)
             QMessageBox.warning(self, "加载失败", f"加载模板设置时出错: {str(e)}")
 
+    def _restore_template_controls(self, template_settings):
+        """把保存的设置恢复到自定义模式的控件中"""
+        for key, value in template_settings.items():
+            control = getattr(self, key, None)
+            if control:
+                if isinstance(control, QComboBox):
+                    index = control.findText(value)
+                    if index >= 0:
+                        control.setCurrentIndex(index)
+                elif isinstance(control, QLineEdit):
+                    control.setText(value)
+
+    def saved_template(self):
+        """把"保存当前设置为模板"保存的设置转换为_generate_files_metadata使用的模板，没有保存过模板时返回None
+
+        【随机生成】的字段保留为None，每个文件单独随机生成；不显示窗口时也可以调用。
+        """
+        template_settings = QSettings("ImageMetadataEditor", "TemplateSettings").value("template_settings")
+        if not template_settings:
+            return None
+        self.build_custom_tab()
+        self._restore_template_controls(template_settings)
+        # 品牌改变时会重新填充镜头列表，最后再恢复一次镜头型号
+        if "lens_model_combo" in template_settings:
+            self._restore_template_controls({"lens_model_combo": template_settings["lens_model_combo"]})
+        return self.collect_custom_metadata(fill_random=False)
+
     def load_last_session_settings(self):
         """加载上次退出时的设置"""
+        # 自定义模式的字段尚未创建时，等创建后再加载
+        if not self.custom_tab_built:
+            return
         try:
             # 使用更可靠的方式加载配置
             session_settings = QSettings("ImageMetadataEditor", "SessionSettings")
             template_settings = session_settings.value("current_settings")
             
             if not template_settings:
-                print("未找到上次会话的设置，使用默认值")
+                log_settings.info("未找到上次会话的设置，使用默认值")
                 return  # 没有保存的设置，使用默认值
             
             # 暂存需要特殊处理的值
@@ -2900,7 +7293,7 @@ class ImageMetadataEditor(QMainWindow):
                         elif isinstance(control, QLineEdit):
                             control.setText(value)
                 except Exception as e:
-                    print(f"加载设置'{key}'时出错: {str(e)}")
+                    log_settings.warning("加载设置'%s'时出错: %s", key, e)
                     continue  # 继续加载其他设置
             
             # 在所有设置加载后，手动处理lens_model_combo
@@ -2913,16 +7306,578 @@ class ImageMetadataEditor(QMainWindow):
                     index = self.lens_model_combo.findText("【空数据】")
                     if index >= 0:
                         self.lens_model_combo.setCurrentIndex(index)
-                        print("成功恢复镜头型号为【空数据】")
+                        log_settings.debug("成功恢复镜头型号为【空数据】")
                 except Exception as e:
-                    print(f"恢复镜头型号时出错: {str(e)}")
+                    log_settings.warning("恢复镜头型号时出错: %s", e)
                     
-            print("成功加载上次会话设置")
+            log_settings.info("成功加载上次会话设置")
         except Exception as e:
-            print(f"加载会话设置时出错: {str(e)}")
+            log_settings.warning("加载会话设置时出错: %s", e)
+
+# 可重复的性能基准测试：生成固定的合成图片，测量读写、预览、元数据生成和文件列表填充的性能
+class Benchmark:
+    """无界面运行（Qt使用offscreen平台），不需要网络；结果写成JSON，便于比较同一台机器上不同版本的结果
+
+    用法: python 1.py --benchmark [--benchmark-count=20] [--benchmark-sizes=640x480,1920x1080]
+          [--benchmark-formats=jpeg,png,tiff,webp] [--benchmark-seed=1234] [--benchmark-rows=100000]
+          [--benchmark-dir=目录] [--benchmark-output=结果.json] [--exiftool=路径]
+          [--benchmark-backend=fake [--benchmark-latency=秒]]
+    使用fake后端时读写由进程内的ExifTool替身完成，测得的是程序自身的开销。
+    """
+    FORMATS = {"jpeg": ("JPG", ".jpg"), "png": ("PNG", ".png"), "tiff": ("TIFF", ".tif"), "webp": ("WEBP", ".webp")}
+
+    def __init__(self, editor, corpus_dir, count=20, sizes=((640, 480), (1920, 1080)),
+                 formats=("jpeg", "png", "tiff", "webp"), seed=1234, list_rows=100000):
+        self.editor = editor
+        self.corpus_dir = corpus_dir
+        self.count = count
+        self.sizes = list(sizes)
+        self.formats = list(formats)
+        self.seed = seed
+        self.list_rows = list_rows
+        self.notes = []
+
+    @staticmethod
+    def summarize(samples, total=None):
+        """由每次操作的耗时（秒）计算吞吐量和延迟分位数"""
+        if not samples:
+            return {"count": 0}
+        ordered = sorted(samples)
+        total = sum(samples) if total is None else total
+
+        def percentile(fraction):
+            return round(ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000, 3)
+
+        return {
+            "count": len(samples),
+            "total_s": round(total, 4),
+            "per_second": round(len(samples) / total, 1) if total > 0 else None,
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p50_ms": percentile(0.5),
+            "p90_ms": percentile(0.9),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(ordered[-1] * 1000, 3),
+        }
+
+    def make_corpus(self):
+        """生成合成图片，返回 [(路径, 格式)]；同样的参数总是生成同样的像素内容"""
+        os.makedirs(self.corpus_dir, exist_ok=True)
+        writable = {bytes(name).decode().upper() for name in QImageWriter.supportedImageFormats()}
+        corpus = []
+        for fmt in self.formats:
+            qt_format, extension = self.FORMATS[fmt]
+            if qt_format not in writable and not load_pil():
+                self.notes.append(f"无法生成{fmt}格式的图片（Qt不支持写入且未安装Pillow），已跳过")
+                continue
+            for width, height in self.sizes:
+                for index in range(self.count):
+                    rng = random.Random(f"{self.seed}-{fmt}-{width}x{height}-{index}")
+                    # 小尺寸的随机色块放大到目标尺寸：内容固定，又不会因为完全随机而无法压缩
+                    noise = QImage(rng.randbytes(32 * 24 * 3), 32, 24, 32 * 3, QImage.Format_RGB888)
+                    image = noise.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                    path = os.path.join(self.corpus_dir, f"bench_{fmt}_{width}x{height}_{index:04d}{extension}")
+                    if qt_format in writable:
+                        saved = image.save(path, qt_format, 90)
+                    else:
+                        saved = self._save_with_pil(image, path, qt_format)
+                    if saved:
+                        corpus.append((path, fmt))
+                    else:
+                        self.notes.append(f"保存{os.path.basename(path)}失败")
+        return corpus
+
+    @staticmethod
+    def _save_with_pil(image, path, qt_format):
+        Image = load_pil()
+        image = image.convertToFormat(QImage.Format_RGB888)
+        data = bytes(image.constBits().asarray(image.sizeInBytes()))
+        pil_image = Image.frombuffer("RGB", (image.width(), image.height()), data, "raw", "RGB", image.bytesPerLine(), 1)
+        try:
+            pil_image.save(path, qt_format)
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _timed(self, func, items):
+        samples = []
+        started = time.perf_counter()
+        for item in items:
+            t = time.perf_counter()
+            func(item)
+            samples.append(time.perf_counter() - t)
+        return samples, time.perf_counter() - started
+
+    def _wait_for_exiftool(self, timeout=30.0):
+        pool = self.editor.exiftool_pool
+        if pool is None:
+            return False
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if pool.health()["alive"] >= pool.size:
+                return True
+            time.sleep(0.05)
+        return pool.health()["alive"] > 0
+
+    def run(self):
+        editor = self.editor
+        results = {}
+        # 使用独立的随机数生成器，不改变全局random的状态
+        rng = random.Random(self.seed)
+
+        # 元数据生成
+        samples, total = self._timed(lambda _: editor.create_random_metadata(rng=rng), range(max(self.count * 50, 1000)))
+        results["generate"] = self.summarize(samples, total)
+
+        # 文件列表填充：按扫描文件夹时的批大小添加合成记录
+        batch = 5000
+        records = [(os.path.join(self.corpus_dir, f"dir{i // 1000:04d}", f"IMG_{i:07d}.jpg"), 1000 + i, i)
+                   for i in range(self.list_rows)]
+        editor.file_table.clear()
+        editor.file_list_model.refresh()
+        samples, total = self._timed(lambda start: editor._add_file_records(records[start:start + batch], update_label=False),
+                                     range(0, len(records), batch))
+        results["list_populate"] = self.summarize(samples, total)
+        results["list_populate"]["rows_per_second"] = round(self.list_rows / total, 1) if total > 0 else None
+        for sort_type in ("name_desc", "size_asc"):
+            started = time.perf_counter()
+            editor.sort_files(sort_type)
+            results[f"list_sort_{sort_type}_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        editor.file_table.clear()
+        editor.file_list_model.refresh()
+        editor.current_file_path = ""
+
+        corpus = self.make_corpus()
+        files = [path for path, _ in corpus]
+        editor._add_file_records([(path, -1, -1) for path in files], update_label=False)
+
+        # 预览：解码并缩放到预览区域，按格式分别统计
+        for fmt in self.formats:
+            paths = [path for path, file_format in corpus if file_format == fmt]
+            if paths:
+                samples, total = self._timed(editor.update_image_preview, paths)
+                results[f"preview_{fmt}"] = self.summarize(samples, total)
+
+        if not self._wait_for_exiftool():
+            self.notes.append("没有可用的ExifTool，跳过读取和写入测试")
+        else:
+            # 读取：逐个读取和流水线批量读取，都不使用缓存和索引
+            editor.metadata_cache.clear()
+            editor.metadata_index.clear()
+            samples, total = self._timed(editor.get_file_metadata, files)
+            results["read"] = self.summarize(samples, total)
+            editor.metadata_cache.clear()
+            editor.metadata_index.clear()
+            started = time.perf_counter()
+            editor._prefetch_metadata(files)
+            elapsed = time.perf_counter() - started
+            results["read_batch"] = {"count": len(files), "total_s": round(elapsed, 4),
+                                     "per_second": round(len(files) / elapsed, 1) if elapsed > 0 else None}
+
+            # 写入：逐个写入，以及与批处理相同的流水线写入
+            plans = {path: editor.create_random_metadata(rng=rng) for path in files}
+            samples, total = self._timed(lambda path: editor._write_metadata([path], plans[path]), files)
+            results["write"] = self.summarize(samples, total)
+            plans = {path: editor.create_random_metadata(rng=rng) for path in files}
+            editor.metadata_cache.clear()
+            editor.metadata_index.clear()
+            progress = ProgressReporter(QProgressDialog(), len(plans))
+            started = time.perf_counter()
+            batch_results, _, _ = editor._apply_metadata_streaming(plans, progress, None)
+            elapsed = time.perf_counter() - started
+            results["write_batch"] = {"count": len(batch_results), "total_s": round(elapsed, 4),
+                                      "per_second": round(len(batch_results) / elapsed, 1) if elapsed > 0 else None,
+                                      "failed": sum(1 for _, status, _ in batch_results if status != "success")}
+
+        return {
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "environment": {
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "qt": QT_VERSION_STR,
+                "cpu_count": os.cpu_count(),
+                "backend": editor.exiftool_backend.name,
+                "exiftool": editor.exiftool_path,
+                "exiftool_version": editor.exiftool_info.get("version", ""),
+                "pool_size": editor.exiftool_pool.size if editor.exiftool_pool else 0,
+            },
+            "parameters": {
+                "count": self.count,
+                "sizes": [f"{width}x{height}" for width, height in self.sizes],
+                "formats": self.formats,
+                "seed": self.seed,
+                "list_rows": self.list_rows,
+                "corpus_files": len(files),
+            },
+            "results": results,
+            "notes": self.notes,
+        }
+
+    @classmethod
+    def main(cls):
+        """--benchmark 的入口，返回退出码"""
+        # 基准测试不弹出任何对话框，ExifTool找不到时也不在后台搜索
+        backend = None
+        if _argv_option("benchmark-backend", "exiftool") == "fake":
+            backend = FakeExifToolBackend(latency=float(_argv_option("benchmark-latency", "0")))
+        editor = ImageMetadataEditor(exiftool_backend=backend)
+        if getattr(editor, "exiftool_search_timer", None) is not None:
+            editor.exiftool_search_timer.stop()
+        # 合成图片的元数据不写入用户的元数据索引
+        editor.metadata_index.close()
+        editor.metadata_index = MetadataIndex(":memory:").open()
+        exiftool = _argv_option("exiftool")
+        if exiftool:
+            editor.exiftool_path = exiftool
+            editor.start_exiftool()
+        editor.resize(1200, 800)
+
+        sizes = []
+        for item in _argv_option("benchmark-sizes", "640x480,1920x1080").split(","):
+            width, _, height = item.lower().partition("x")
+            sizes.append((int(width), int(height)))
+        formats = [fmt.strip().lower() for fmt in _argv_option("benchmark-formats", "jpeg,png,tiff,webp").split(",")]
+        unknown = [fmt for fmt in formats if fmt not in cls.FORMATS]
+        if unknown:
+            log_app.error("不支持的图片格式: %s（可选: %s）", ", ".join(unknown), ", ".join(cls.FORMATS))
+            return 2
+
+        corpus_dir = _argv_option("benchmark-dir")
+        temporary = None
+        if not corpus_dir:
+            temporary = tempfile.TemporaryDirectory(prefix="metadata_bench_")
+            corpus_dir = temporary.name
+        try:
+            benchmark = cls(editor, corpus_dir,
+                            count=int(_argv_option("benchmark-count", "20")),
+                            sizes=sizes,
+                            formats=formats,
+                            seed=int(_argv_option("benchmark-seed", "1234")),
+                            list_rows=int(_argv_option("benchmark-rows", "100000")))
+            report = benchmark.run()
+        finally:
+            if editor.exiftool_pool is not None:
+                editor.exiftool_pool.close()
+            if temporary is not None:
+                temporary.cleanup()
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        output = _argv_option("benchmark-output")
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            log_app.info("基准测试结果已写入: %s", output)
+        else:
+            print(text)
+        return 0
+
+def make_plan_main():
+    """--make-plan 的入口：不显示窗口，为指定的文件和文件夹生成计划文件，返回退出码
+
+    --plan-files=路径1;路径2        图片文件或文件夹（递归查找图片），多个路径用os.pathsep分隔（Windows为";"，其他系统为":"）
+    --plan-template=模板.json      自定义模式的模板，值为null的字段随机生成；不指定时全部随机生成
+    --plan-seed=整数               随机种子，与文件、模板和参考时间相同时生成完全相同的计划
+    --plan-time="2024-01-01 12:00:00"  随机日期的参考时间，默认为当前时间
+    --plan-diff=0                  不读取文件当前的元数据比较，计划写入全部字段
+    --plan-output=计划.jsonl       默认保存在jobs文件夹中
+    """
+    backend = FakeExifToolBackend() if _argv_option("plan-backend") == "fake" else None
+    editor = ImageMetadataEditor(exiftool_backend=backend)
+    if getattr(editor, "exiftool_search_timer", None) is not None:
+        editor.exiftool_search_timer.stop()
+    exiftool = _argv_option("exiftool")
+    if exiftool:
+        editor.exiftool_path = exiftool
+        editor.start_exiftool()
+    try:
+        files = []
+        for item in _argv_option("plan-files").split(os.pathsep):
+            if os.path.isdir(item):
+                scanner = FolderScanner([os.path.abspath(item)])
+                scanner._run()
+                files.extend(path for path, _, _ in scanner.take_batches())
+            elif os.path.isfile(item):
+                files.append(os.path.normpath(os.path.abspath(item)))
+            elif item:
+                log_app.warning("文件或文件夹不存在: %s", item)
+        # 按路径排序，计划与文件系统返回的顺序无关
+        files = sorted(set(files))
+        if not files:
+            log_app.error("没有找到图片文件，请用 --plan-files 指定")
+            return 2
+
+        template = None
+        if _argv_option("plan-template"):
+            with open(_argv_option("plan-template"), "r", encoding="utf-8") as f:
+                template = json.load(f)
+        seed = int(_argv_option("plan-seed")) if _argv_option("plan-seed") else None
+        reference_time = None
+        if _argv_option("plan-time"):
+            reference_time = datetime.datetime.strptime(_argv_option("plan-time"), "%Y-%m-%d %H:%M:%S")
+        diff = _argv_option("plan-diff", "1") != "0"
+        if diff and not editor.exiftool_backend.available(editor.exiftool_path):
+            log_app.warning("ExifTool路径未设置或无效，不与文件当前的元数据比较")
+            diff = False
+
+        files_metadata, generation = editor._generate_files_metadata(files, template, seed, reference_time)
+        plan = editor.build_plan(files_metadata, "自定义模式" if template is not None else "随机模式",
+                                 generation, diff)
+        path = plan.save(_argv_option("plan-output") or None)
+    except (OSError, ValueError) as e:
+        log_app.error("生成计划时出错: %s", e)
+        return 2
+    finally:
+        if editor.exiftool_pool is not None:
+            editor.exiftool_pool.close()
+    write_files, write_bytes = plan.write_totals()
+    log_app.info("计划已保存到: %s（%d 个文件，需要写入 %d 个，种子 %s）", path, len(plan.entries), write_files,
+                 generation["seed"])
+    return 0
+
+def apply_plan_main():
+    """--apply-plan=计划.jsonl 的入口：不需要图形界面，流式执行计划文件，有文件失败时返回1
+
+    --plan-root=文件夹      计划中文件的公共目录在本机的位置，文件位于其他路径时使用
+    --plan-results=jsonl    处理结果的记录格式（jsonl/csv），为空时不记录
+    --plan-pending=32       同时在途的ExifTool命令数
+    --exiftool=路径         默认使用设置中保存的路径或PATH中的exiftool
+    """
+    plan_path = _argv_option("apply-plan")
+    executable, backend = _plan_executable()
+    if not executable:
+        return 2
+
+    recorder = None
+    try:
+        header = next(BatchPlan.iter_records(plan_path))
+        result_format = _argv_option("plan-results", "jsonl")
+        if result_format:
+            recorder = ResultRecorder.create(result_format, header.get("plan_id"))
+        applier = PlanApplier(executable, backend=backend, max_pending=int(_argv_option("plan-pending", "32")),
+                              root=_argv_option("plan-root"), recorder=recorder)
+        counts = applier.run(plan_path)
+    except (OSError, ValueError) as e:
+        log_app.error("执行计划时出错: %s", e)
+        return 2
+    finally:
+        if recorder is not None:
+            recorder.close()
+            log_job.info("处理结果已记录到: %s", recorder.path)
+    log_job.info("计划执行完成: 成功 %d, 跳过 %d, 失败 %d, 已隔离 %d",
+                 counts["success"], counts["skipped"], counts["failed"], counts["quarantined"])
+    print(json.dumps(counts))
+    return 1 if counts["failed"] or counts["quarantined"] else 0
+
+def split_plan_main():
+    """--split-plan=计划.jsonl --shard-dir=共享文件夹 的入口：把计划拆分为分片，供多个工作进程处理
+
+    --shard-size=1000   每个分片的文件数
+    """
+    shard_dir = _argv_option("shard-dir")
+    if not shard_dir:
+        log_app.error("请用 --shard-dir 指定分片所在的共享文件夹")
+        return 2
+    try:
+        job = ShardedJob.split(_argv_option("split-plan"), shard_dir, int(_argv_option("shard-size", "1000")))
+    except (OSError, ValueError) as e:
+        log_app.error("拆分计划时出错: %s", e)
+        return 2
+    log_job.info("计划已拆分为 %d 个分片: %s", job.status()["pending"], shard_dir)
+    return 0
+
+def shard_worker_main():
+    """--shard-worker=共享文件夹 的入口：认领并执行分片，直到所有分片完成；可以在多台机器上同时运行
+
+    --worker-id=名称        默认为 主机名-进程号
+    --lease-timeout=300     租约超时秒数，超时未续期的分片由其他工作进程接手
+    --plan-root、--plan-pending、--exiftool 与 --apply-plan 相同
+    """
+    job = ShardedJob(_argv_option("shard-worker"))
+    executable, backend = _plan_executable()
+    if not executable:
+        return 2
+    worker_id = _argv_option("worker-id") or f"{platform.node()}-{os.getpid()}"
+    lease_timeout = float(_argv_option("lease-timeout", "300"))
+
+    def make_applier(recorder):
+        return PlanApplier(executable, backend=backend, max_pending=int(_argv_option("plan-pending", "32")),
+                           root=_argv_option("plan-root"), recorder=recorder)
+
+    try:
+        counts = job.work(worker_id, make_applier, lease_timeout, poll_interval=min(5.0, lease_timeout / 3))
+    except (OSError, ValueError) as e:
+        log_app.error("处理分片时出错: %s", e)
+        return 2
+    log_job.info("工作进程 %s 完成: 成功 %d, 跳过 %d, 失败 %d, 已隔离 %d", worker_id,
+                 counts["success"], counts["skipped"], counts["failed"], counts["quarantined"])
+    print(json.dumps(counts))
+    return 1 if counts["failed"] or counts["quarantined"] else 0
+
+def service_main():
+    """--service 的入口：不显示窗口，在本机提供HTTP/JSON任务服务（见JobService），按Ctrl+C停止
+
+    --service-port=8765         监听的端口（只监听127.0.0.1）
+    --service-concurrency=2     同时执行的任务数，也是ExifTool进程数
+    --service-queue=16          排队任务数上限，队列已满时提交任务返回429
+    --exiftool=路径             默认使用设置中保存的路径
+    """
+    backend = FakeExifToolBackend() if _argv_option("service-backend") == "fake" else None
+    editor = ImageMetadataEditor(exiftool_backend=backend)
+    if getattr(editor, "exiftool_search_timer", None) is not None:
+        editor.exiftool_search_timer.stop()
+    if _argv_option("exiftool"):
+        editor.exiftool_path = _argv_option("exiftool")
+    if not editor.exiftool_backend.available(editor.exiftool_path):
+        log_app.error("找不到ExifTool，请用 --exiftool 指定")
+        return 2
+    service = JobService(editor, concurrency=int(_argv_option("service-concurrency", "2")),
+                         max_queue=int(_argv_option("service-queue", "16")))
+    # 收到SIGTERM时与Ctrl+C一样正常停止；serve_forever在主线程中运行，要从其他线程调用shutdown()
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=service.shutdown).start())
+    try:
+        service.serve(int(_argv_option("service-port", "8765")))
+    except KeyboardInterrupt:
+        log_app.info("任务服务正在停止")
+    except OSError as e:
+        log_app.error("无法启动任务服务: %s", e)
+        return 2
+    finally:
+        service.shutdown()
+    return 0
+
+def watch_main():
+    """--watch 的入口：不显示窗口，监视文件夹并按保存的模板自动处理新图片（见FolderWatcher），按Ctrl+C停止
+
+    --watch=文件夹1;文件夹2       要监视的文件夹，多个文件夹用os.pathsep分隔（Windows为";"，其他系统为":"）
+    --watch-template=模板.json    默认使用"保存当前设置为模板"保存的模板
+    --watch-workers=2             同时写入的ExifTool进程数
+    --watch-batch=200             每个小批次最多的文件数
+    --watch-wait=2                写入完成的文件最多等待多少秒凑成一个批次
+    --watch-stable=2              文件大小和修改时间多少秒不变才算写入完成
+    --watch-poll=5                不能使用inotify时扫描文件夹的间隔秒数；--watch-polling=1 强制使用扫描
+    --watch-index=索引.jsonl      已处理文件索引，默认为jobs文件夹中的watch_index.jsonl
+    --exiftool=路径               默认使用设置中保存的路径
+    """
+    roots = [item for item in _argv_option("watch").split(os.pathsep) if item]
+    missing = [root for root in roots if not os.path.isdir(root)]
+    if not roots or missing:
+        log_app.error("要监视的文件夹不存在: %s", ", ".join(missing) or "（未指定）")
+        return 2
+    backend = FakeExifToolBackend() if _argv_option("watch-backend") == "fake" else None
+    editor = ImageMetadataEditor(exiftool_backend=backend)
+    if getattr(editor, "exiftool_search_timer", None) is not None:
+        editor.exiftool_search_timer.stop()
+    if _argv_option("exiftool"):
+        editor.exiftool_path = _argv_option("exiftool")
+    if not editor.exiftool_backend.available(editor.exiftool_path):
+        log_app.error("找不到ExifTool，请用 --exiftool 指定")
+        return 2
+    try:
+        if _argv_option("watch-template"):
+            with open(_argv_option("watch-template"), "r", encoding="utf-8") as f:
+                template = json.load(f)
+        else:
+            template = editor.saved_template()
+    except (OSError, ValueError) as e:
+        log_app.error("无法读取模板: %s", e)
+        return 2
+    if template is None:
+        log_app.error("没有保存的设置模板，请先在自定义模式中保存模板，或用 --watch-template 指定")
+        return 2
+    watcher = FolderWatcher(
+        editor, roots, template,
+        index=WatchIndex(_argv_option("watch-index") or WatchIndex.default_path()),
+        workers=int(_argv_option("watch-workers", "2")),
+        batch_size=int(_argv_option("watch-batch", "200")),
+        batch_wait=float(_argv_option("watch-wait", "2")),
+        stable_seconds=float(_argv_option("watch-stable", "2")),
+        poll_interval=float(_argv_option("watch-poll", "5")),
+        use_inotify=_argv_option("watch-polling") != "1",
+    )
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        log_app.info("正在停止监视")
+        watcher.stop()
+    except OSError as e:
+        log_app.error("监视文件夹时出错: %s", e)
+        return 2
+    return 0
+
+def _plan_executable():
+    """执行计划用的ExifTool路径和后端；--plan-backend=fake 时使用内置的替身"""
+    if _argv_option("plan-backend") == "fake":
+        return "fake-exiftool", FakeExifToolBackend()
+    executable = (_argv_option("exiftool")
+                  or QSettings("ImageMetadataEditor", "settings").value("exiftool_path", "")
+                  or ExifToolLocator.find_quick([]))
+    if not executable:
+        log_app.error("找不到ExifTool，请用 --exiftool 指定")
+    return executable, None
+
+def report_startup(exit_after=False):
+    """窗口第一次显示后输出启动耗时报告；exit_after为True时以JSON格式输出并退出"""
+    STARTUP_TIMER.mark("首次绘制")
+    stages = STARTUP_TIMER.report()
+    if exit_after:
+        print(json.dumps(stages, ensure_ascii=False))
+        QApplication.exit(0)
+    else:
+        log_app.info("启动耗时: %s", ", ".join(f"{name} {ms:.0f}ms" for name, ms in stages.items()))
+
+def _argv_option(name, default=""):
+    """读取 --name=value 形式的命令行参数"""
+    prefix = f"--{name}="
+    for arg in sys.argv[1:]:
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+    return default
 
 if __name__ == "__main__":
+    STARTUP_TIMER.mark("导入模块")
+    # 日志级别、子系统级别和日志文件可以在设置中保存，也可以用命令行参数临时指定
+    # 例如: --log-level=DEBUG --log-subsystems=preview=DEBUG,write=WARNING --log-file=editor.log
+    log_settings_store = QSettings("ImageMetadataEditor", "settings")
+    setup_logging(
+        _argv_option("log-level", log_settings_store.value("log_level", "INFO")),
+        parse_subsystem_levels(_argv_option("log-subsystems", log_settings_store.value("log_subsystems", ""))),
+        _argv_option("log-file", log_settings_store.value("log_file", "")),
+    )
+    if _argv_option("apply-plan"):
+        # 执行计划和分片处理不需要界面
+        sys.exit(apply_plan_main())
+    if _argv_option("split-plan"):
+        sys.exit(split_plan_main())
+    if _argv_option("shard-worker"):
+        sys.exit(shard_worker_main())
+    if _argv_option("shard-status"):
+        print(json.dumps(ShardedJob(_argv_option("shard-status")).status(), ensure_ascii=False))
+        sys.exit(0)
+    if "--service" in sys.argv:
+        # 任务服务不需要显示器
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QApplication(sys.argv)
+        sys.exit(service_main())
+    if _argv_option("watch"):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QApplication(sys.argv)
+        sys.exit(watch_main())
+    if "--make-plan" in sys.argv:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QApplication(sys.argv)
+        sys.exit(make_plan_main())
+    if "--benchmark" in sys.argv:
+        # 基准测试不需要显示窗口，没有指定平台时使用offscreen，可以在没有图形界面的Linux上运行
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QApplication(sys.argv)
+        sys.exit(Benchmark.main())
     app = QApplication(sys.argv)
+    STARTUP_TIMER.mark("创建QApplication")
     editor = ImageMetadataEditor()
     editor.show()
+    STARTUP_TIMER.mark("显示窗口")
+    # 事件循环开始后窗口才真正绘制，此时输出启动报告；--startup-report 用于记录启动耗时的变化
+    QTimer.singleShot(0, lambda: report_startup("--startup-report" in sys.argv))
     sys.exit(app.exec_())
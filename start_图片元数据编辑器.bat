@@ -41,19 +41,6 @@ if %errorlevel% neq 0 (
     )
 )
 
-python -c "import exiftool" >nul 2>&1
-if %errorlevel% neq 0 (
-    set DEPENDENCIES_OK=0
-    echo     - 正在安装pyexiftool...
-    pip install pyexiftool==0.5.5
-    if %errorlevel% neq 0 (
-        color 0C
-        echo 错误: pyexiftool安装失败
-        pause
-        exit /b
-    )
-)
-
 python -c "from PIL import Image" >nul 2>&1
 if %errorlevel% neq 0 (
     set DEPENDENCIES_OK=0
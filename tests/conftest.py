@@ -0,0 +1,71 @@
+"""测试共用的fixture：以offscreen平台加载1.py，设置和任务文件都保存在临时文件夹中"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import QCoreApplication, QEvent, QSettings
+from PyQt5.QtWidgets import QApplication
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "1.py")
+
+_qt_app = None
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """加载1.py；设置保存在临时文件夹中，不影响本机已保存的设置"""
+    global _qt_app
+    QSettings.setDefaultFormat(QSettings.IniFormat)
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, str(tmp_path_factory.mktemp("settings")))
+    spec = importlib.util.spec_from_file_location("image_metadata_editor", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    _qt_app = QApplication.instance() or QApplication([])
+    return module
+
+
+@pytest.fixture
+def jobs_dir(app, tmp_path, monkeypatch):
+    """任务日志、计划和结果文件写入临时文件夹，而不是程序目录下的jobs"""
+    path = str(tmp_path / "jobs")
+    monkeypatch.setattr(app.BatchJournal, "journal_dir", staticmethod(lambda: path))
+    return path
+
+
+@pytest.fixture
+def make_files(tmp_path):
+    """在临时文件夹中创建以JPEG文件头开始的小文件，返回路径列表"""
+    def make(*names):
+        paths = []
+        for name in names:
+            path = tmp_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"\xff\xd8\xff\xe0" + name.encode("utf-8"))
+            paths.append(str(path))
+        return paths
+    return make
+
+
+@pytest.fixture
+def editor(app, jobs_dir):
+    """editor(backend)创建使用指定ExifTool后端的编辑器，测试结束时关闭其ExifTool进程"""
+    created = []
+
+    def create(backend):
+        editor = app.ImageMetadataEditor(exiftool_backend=backend)
+        created.append(editor)
+        return editor
+    yield create
+    for editor in created:
+        if editor.exiftool_pool is not None:
+            editor.exiftool_pool.close()
+        # 立即删除窗口：留给垃圾回收时，可能在之后创建的窗口发出事件时，
+        # 旧窗口的属性已被清空但仍作为事件过滤器收到事件
+        editor.deleteLater()
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
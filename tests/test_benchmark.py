@@ -0,0 +1,17 @@
+"""Benchmark：用合成图片和ExifTool替身完整运行一遍，不改变全局random的状态"""
+import random
+
+
+def test_benchmark_runs_without_touching_global_random_state(app, editor, tmp_path):
+    ed = editor(app.FakeExifToolBackend())
+    ed.metadata_index.close()
+    ed.metadata_index = app.MetadataIndex(":memory:").open()
+    benchmark = app.Benchmark(ed, str(tmp_path / "corpus"), count=2, sizes=((64, 48),), formats=("jpeg",),
+                              list_rows=100)
+    random.seed(1)
+    expected = random.random()
+    random.seed(1)
+    report = benchmark.run()
+    assert random.random() == expected
+    assert report["results"]["write"]["count"] == 2
+    assert report["results"]["write_batch"]["failed"] == 0
@@ -0,0 +1,135 @@
+"""用FakeExifToolBackend测试读写流程：跳过没有变化的字段和文件、超时和崩溃的重试与隔离"""
+import json
+import time
+
+import pytest
+
+
+def written_files(fake, files):
+    """收到写入命令的文件（按命令顺序）"""
+    return [path for args in fake.commands if "-overwrite_original" in args for path in files if path in args]
+
+
+def test_fake_backend_reads_back_written_tags(app, make_files):
+    path, = make_files("a.jpg")
+    fake = app.FakeExifToolBackend()
+    status, stdout, _ = fake.run(["exiftool", "-overwrite_original", "-Make=Apple", "-GPSLatitude=1.5", path])
+    assert status == 0
+    assert b"1 image files updated" in stdout
+    status, stdout, _ = fake.run(["exiftool", "-j", path])
+    [record] = json.loads(stdout)
+    assert record["EXIF:Make"] == "Apple"
+    assert record["GPS:GPSLatitude"] == "1.5"
+
+
+def test_plan_changes_only_returns_changed_fields(app, editor, make_files):
+    path, = make_files("a.jpg")
+    fake = app.FakeExifToolBackend(metadata={path: {
+        "EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3", "XMP:Title": "旧标题", "EXIF:ExposureTime": "1/60",
+        "GPS:GPSLatitude": "34 deg 3' 7.92\" N", "Composite:GPSPosition": "34.0522 N"}})
+    changes = editor(fake)._plan_changes(path, {
+        "Make": "Sony", "Model": "ILCE-7M4", "Software": "__NO_CHANGE__",
+        "ExposureTime": "0.016667", "GPSLatitude": "34.0522",
+        "Title": "", "Creator": "",
+    })
+    # 数值按换算后的值比较；已有的字段清空需要写入，本来就没有的字段不需要
+    assert changes == {"Model": "ILCE-7M4", "Title": ""}
+
+
+@pytest.mark.parametrize("stream_mode", [True, False])
+def test_apply_skips_files_without_changes(app, editor, make_files, monkeypatch, stream_mode):
+    same, changed, other = make_files("same.jpg", "changed.jpg", "other.jpg")
+    fake = app.FakeExifToolBackend(metadata={
+        same: {"EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3"},
+        changed: {"EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3"},
+        other: {},
+    })
+    ed = editor(fake)
+    results = []
+    monkeypatch.setattr(ed, "_show_batch_results", lambda batch_results, mode_name: results.extend(batch_results))
+    ed.stream_mode_check.setChecked(stream_mode)
+    ed.add_files([same, changed, other])
+
+    fake.commands.clear()
+    ed.apply_metadata({
+        same: {"Make": "Sony", "Model": "ILCE-7M3"},
+        changed: {"Make": "Sony", "Model": "ILCE-7M4"},
+        other: {"Make": "Sony", "Model": "ILCE-7M4"},
+    })
+    assert {path: status for path, status, _ in results} == {same: "skipped", changed: "success", other: "success"}
+    assert sorted(written_files(fake, [same, changed, other])) == sorted([changed, other])
+    # 只写入有变化的字段
+    assert all("-Make=Sony" not in args for args in fake.commands if changed in args)
+    assert fake.metadata[changed]["EXIF:Model"] == "ILCE-7M4"
+
+
+def test_stream_quarantines_hanging_and_crashing_commands(app, make_files):
+    ok, hang, crash, after = make_files("ok.jpg", "hang.jpg", "crash.jpg", "after.jpg")
+    fake = app.FakeExifToolBackend(hang_patterns=["hang.jpg"], crash_patterns=["crash.jpg"])
+    stream = app.ExifToolStream("fake-exiftool", call_timeout=0.3, max_retries=1, retry_backoff=0.01, backend=fake)
+    stream.start()
+    try:
+        for path in (ok, hang, crash, after):
+            stream.submit(["-Make=Apple", path], tag=path)
+        results = {}
+        deadline = time.monotonic() + 20
+        while len(results) < 4 and time.monotonic() < deadline:
+            result = stream.get_result(timeout=0.5)
+            if result is not None:
+                results[result[0]] = result[1]
+    finally:
+        stream.close()
+
+    assert results == {ok: 0, hang: app.ExifToolStream.STATUS_TIMEOUT,
+                       crash: app.ExifToolStream.STATUS_CRASHED, after: 0}
+    # 每个出问题的命令：第一次出错和重试一次各重启一次进程
+    assert stream.restarts == 4
+    # 排在卡住的命令后面的文件被重新提交，最终只写入一次
+    assert fake.metadata[after] == {"EXIF:Make": "Apple"}
+
+
+def test_write_reports_quarantined_files(app, editor, make_files):
+    ok, hang = make_files("ok.jpg", "hang.jpg")
+    fake = app.FakeExifToolBackend(hang_patterns=["hang.jpg"])
+    ed = editor(fake)
+    ed.exiftool_timeout = 0.3
+    errors = {}
+    assert ed._write_metadata([hang], {"Make": "Apple"}, errors) == "quarantined"
+    assert errors[hang]
+    # 进程被重启后可以继续使用
+    assert ed._write_metadata([ok], {"Make": "Apple"}) == "success"
+    assert fake.metadata[ok]["EXIF:Make"] == "Apple"
+
+
+def test_pool_restores_stream_defaults_on_release(app):
+    pool = app.ExifToolPool("fake-exiftool", size=1, backend=app.FakeExifToolBackend())
+    pool.start()
+    try:
+        stream = pool.acquire(timeout=10)
+        defaults = (stream.max_retries, stream.max_pending, stream.call_timeout)
+        pool.release(stream)
+        stream = pool.acquire(timeout=10, max_retries=0, max_pending=1, call_timeout=1.0)
+        assert (stream.max_retries, stream.max_pending, stream.call_timeout) == (0, 1, 1.0)
+        pool.release(stream)
+        stream = pool.acquire(timeout=10)
+        assert (stream.max_retries, stream.max_pending, stream.call_timeout) == defaults
+        pool.release(stream)
+    finally:
+        pool.close()
+
+
+def test_stream_fails_commands_when_not_running(app):
+    stream = app.ExifToolStream("fake-exiftool", backend=app.FakeExifToolBackend())
+    status, _, stderr = stream.execute(["-ver"], timeout=2)
+    assert status == app.ExifToolStream.STATUS_CRASHED
+    assert stderr
+
+
+def test_interactive_read_gives_up_quickly(app, editor, make_files):
+    hang, ok = make_files("hang.jpg", "ok.jpg")
+    ed = editor(app.FakeExifToolBackend(hang_patterns=["hang.jpg"]))
+    ed.exiftool_read_timeout = 0.5
+    started = time.monotonic()
+    assert ed.get_file_metadata(hang) is None
+    assert time.monotonic() - started < ed.exiftool_timeout
+    assert ed.get_file_metadata(ok) is not None
@@ -0,0 +1,51 @@
+"""BatchJournal：计划和完成记录、查找未完成的任务、崩溃后写了一半的最后一行"""
+
+PLAN = {
+    "/photos/a.jpg": {"Make": "Sony"},
+    "/photos/b.jpg": {"Make": "Canon"},
+    "/photos/c.jpg": {"Make": "Nikon"},
+}
+
+
+def test_unfinished_journal_resumes_remaining_files(app, tmp_path):
+    journal = app.BatchJournal.create("随机模式", PLAN, str(tmp_path))
+    journal.mark_done("/photos/a.jpg", "success")
+    journal.mark_done("/photos/b.jpg", "failed")
+    journal.close()
+
+    [loaded] = app.BatchJournal.find_unfinished(str(tmp_path))
+    assert loaded.path == journal.path
+    assert loaded.job_info["mode"] == "随机模式"
+    assert loaded.job_info["total"] == 3
+    # 失败的文件和没有处理的文件按计划顺序恢复，使用计划中的元数据
+    assert loaded.remaining() == {"/photos/b.jpg": {"Make": "Canon"}, "/photos/c.jpg": {"Make": "Nikon"}}
+
+
+def test_finished_journal_is_not_offered_for_resume(app, tmp_path):
+    journal = app.BatchJournal.create("自定义模式", PLAN, str(tmp_path))
+    for file_path in PLAN:
+        journal.mark_done(file_path, "success")
+    journal.finish()
+
+    assert app.BatchJournal.load(journal.path).finished
+    assert app.BatchJournal.find_unfinished(str(tmp_path)) == []
+
+
+def test_resume_after_torn_last_line(app, tmp_path):
+    journal = app.BatchJournal.create("随机模式", PLAN, str(tmp_path))
+    journal.mark_done("/photos/a.jpg", "success")
+    journal.close()
+    # 模拟写到一半时崩溃
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"type": "done", "file": "/photos/b.jpg", "sta')
+
+    loaded = app.BatchJournal.load(journal.path)
+    assert list(loaded.remaining()) == ["/photos/b.jpg", "/photos/c.jpg"]
+    loaded.reopen()
+    loaded.mark_done("/photos/b.jpg", "success")
+    loaded.mark_done("/photos/c.jpg", "success")
+    loaded.finish()
+
+    reloaded = app.BatchJournal.load(journal.path)
+    assert reloaded.finished
+    assert reloaded.remaining() == {}
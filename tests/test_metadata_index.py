@@ -0,0 +1,76 @@
+"""MetadataIndex：按大小和修改时间验证记录、写入后标记为需要重新读取、跨会话使用"""
+import os
+
+
+def test_entries_are_valid_only_for_same_size_and_mtime(app, tmp_path):
+    index = app.MetadataIndex(str(tmp_path / "index.sqlite3")).open()
+    metadata = {"EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3"}
+    index.put("/photos/a.jpg", 100, 1000, metadata)
+    assert index.get("/photos/a.jpg", 100, 1000) == metadata
+    index.close()
+
+    index = app.MetadataIndex(str(tmp_path / "index.sqlite3")).open()
+    try:
+        assert index.get("/photos/a.jpg", 100, 1000) == metadata
+        assert index.get("/photos/a.jpg", 101, 1000) is None
+        assert index.get("/photos/a.jpg", 100, 1001) is None
+        assert index.get("/photos/b.jpg", 100, 1000) is None
+        assert index.count() == 1
+    finally:
+        index.close()
+
+
+def test_record_write_keeps_tags_but_marks_metadata_stale(app, make_files):
+    path, = make_files("a.jpg")
+    stat = os.stat(path)
+    index = app.MetadataIndex(":memory:").open()
+    index.put(path, stat.st_size, stat.st_mtime_ns,
+              {"EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3", "EXIF:LensModel": "FE 24-70mm"})
+    index.record_write(path, {"Make": "Apple", "Model": "", "Software": "17.0"})
+    # 完整元数据需要重新读取，常用标签使用写入的值
+    assert index.get(path, stat.st_size, stat.st_mtime_ns) is None
+    size, mtime_ns, make, model, lens, _ = index.lookup([path])[path]
+    assert (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+    assert (make, model, lens) == ("Apple", None, "FE 24-70mm")
+    index.close()
+
+
+def test_editor_reuses_index_across_sessions(app, editor, make_files, tmp_path, monkeypatch):
+    first, second = make_files("a.jpg", "b.jpg")
+    fake = app.FakeExifToolBackend(metadata={first: {"EXIF:Make": "Sony"}, second: {"EXIF:Make": "Canon"}})
+    index_path = str(tmp_path / "index.sqlite3")
+
+    def open_editor():
+        ed = editor(fake)
+        ed.metadata_index.close()
+        ed.metadata_index = app.MetadataIndex(index_path).open()
+        return ed
+
+    def reads():
+        return sum(1 for args in fake.commands if "-j" in args)
+
+    ed = open_editor()
+    assert ed.get_file_metadata(first)["EXIF:Make"] == "Sony"
+    assert ed.get_file_metadata(second)["EXIF:Make"] == "Canon"
+    ed.metadata_index.close()
+
+    # 新的会话：文件没有变化，直接使用索引中的元数据
+    ed = open_editor()
+    before = reads()
+    assert ed.get_file_metadata(first)["EXIF:Make"] == "Sony"
+    assert ed.get_file_metadata(second)["EXIF:Make"] == "Canon"
+    assert reads() == before
+
+    # 本程序写入后重新读取，被其他程序修改的文件也重新读取
+    results = []
+    monkeypatch.setattr(ed, "_show_batch_results", lambda batch_results, mode_name: results.extend(batch_results))
+    ed.add_files([first, second])
+    ed.apply_metadata({first: {"Make": "Apple"}, second: {"Make": "Canon"}})
+    assert {path: status for path, status, _ in results} == {first: "success", second: "skipped"}
+    with open(second, "ab") as f:
+        f.write(b"modified")
+    before = reads()
+    assert ed.get_file_metadata(first)["EXIF:Make"] == "Apple"
+    assert ed.get_file_metadata(second)["EXIF:Make"] == "Canon"
+    assert reads() == before + 2
+    ed.metadata_index.close()
@@ -0,0 +1,148 @@
+"""执行计划：耗时模型、试运行生成的计划、计划文件的保存和读取、随机值的可重复性"""
+import datetime
+import os
+import random
+
+import pytest
+
+MB = 1024 * 1024
+
+
+def test_cost_model_fits_per_file_and_per_mb_costs(app):
+    model = app.CostModel()
+    assert model.estimate(10, MB) is None
+    for files, mb in ((10, 10), (10, 50), (20, 20)):
+        model.add(files, mb * MB, 0.01 * files + 0.02 * mb)
+    per_file, per_mb = model.coefficients()
+    assert per_file == pytest.approx(0.01)
+    assert per_mb == pytest.approx(0.02)
+    assert model.estimate(100, 100 * MB) == pytest.approx(3.0)
+
+
+def test_cost_model_uses_per_file_cost_when_sizes_do_not_vary(app):
+    model = app.CostModel()
+    model.add(10, 10 * MB, 0.3)
+    model.add(20, 20 * MB, 0.6)
+    assert model.coefficients() == pytest.approx((0.03, 0.0))
+
+
+def test_cost_model_json_round_trip(app):
+    model = app.CostModel()
+    model.add(10, 10 * MB, 0.3)
+    model.add(10, 50 * MB, 1.1)
+    restored = app.CostModel.from_json(model.to_json())
+    assert restored.samples == 2
+    assert restored.coefficients() == pytest.approx(model.coefficients())
+    # 设置中保存的内容无效时重新开始统计
+    assert app.CostModel.from_json("not json").coefficients() is None
+
+
+def test_dry_run_saves_plan_without_touching_files(app, editor, make_files, jobs_dir, monkeypatch):
+    same, changed = make_files("same.jpg", "changed.jpg")
+    fake = app.FakeExifToolBackend(metadata={same: {"EXIF:Make": "Sony"}, changed: {"EXIF:Make": "Canon"}})
+    ed = editor(fake)
+    shown = []
+    monkeypatch.setattr(ed, "_show_plan", shown.append)
+
+    plan = ed.create_dry_run_plan({same: {"Make": "Sony"}, changed: {"Make": "Sony"}}, "自定义模式")
+    assert shown == [plan]
+    assert os.path.dirname(plan.path) == jobs_dir
+    assert plan.header["write_files"] == 1
+    # 校准写入的是临时文件夹中的副本，原文件不变
+    assert fake.metadata[changed] == {"EXIF:Make": "Canon"}
+    assert plan.header["estimated_seconds"] is not None
+
+    loaded = app.BatchPlan.load(plan.path)
+    entries = {entry["file"]: entry for entry in loaded.entries}
+    assert entries[same]["changes"] == {}
+    assert entries[changed]["changes"] == {"Make": "Sony"}
+    assert entries[changed]["args"][-1] == changed
+    assert app.BatchPlan.entry_is_current(entries[changed])
+    with open(changed, "ab") as f:
+        f.write(b"modified")
+    assert not app.BatchPlan.entry_is_current(entries[changed])
+
+
+def written_files(fake, files):
+    return [path for args in fake.commands if "-overwrite_original" in args for path in files if path in args]
+
+
+def test_plan_applier_skips_entries_without_changes(app, editor, make_files, tmp_path):
+    same, changed = make_files("same.jpg", "changed.jpg")
+    fake = app.FakeExifToolBackend(metadata={
+        same: {"EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3"},
+        changed: {"EXIF:Make": "Sony", "EXIF:Model": "ILCE-7M3"},
+    })
+    plan = editor(fake).build_plan({
+        same: {"Make": "Sony", "Model": "ILCE-7M3"},
+        changed: {"Make": "Sony", "Model": "ILCE-7M4"},
+    }, "自定义模式")
+
+    fake.commands.clear()
+    applier = app.PlanApplier("fake-exiftool", backend=fake, call_timeout=5)
+    counts = applier.run(plan.save(str(tmp_path / "plan.jsonl")))
+    assert counts == {"success": 1, "skipped": 1, "failed": 0, "quarantined": 0}
+    assert written_files(fake, [same, changed]) == [changed]
+    assert fake.metadata[changed]["EXIF:Model"] == "ILCE-7M4"
+
+
+def test_plan_applier_rewrites_files_modified_after_planning(app, editor, make_files, tmp_path):
+    path, = make_files("a.jpg")
+    fake = app.FakeExifToolBackend(metadata={path: {"EXIF:Make": "Sony"}})
+    plan = editor(fake).build_plan({path: {"Make": "Sony"}}, "自定义模式")
+    assert plan.entries[0]["changes"] == {}
+    plan_path = plan.save(str(tmp_path / "plan.jsonl"))
+
+    # 文件在生成计划后被修改，计划中的"无需写入"不再可信，写入计划的全部元数据
+    with open(path, "ab") as f:
+        f.write(b"modified")
+    fake.commands.clear()
+    counts = app.PlanApplier("fake-exiftool", backend=fake, call_timeout=5).run(plan_path)
+    assert counts["success"] == 1
+    assert written_files(fake, [path]) == [path]
+
+
+def test_plan_round_trip(app, editor, make_files, tmp_path):
+    files = make_files("a.jpg", "b.jpg", "c.jpg")
+    ed = editor(app.FakeExifToolBackend())
+    files_metadata, generation = ed._generate_files_metadata(files, seed=7,
+                                                             reference_time=datetime.datetime(2024, 5, 1, 12))
+    plan = ed.build_plan(files_metadata, "随机模式", generation, diff=False)
+    path = plan.save(str(tmp_path / "plan.jsonl"))
+
+    loaded = app.BatchPlan.load(path)
+    assert loaded.header == plan.header
+    assert loaded.entries == plan.entries
+    assert loaded.header["generation"] == generation
+    assert [record["type"] for record in app.BatchPlan.iter_records(path)] == ["header", "file", "file", "file"]
+    assert all(app.BatchPlan.entry_is_current(entry) for entry in loaded.entries)
+
+    broken = tmp_path / "broken.jsonl"
+    broken.write_text('{"type": "file"}\n', encoding="utf-8")
+    with pytest.raises(ValueError):
+        app.BatchPlan.load(str(broken))
+
+
+def test_generation_is_deterministic(app, editor, make_files):
+    files = make_files("a.jpg", "b.jpg", "c.jpg")
+    ed = editor(app.FakeExifToolBackend())
+    reference_time = datetime.datetime(2024, 5, 1, 12)
+    first, generation = ed._generate_files_metadata(files, seed=7, reference_time=reference_time)
+    second, _ = ed._generate_files_metadata(files, seed=7, reference_time=reference_time)
+    assert first == second
+    assert generation["seed"] == 7
+    # 每个文件的随机值只由种子和文件路径决定，与文件顺序和其他文件无关
+    single, _ = ed._generate_files_metadata(files[2:], seed=7, reference_time=reference_time)
+    assert single[files[2]] == first[files[2]]
+    other, _ = ed._generate_files_metadata(files, seed=8, reference_time=reference_time)
+    assert other != first
+
+
+def test_generation_leaves_global_random_state_alone(app, editor, make_files):
+    files = make_files("a.jpg", "b.jpg")
+    ed = editor(app.FakeExifToolBackend())
+    random.seed(1)
+    expected = random.random()
+    random.seed(1)
+    ed._generate_files_metadata(files, seed=7)
+    assert random.random() == expected
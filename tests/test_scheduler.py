@@ -0,0 +1,34 @@
+"""AdaptiveChunkScheduler：批大小随实测耗时调整，在途的字节数和参数长度有上限"""
+
+
+def test_chunk_grows_while_fast_and_halves_when_slow(app):
+    scheduler = app.AdaptiveChunkScheduler(initial_chunk=8, max_chunk=20, target_latency=1.0)
+    scheduler.record_chunk(8, 8000, 0.1)
+    assert scheduler.chunk_size == 12
+    for _ in range(5):
+        scheduler.record_chunk(scheduler.chunk_size, 0, 0.1)
+    assert scheduler.chunk_size == 20
+
+    scheduler.record_chunk(20, 0, 5.0)
+    assert scheduler.chunk_size == 10
+    for _ in range(10):
+        scheduler.record_chunk(scheduler.chunk_size, 0, 5.0)
+    assert scheduler.chunk_size == scheduler.min_chunk
+
+
+def test_chunk_size_ignores_empty_chunks(app):
+    scheduler = app.AdaptiveChunkScheduler(initial_chunk=8)
+    scheduler.record_chunk(0, 0, 0.1)
+    scheduler.record_chunk(5, 0, 0)
+    assert scheduler.chunk_size == 8
+    assert scheduler.files_per_second == 0
+
+
+def test_admit_limits_inflight_files_bytes_and_chars(app):
+    scheduler = app.AdaptiveChunkScheduler(initial_chunk=4, max_inflight_bytes=100, max_inflight_chars=50)
+    # 没有在途文件时总是放行，超大文件也能处理
+    assert scheduler.admit(0, 0, 0, 10 ** 9, 10 ** 6)
+    assert scheduler.admit(1, 50, 10, 40, 10)
+    assert not scheduler.admit(1, 50, 10, 60, 10)
+    assert not scheduler.admit(1, 0, 45, 0, 10)
+    assert not scheduler.admit(4, 0, 0, 0, 0)
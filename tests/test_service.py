@@ -0,0 +1,193 @@
+"""JobService：请求校验、背压、任务执行和结果，以及只接受本机请求"""
+import http.client
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def service(app, editor):
+    """service(backend, **参数)在后台线程中启动任务服务，返回 (服务, 端口)"""
+    started = []
+
+    def start(backend, **kwargs):
+        svc = app.JobService(editor(backend), progress_interval=0.05, **kwargs)
+        port = free_port()
+        thread = threading.Thread(target=svc.serve, args=(port,), daemon=True)
+        thread.start()
+        started.append((svc, thread))
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return svc, port
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.02)
+    yield start
+    for svc, thread in started:
+        svc.shutdown()
+        thread.join(10)
+
+
+def call(port, method, path, body=None, headers=None):
+    """发送请求，返回 (状态码, 响应头, 解析后的JSON)"""
+    data = body if body is None or isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data, method=method,
+                                     headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, json.loads(e.read() or b"null")
+
+
+def raw_call(port, method, path, headers, body=b""):
+    """不自动添加Host和Content-Length，用于发送不规范的请求"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.putrequest(method, path, skip_host=True, skip_accept_encoding=True)
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders(body or None)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+
+def wait_for_job(port, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        _, _, snapshot = call(port, "GET", f"/jobs/{job_id}")
+        if snapshot["status"] in ("done", "failed", "canceled") or time.monotonic() > deadline:
+            return snapshot
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    {"files": "a.jpg"},
+    {"files": ["a.jpg"], "template": ["Make"]},
+    {"files": ["a.jpg"], "seed": "1"},
+    {"files": ["a.jpg"], "seed": True},
+    {"files": ["a.jpg"], "reference_time": "yesterday"},
+    {"plan": {"a.jpg": "Sony"}},
+    [1, 2],
+])
+def test_invalid_requests_are_rejected(app, service, body):
+    _, port = service(app.FakeExifToolBackend())
+    status, _, response = call(port, "POST", "/jobs", body, {"Content-Type": "application/json"})
+    assert status == 400
+    assert response["error"]
+
+
+def test_unknown_paths_and_jobs(app, service):
+    _, port = service(app.FakeExifToolBackend())
+    assert call(port, "GET", "/nothing")[0] == 404
+    assert call(port, "GET", "/jobs/0123456789abcdef")[0] == 404
+    assert call(port, "DELETE", "/jobs/0123456789abcdef")[0] == 404
+    assert call(port, "POST", "/health", {})[0] == 404
+
+
+def test_requests_for_other_hosts_are_rejected(app, service):
+    _, port = service(app.FakeExifToolBackend())
+    for host in ["evil.example", f"evil.example:{port}", "127.0.0.1.evil.example", f"[::1]evil:{port}",
+                 "[::1", f"localhost:{port}:{port}", ""]:
+        assert raw_call(port, "GET", "/health", {"Host": host})[0] == 403, host
+    for host in [f"localhost:{port}", "LOCALHOST", "127.0.0.1", "::1", "[::1]", f"[::1]:{port}"]:
+        assert raw_call(port, "GET", "/health", {"Host": host})[0] == 200, host
+
+
+def test_oversized_body_is_rejected_without_reading_it(app, service):
+    svc, port = service(app.FakeExifToolBackend())
+    status, response = raw_call(port, "POST", "/jobs", {"Host": "127.0.0.1",
+                                                        "Content-Length": str(svc.MAX_BODY + 1)})
+    assert status == 413
+
+
+@pytest.mark.parametrize("length, expected", [(None, 411), ("abc", 400), ("-1", 400), ("0", 400)])
+def test_missing_or_invalid_content_length_is_rejected(app, service, length, expected):
+    _, port = service(app.FakeExifToolBackend())
+    headers = {"Host": "127.0.0.1"}
+    if length is not None:
+        headers["Content-Length"] = length
+    status, response = raw_call(port, "POST", "/jobs", headers)
+    assert status == expected
+    assert response["error"]
+
+
+def test_full_queue_returns_429(app, service, make_files):
+    gate = threading.Event()
+
+    def latency(args):
+        # 写入命令等待测试放行，保证第一个任务一直在执行
+        if "-overwrite_original" in args:
+            gate.wait(10)
+        return 0
+
+    files = make_files("a.jpg", "b.jpg")
+    svc, port = service(app.FakeExifToolBackend(latency=latency), concurrency=1, max_queue=1)
+    try:
+        status, headers, first = call(port, "POST", "/jobs", {"plan": {files[0]: {"Make": "Apple"}}})
+        assert status == 202
+        assert headers["Location"] == f"/jobs/{first['job_id']}"
+        deadline = time.monotonic() + 10
+        while call(port, "GET", "/health")[2]["running"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        status, _, second = call(port, "POST", "/jobs", {"plan": {files[1]: {"Make": "Apple"}}})
+        assert status == 202
+        status, headers, _ = call(port, "POST", "/jobs", {"plan": {files[1]: {"Make": "Apple"}}})
+        assert status == 429
+        assert headers["Retry-After"] == "5"
+        health = call(port, "GET", "/health")[2]
+        assert (health["queued"], health["queue_capacity"], health["running"]) == (1, 1, 1)
+    finally:
+        gate.set()
+    assert wait_for_job(port, first["job_id"])["status"] == "done"
+    assert wait_for_job(port, second["job_id"])["status"] == "done"
+
+
+def test_job_runs_and_reports_results(app, service, make_files):
+    files = make_files("a.jpg", "b.jpg", "c.jpg")
+    fake = app.FakeExifToolBackend()
+    _, port = service(fake)
+    status, _, job = call(port, "POST", "/jobs", {"files": files, "template": {"Make": "Apple", "Model": None},
+                                                  "seed": 7, "reference_time": "2024-05-01 12:00:00"})
+    assert status == 202
+    assert job["status"] == "queued"
+    assert job["total"] == 3
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/jobs/{job['job_id']}/events", timeout=10) as response:
+        events = [json.loads(line) for line in response.read().splitlines()]
+    assert events[-1]["status"] == "done"
+    assert events[-1]["counts"]["success"] == 3
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/jobs/{job['job_id']}/results", timeout=10) as response:
+        results = [json.loads(line) for line in response.read().splitlines()]
+    assert sorted(record["file"] for record in results) == sorted(files)
+    assert all(record["status"] == "success" and record["tags"]["Make"] == "Apple" for record in results)
+    assert all(fake.metadata[path]["EXIF:Make"] == "Apple" for path in files)
+
+
+def test_shutdown_before_serve_makes_serve_return(app, editor):
+    svc = app.JobService(editor(app.FakeExifToolBackend()))
+    svc.shutdown()
+    thread = threading.Thread(target=svc.serve, args=(free_port(),), daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    svc.shutdown()   # 重复调用没有影响
@@ -0,0 +1,62 @@
+"""ShardedJob：拆分计划、认领分片、租约过期后由其他工作进程接手"""
+import os
+
+import pytest
+
+
+def make_plan(app, files, tmp_path):
+    entries = [{"type": "file", "file": path, "size": -1, "mtime_ns": -1, "metadata": {"Make": "Apple"},
+                "changes": {"Make": "Apple"}, "args": []} for path in files]
+    return app.BatchPlan.create("自定义模式", entries).save(str(tmp_path / "plan.jsonl"))
+
+
+def test_split_writes_complete_shards(app, make_files, tmp_path):
+    files = make_files("a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg")
+    job = app.ShardedJob.split(make_plan(app, files, tmp_path), str(tmp_path / "job"), shard_size=2)
+    assert job.status() == {"pending": 3, "claimed": 0, "done": 0, "workers": []}
+    shards = sorted(os.listdir(job.pending_dir))
+    records = [list(app.BatchPlan.iter_records(os.path.join(job.pending_dir, name))) for name in shards]
+    assert [len(shard) - 1 for shard in records] == [2, 2, 1]
+    assert [entry["file"] for shard in records for entry in shard[1:]] == files
+    # 每个分片都是完整的计划文件
+    assert all(shard[0]["total"] == len(shard) - 1 for shard in records)
+
+
+def test_claim_is_exclusive(app, make_files, tmp_path):
+    files = make_files("a.jpg", "b.jpg")
+    job = app.ShardedJob.split(make_plan(app, files, tmp_path), str(tmp_path / "job"), shard_size=1)
+    first = job.claim("a")
+    second = job.claim("b")
+    assert first[0] != second[0]
+    assert job.claim("c") is None
+    assert job.status()["workers"] == ["a", "b"]
+
+
+def test_expired_lease_is_taken_over(app, make_files, tmp_path):
+    files = make_files("a.jpg", "b.jpg", "c.jpg", "d.jpg")
+    job = app.ShardedJob.split(make_plan(app, files, tmp_path), str(tmp_path / "job"), shard_size=2)
+
+    # 工作进程a认领一个分片后失去响应，租约不再续期
+    _, stale_path = job.claim("a")
+    expired = job.fs_now() - 120
+    os.utime(stale_path, (expired, expired))
+
+    fake = app.FakeExifToolBackend()
+    totals = job.work("b", lambda recorder: app.PlanApplier("fake-exiftool", backend=fake, call_timeout=5,
+                                                            recorder=recorder),
+                      lease_timeout=60, poll_interval=0.01)
+    assert totals["success"] == 4
+    assert job.status() == {"pending": 0, "claimed": 0, "done": 2, "workers": []}
+    assert sorted(os.listdir(job.results_dir)) == sorted(os.listdir(job.done_dir))
+    assert all(fake.metadata[path]["EXIF:Make"] == "Apple" for path in files)
+    # 原工作进程恢复后续期失败，知道分片已被接手
+    with pytest.raises(FileNotFoundError):
+        job.renew(stale_path)
+
+
+def test_live_lease_is_not_recovered(app, make_files, tmp_path):
+    files = make_files("a.jpg")
+    job = app.ShardedJob.split(make_plan(app, files, tmp_path), str(tmp_path / "job"), shard_size=1)
+    job.claim("a")
+    assert job.recover_expired(lease_timeout=60) == 0
+    assert job.status()["claimed"] == 1
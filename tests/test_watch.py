@@ -0,0 +1,96 @@
+"""监视文件夹：已处理文件索引、等待文件写入完成、重启后不重复处理"""
+import os
+import threading
+import time
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_watch_index_survives_restart_and_torn_line(app, make_files, tmp_path):
+    path, = make_files("a.jpg")
+    index_path = str(tmp_path / "watch_index.jsonl")
+    index = app.WatchIndex(index_path).open()
+    index.write(path, "success")
+    index.close()
+    with open(index_path, "a", encoding="utf-8") as f:
+        f.write('{"file": "/photos/b.jpg", "si')
+
+    index = app.WatchIndex(index_path).open()
+    try:
+        stat = os.stat(path)
+        assert index.is_processed(path, stat.st_size, stat.st_mtime_ns)
+        assert not index.is_processed(path, stat.st_size + 1, stat.st_mtime_ns)
+        assert not index.is_processed("/photos/b.jpg", 0, 0)
+    finally:
+        index.close()
+
+
+def test_file_is_ready_only_after_it_stops_changing(app, editor, make_files, tmp_path):
+    image, empty = make_files("a.jpg", "empty.jpg")
+    open(empty, "wb").close()
+    index = app.WatchIndex(str(tmp_path / "watch_index.jsonl")).open()
+    watcher = app.FolderWatcher(editor(app.FakeExifToolBackend()), [str(tmp_path)], index=index,
+                                stable_seconds=0.3, use_inotify=False)
+    try:
+        watcher._observe(image)
+        watcher._observe(empty)
+        watcher._check_stable()
+        assert watcher._ready == []
+
+        # 文件仍在写入，重新开始计时
+        time.sleep(0.2)
+        with open(image, "ab") as f:
+            f.write(b"more data")
+        watcher._check_stable()
+        time.sleep(0.2)
+        watcher._check_stable()
+        assert watcher._ready == []
+        assert index.counts["skipped"] == 1
+
+        time.sleep(0.2)
+        watcher._check_stable()
+        assert watcher._ready == [image]
+    finally:
+        index.close()
+
+
+def test_watcher_processes_new_files_once(app, editor, make_files, tmp_path):
+    watched = tmp_path / "incoming"
+    watched.mkdir()
+    index_path = str(tmp_path / "watch_index.jsonl")
+    fake = app.FakeExifToolBackend()
+
+    def start_watcher():
+        watcher = app.FolderWatcher(editor(fake), [str(watched)], template={"Make": "Apple", "Model": None},
+                                    index=app.WatchIndex(index_path), workers=1, batch_size=2, batch_wait=0.05,
+                                    stable_seconds=0.1, poll_interval=0.1, use_inotify=False)
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(watcher.run()), daemon=True)
+        thread.start()
+        return watcher, thread, result
+
+    watcher, thread, _ = start_watcher()
+    files = make_files("incoming/a.jpg", "incoming/b.jpg", "incoming/sub/c.jpg")
+    assert wait_until(lambda: watcher.index.counts["success"] == 3)
+    watcher.stop()
+    thread.join(10)
+    assert all(fake.metadata[path]["EXIF:Make"] == "Apple" for path in files)
+    assert all(fake.metadata[path].get("EXIF:Model") for path in files)
+
+    # 重启后已处理的文件不再处理，只处理新加入的文件
+    fake.commands.clear()
+    watcher, thread, result = start_watcher()
+    new_file, = make_files("incoming/d.jpg")
+    assert wait_until(lambda: watcher.index.counts["success"] == 1)
+    watcher.stop()
+    thread.join(10)
+    assert result == {"success": 1, "skipped": 0, "failed": 0, "quarantined": 0}
+    writes = [args for args in fake.commands if "-overwrite_original" in args]
+    assert [path for path in files + [new_file] if any(path in args for args in writes)] == [new_file]